@@ -0,0 +1,279 @@
+"""Benchmark the data pipeline on synthetic tracking data at several scales.
+
+Every benchmarked function is timed on the same inputs, best of several runs, and its peak memory is measured on
+an additional run with tracemalloc. Import times of the package modules are measured in fresh interpreters and
+checked against their budgets. Results can be stored as a JSON baseline and compared with later runs:
+
+    python benchmarks/run_benchmarks.py --scales small medium --output benchmarks/baselines/baseline.json
+    python benchmarks/run_benchmarks.py --scales small medium --compare benchmarks/baselines/baseline.json
+"""
+
+import argparse
+import json
+import platform
+import subprocess
+import sys
+import time
+import tracemalloc
+from pathlib import Path
+from typing import Callable, Optional
+
+import numpy as np
+import pandas as pd
+
+from expected_tackling.data.features import compute_features_data, create_target
+from expected_tackling.data.mott_features import compute_mott_features_data
+from expected_tackling.data.process_data import (
+    compute_visualization_data,
+    get_valid_plays_from_events,
+    normalize_play_direction,
+)
+from expected_tackling.data.schema import get_memory_report
+from expected_tackling.data.synthetic import generate_synthetic_data
+
+# seconds taken by the import of a module in a fresh interpreter, after numpy and pandas, as in workers and CLIs
+IMPORT_TIME_BUDGETS = {
+    "expected_tackling.data.features": 0.05,
+    "expected_tackling.data.mott_features": 0.05,
+    "expected_tackling.data.pipeline": 0.1,
+    "expected_tackling.visualization": 0.01,
+}
+SCALES = {
+    "small": {"nb_games": 2, "nb_plays": 8, "nb_frames": 50},
+    "medium": {"nb_games": 8, "nb_plays": 16, "nb_frames": 60},
+    "large": {"nb_games": 32, "nb_plays": 32, "nb_frames": 60},
+}
+
+
+def _measure(function: Callable, repeat: int) -> dict:
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start)
+
+    tracemalloc.start()
+    function()
+    _, peak_memory = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {"time_s": min(times), "peak_memory_bytes": peak_memory}
+
+
+def _create_tackling_probability(features_data: pd.DataFrame) -> pd.DataFrame:
+    # probabilities increasing close to the ball carrier, in place of the predictions of the tackling model
+    tackling_probability = features_data[["gameId", "playId", "nflId", "frameId"]].copy()
+    tackling_probability["tackling_probability"] = 1 / (1 + np.exp(features_data["distance_to_ball_carrier"] - 3))
+    return tackling_probability
+
+
+def _benchmark_animation(
+    visualization_tracking_data: pd.DataFrame, tackling_probability: pd.DataFrame, repeat: int
+) -> dict:
+    try:
+        from expected_tackling.visualization.field import Field
+    except ImportError as error:
+        return {"skipped": str(error)}
+
+    game_id, play_id = visualization_tracking_data[["gameId", "playId"]].iloc[0]
+    play_tracking = visualization_tracking_data[
+        (visualization_tracking_data["gameId"] == game_id) & (visualization_tracking_data["playId"] == play_id)
+    ].merge(tackling_probability, how="left", on=["gameId", "playId", "nflId", "frameId"])
+
+    return _measure(lambda: Field().create_tackling_probability_animation(play_tracking), repeat)
+
+
+def run_benchmarks(scale: str, repeat: int = 3, seed: int = 0) -> dict:
+    """Run the benchmarks of the pipeline functions on synthetic data of a scale.
+
+    Parameters
+    ----------
+    scale : str
+        Name of the scale, in SCALES.
+    repeat : int, optional
+        Number of timed runs of every function, by default 3.
+    seed : int, optional
+        Seed of the synthetic data generator, by default 0.
+
+    Returns
+    -------
+    dict
+        Dictionary with the parameters of the scale, for every benchmarked function its best time in seconds and
+        its peak memory in bytes, and the memory in bytes of the table output by every stage.
+    """
+    tracking, plays, players, tackles = generate_synthetic_data(**SCALES[scale], seed=seed)
+    tracking, plays = normalize_play_direction(tracking, plays)
+
+    results = {}
+    results["get_valid_plays_from_events"] = _measure(lambda: get_valid_plays_from_events(tracking), repeat)
+    plays_frames_valid, events_index = get_valid_plays_from_events(tracking)
+
+    results["compute_visualization_data"] = _measure(
+        lambda: compute_visualization_data(plays_frames_valid, events_index, plays, players, tracking), repeat
+    )
+    visualization_tracking_data = compute_visualization_data(plays_frames_valid, events_index, plays, players, tracking)
+
+    results["create_target"] = _measure(lambda: create_target(visualization_tracking_data, tackles), repeat)
+    targeted_data = create_target(visualization_tracking_data, tackles)
+
+    results["compute_features_data"] = _measure(lambda: compute_features_data(targeted_data, tracking), repeat)
+    features_data = compute_features_data(targeted_data, tracking)
+
+    tackling_probability = _create_tackling_probability(features_data)
+    results["compute_mott_features_data"] = _measure(
+        lambda: compute_mott_features_data(features_data, tackling_probability, tackles.copy()), repeat
+    )
+    mott_features_data = compute_mott_features_data(features_data, tackling_probability, tackles.copy())
+
+    results["Field.create_tackling_probability_animation"] = _benchmark_animation(
+        visualization_tracking_data, tackling_probability, repeat
+    )
+
+    memory_report = get_memory_report(
+        {
+            "tracking": tracking,
+            "visualization_tracking_data": visualization_tracking_data,
+            "targeted_data": targeted_data,
+            "features_data": features_data,
+            "mott_features_data": mott_features_data,
+        }
+    )
+    tables_memory = memory_report.xs("total", level="column")["bytes"].astype(int).to_dict()
+
+    return {
+        "parameters": {**SCALES[scale], "nb_tracking_rows": len(tracking)},
+        "results": results,
+        "tables_memory_bytes": tables_memory,
+    }
+
+
+def _measure_import_time(module: str, repeat: int) -> float:
+    code = (
+        f"import time, numpy, pandas; start = time.perf_counter(); import {module}; print(time.perf_counter() - start)"
+    )
+    times = []
+    for _ in range(repeat):
+        process = subprocess.run([sys.executable, "-c", code], check=True, capture_output=True, text=True)
+        times.append(float(process.stdout))
+    return min(times)
+
+
+def measure_import_times(repeat: int = 3) -> dict:
+    """Measure the import times of the package modules with a budget, best of several fresh interpreters.
+
+    Parameters
+    ----------
+    repeat : int, optional
+        Number of interpreters importing every module, by default 3.
+
+    Returns
+    -------
+    dict
+        Dictionary with the import time, the budget and whether it is exceeded, by module.
+    """
+    import_times = {}
+    for module, budget in IMPORT_TIME_BUDGETS.items():
+        import_time = _measure_import_time(module, repeat)
+        import_times[module] = {"time_s": import_time, "budget_s": budget, "is_over_budget": import_time > budget}
+    return import_times
+
+
+def compare_benchmarks(benchmarks: dict, baseline: dict) -> pd.DataFrame:
+    """Compare benchmarks results with a baseline.
+
+    Parameters
+    ----------
+    benchmarks : dict
+        Benchmarks results, as saved by main.
+    baseline : dict
+        Baseline benchmarks results.
+
+    Returns
+    -------
+    pd.DataFrame
+        DataFrame with the times and peak memories of the benchmarks and the baseline and their ratios, for every
+        scale and function found in both.
+    """
+    comparison = []
+    for scale, scale_benchmarks in benchmarks["scales"].items():
+        baseline_results = baseline["scales"].get(scale, {}).get("results", {})
+        for function, result in scale_benchmarks["results"].items():
+            baseline_result = baseline_results.get(function, {})
+            if "time_s" not in result or "time_s" not in baseline_result:
+                continue
+            comparison.append(
+                {
+                    "scale": scale,
+                    "function": function,
+                    "time_s": result["time_s"],
+                    "baseline_time_s": baseline_result["time_s"],
+                    "time_ratio": result["time_s"] / baseline_result["time_s"],
+                    "peak_memory_bytes": result["peak_memory_bytes"],
+                    "baseline_peak_memory_bytes": baseline_result["peak_memory_bytes"],
+                    "peak_memory_ratio": result["peak_memory_bytes"] / max(baseline_result["peak_memory_bytes"], 1),
+                }
+            )
+    return pd.DataFrame(comparison)
+
+
+def main(scales: list, repeat: int, output: Optional[str], compare: Optional[str]) -> dict:
+    """Run the benchmarks at several scales, then save them and compare them with a baseline.
+
+    Parameters
+    ----------
+    scales : list
+        Names of the scales, in SCALES.
+    repeat : int
+        Number of timed runs of every function.
+    output : Optional[str]
+        Path of the JSON file in which the results are saved, None not to save them.
+    compare : Optional[str]
+        Path of the JSON file of the baseline to compare the results with, None not to compare them.
+
+    Returns
+    -------
+    dict
+        Dictionary with the environment, the import times and the results of every scale.
+    """
+    benchmarks = {
+        "environment": {
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "pandas": pd.__version__,
+            "machine": platform.machine(),
+            "processor": platform.processor(),
+        },
+        "repeat": repeat,
+        "import_times": measure_import_times(repeat),
+        "scales": {},
+    }
+    for module, import_time in benchmarks["import_times"].items():
+        print(f"{'import':>8} {module:<45} {json.dumps(import_time)}")
+    for scale in scales:
+        benchmarks["scales"][scale] = run_benchmarks(scale, repeat)
+        for function, result in benchmarks["scales"][scale]["results"].items():
+            print(f"{scale:>8} {function:<45} {json.dumps(result)}")
+        for stage, nb_bytes in benchmarks["scales"][scale]["tables_memory_bytes"].items():
+            print(f"{scale:>8} {stage:<45} {nb_bytes} bytes")
+
+    if output is not None:
+        Path(output).parent.mkdir(parents=True, exist_ok=True)
+        with open(output, "w") as file:
+            json.dump(benchmarks, file, indent=2)
+
+    if compare is not None:
+        with open(compare) as file:
+            baseline = json.load(file)
+        print(compare_benchmarks(benchmarks, baseline).to_string(index=False, float_format="{:.3f}".format))
+
+    return benchmarks
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scales", nargs="+", choices=list(SCALES), default=["small", "medium"])
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--output", help="path of the JSON file in which the results are saved")
+    parser.add_argument("--compare", help="path of the JSON baseline to compare the results with")
+    args = parser.parse_args()
+    main(args.scales, args.repeat, args.output, args.compare)
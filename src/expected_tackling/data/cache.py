@@ -0,0 +1,260 @@
+import concurrent.futures
+from pathlib import Path
+from typing import Iterable, Optional
+
+import numpy as np
+import pandas as pd
+
+from expected_tackling.data.memory_mapping import read_memory_mapped_dataframe, write_memory_mapped_dataframe
+from expected_tackling.data.schema import POSITIONS_DTYPES
+
+CATEGORICAL_MAX_UNIQUE_RATIO = 0.5
+
+
+def optimize_dtypes(data: pd.DataFrame, downcast_floats: bool = True) -> pd.DataFrame:
+    """Convert string columns to categoricals and downcast numeric columns.
+
+    Parameters
+    ----------
+    data : pd.DataFrame
+        DataFrame to convert.
+    downcast_floats : bool, optional
+        Flag to convert float64 columns to float32, except the x and y positions, by default True.
+
+    Returns
+    -------
+    pd.DataFrame
+        DataFrame with optimized dtypes.
+    """
+    data = data.copy()
+    for column, values in data.items():
+        if values.dtype == object:
+            if values.nunique() <= CATEGORICAL_MAX_UNIQUE_RATIO * len(values):
+                data[column] = values.astype("category")
+        elif pd.api.types.is_integer_dtype(values.dtype):
+            data[column] = pd.to_numeric(values, downcast="integer")
+        elif pd.api.types.is_float_dtype(values.dtype) and downcast_floats and column not in POSITIONS_DTYPES:
+            # positions keep float64, float32 rounding would break the ties of distances between players
+            data[column] = values.astype(np.float32)
+    return data
+
+
+def write_cache_partition(data: pd.DataFrame, partition_path: str | Path) -> None:
+    """Write a DataFrame as a partition of a columnar cache, readable with read_cache.
+
+    Parameters
+    ----------
+    data : pd.DataFrame
+        DataFrame to write, its index is not kept.
+    partition_path : str | Path
+        Directory in which the partition is written.
+    """
+    partition_path = Path(partition_path)
+    if {"gameId", "playId"}.issubset(data.columns):
+        data = data.sort_values(["gameId", "playId"], kind="stable", ignore_index=True)
+        plays_rows = data.groupby(["gameId", "playId"], sort=False).size().rename("row_end").to_frame()
+        plays_rows["row_end"] = plays_rows["row_end"].cumsum()
+        plays_rows["row_start"] = plays_rows["row_end"].shift(fill_value=0)
+    else:
+        plays_rows = pd.DataFrame(columns=["row_end", "row_start"])
+
+    write_memory_mapped_dataframe(data, partition_path)
+    plays_rows[["row_start", "row_end"]].to_pickle(partition_path / "plays_rows.pkl")
+
+
+def _write_csv_partition(csv_path: str, partition_path: Path, downcast_floats: bool) -> str:
+    write_cache_partition(optimize_dtypes(pd.read_csv(csv_path), downcast_floats), partition_path)
+    return str(partition_path)
+
+
+def build_cache(
+    csv_paths: list, cache_path: str, downcast_floats: bool = True, nb_workers: Optional[int] = None
+) -> list:
+    """Convert CSV files to a columnar cache with one partition per file, converting them concurrently.
+
+    Each partition is named after its file, as "tracking_week_1", stores one memory-mappable file per column with
+    optimized dtypes and, when the file has gameId and playId columns, is sorted by play with an index of the rows
+    of every play.
+
+    Parameters
+    ----------
+    csv_paths : list
+        Paths of the CSV files, as "tracking_week_{i}.csv", "plays.csv" or "features_week_{i}.csv".
+    cache_path : str
+        Directory in which the partitions are written.
+    downcast_floats : bool, optional
+        Flag to convert float64 columns to float32, except the x and y positions, by default True.
+    nb_workers : Optional[int], optional
+        Number of files converted concurrently, by default None for the number of processors.
+
+    Returns
+    -------
+    list
+        Paths of the partitions, in the order of the CSV files.
+    """
+    with concurrent.futures.ProcessPoolExecutor(nb_workers) as executor:
+        futures = [
+            executor.submit(_write_csv_partition, csv_path, Path(cache_path) / Path(csv_path).stem, downcast_floats)
+            for csv_path in csv_paths
+        ]
+        return [future.result() for future in futures]
+
+
+def is_cache_partition(path: str) -> bool:
+    """Check whether a path is a partition of a columnar cache built by build_cache.
+
+    Parameters
+    ----------
+    path : str
+        Path to check.
+
+    Returns
+    -------
+    bool
+        True if the path is a cache partition.
+    """
+    return (Path(path) / "plays_rows.pkl").exists()
+
+
+def _select_rows(plays_rows: pd.DataFrame, games: Optional[Iterable], plays: Optional[Iterable]) -> np.ndarray:
+    if len(plays_rows) == 0:
+        return np.array([], dtype=np.int64)
+
+    is_selected = np.ones(len(plays_rows), dtype=bool)
+    if games is not None:
+        is_selected &= plays_rows.index.get_level_values("gameId").isin(list(games))
+    if plays is not None:
+        is_selected &= plays_rows.index.isin(list(plays))
+
+    selected_rows = plays_rows[is_selected]
+    nb_rows = (selected_rows["row_end"] - selected_rows["row_start"]).to_numpy()
+    rows_offsets = np.arange(nb_rows.sum()) - np.repeat(np.cumsum(nb_rows) - nb_rows, nb_rows)
+    return np.repeat(selected_rows["row_start"].to_numpy(), nb_rows) + rows_offsets
+
+
+def _concat_partitions(partitions: list) -> pd.DataFrame:
+    # categories differ between partitions and would be lost by concat
+    for column, values in partitions[0].items():
+        if isinstance(values.dtype, pd.CategoricalDtype):
+            categories = pd.Index([])
+            for partition in partitions:
+                categories = categories.union(partition[column].cat.categories, sort=False)
+            for partition in partitions:
+                partition[column] = partition[column].cat.set_categories(categories)
+
+    return pd.concat(partitions, ignore_index=True)
+
+
+def read_cache(
+    partition_paths: str | list,
+    columns: Optional[list] = None,
+    games: Optional[Iterable] = None,
+    plays: Optional[Iterable] = None,
+) -> pd.DataFrame:
+    """Read partitions of a columnar cache built by build_cache.
+
+    Only the requested columns are read, and only the rows of the requested games and plays, partitions without
+    any of them being skipped.
+
+    Parameters
+    ----------
+    partition_paths : str | list
+        Path of a partition or list of paths of partitions.
+    columns : Optional[list], optional
+        Columns to read, by default None for all columns.
+    games : Optional[Iterable], optional
+        gameId of the games to read, by default None for all games.
+    plays : Optional[Iterable], optional
+        (gameId, playId) of the plays to read, by default None for all plays.
+
+    Returns
+    -------
+    pd.DataFrame
+        DataFrame with the data of the partitions.
+    """
+    if isinstance(partition_paths, str):
+        partition_paths = [partition_paths]
+
+    partitions = []
+    for partition_path in partition_paths:
+        rows = None
+        if games is not None or plays is not None:
+            rows = _select_rows(pd.read_pickle(Path(partition_path) / "plays_rows.pkl"), games, plays)
+            if len(rows) == 0:
+                continue
+        partitions.append(read_memory_mapped_dataframe(partition_path, columns, rows))
+
+    if len(partitions) == 0:
+        partitions.append(read_memory_mapped_dataframe(partition_paths[0], columns, np.array([], dtype=np.int64)))
+
+    return _concat_partitions(partitions)
+
+
+def read_table(
+    path: str,
+    columns: Optional[list] = None,
+    games: Optional[Iterable] = None,
+    plays: Optional[Iterable] = None,
+) -> pd.DataFrame:
+    """Read a table from a partition of a columnar cache built by build_cache, or else from a CSV file.
+
+    Parameters
+    ----------
+    path : str
+        Path of a cache partition, as "cache/tracking_week_1", or of a CSV file, as "tracking_week_1.csv".
+    columns : Optional[list], optional
+        Columns to read, by default None for all columns.
+    games : Optional[Iterable], optional
+        gameId of the games to read, by default None for all games.
+    plays : Optional[Iterable], optional
+        (gameId, playId) of the plays to read, by default None for all plays.
+
+    Returns
+    -------
+    pd.DataFrame
+        DataFrame with the rows of the requested games and plays.
+    """
+    if is_cache_partition(path):
+        return read_cache(path, columns, games, plays)
+
+    data = pd.read_csv(path, usecols=columns)
+    is_selected = np.ones(len(data), dtype=bool)
+    if games is not None:
+        is_selected &= data["gameId"].isin(list(games)).to_numpy()
+    if plays is not None:
+        is_selected &= pd.MultiIndex.from_frame(data[["gameId", "playId"]]).isin(list(plays))
+    return data if is_selected.all() else data[is_selected].reset_index(drop=True)
+
+
+def read_tables(
+    paths: list,
+    columns: Optional[list] = None,
+    games: Optional[Iterable] = None,
+    plays: Optional[Iterable] = None,
+    nb_workers: Optional[int] = None,
+) -> pd.DataFrame:
+    """Read shards of a table concurrently with read_table and concatenate them, as the weekly tracking files.
+
+    Parameters
+    ----------
+    paths : list
+        Paths of the cache partitions or CSV files of the shards.
+    columns : Optional[list], optional
+        Columns to read, by default None for all columns.
+    games : Optional[Iterable], optional
+        gameId of the games to read, by default None for all games.
+    plays : Optional[Iterable], optional
+        (gameId, playId) of the plays to read, by default None for all plays.
+    nb_workers : Optional[int], optional
+        Number of shards read concurrently, by default None for the default of ThreadPoolExecutor.
+
+    Returns
+    -------
+    pd.DataFrame
+        DataFrame with the rows of the shards, in the order of the paths.
+    """
+    games = list(games) if games is not None else None
+    plays = list(plays) if plays is not None else None
+    with concurrent.futures.ThreadPoolExecutor(nb_workers) as executor:
+        shards = list(executor.map(lambda path: read_table(path, columns, games, plays), paths))
+    return _concat_partitions(shards)
@@ -0,0 +1,113 @@
+import numpy as np
+import pandas as pd
+
+
+class EventsIndex:
+    """Class holding the events sequences of plays as integer codes of an events vocabulary."""
+
+    def __init__(self, plays_frames: pd.DataFrame) -> None:
+        """Initialize the EventsIndex object.
+
+        The events sequence of a play is made of its unique events in order of appearance. Sequences of all plays
+        are stored one after the other in a single array of codes, the sequence of the i-th play being
+        codes[offsets[i]:offsets[i + 1]], and identical sequences share the same sequence identifier.
+
+        Parameters
+        ----------
+        plays_frames : pd.DataFrame
+            DataFrame with one row per frame of every play and its event. Plays without any event are not indexed.
+        """
+        plays_frames = plays_frames.dropna(subset=["event"])
+        plays_keys = pd.MultiIndex.from_frame(plays_frames[["gameId", "playId"]])
+        if len(plays_keys) == 0:
+            # pd.factorize cannot infer the levels of an empty MultiIndex
+            play_codes, self.plays = np.empty(0, dtype=np.intp), plays_keys
+        else:
+            play_codes, self.plays = pd.factorize(plays_keys, sort=True)
+        event_codes, vocabulary = pd.factorize(plays_frames["event"].to_numpy(dtype=object))
+        self.vocabulary = pd.Index(vocabulary, dtype=object)
+
+        sequences = pd.DataFrame({"play_code": play_codes, "event_code": event_codes}).drop_duplicates()
+        sequences = sequences.sort_values("play_code", kind="stable")
+        plays_nb_events = np.bincount(sequences["play_code"], minlength=len(self.plays))
+        self.offsets = np.concatenate([[0], np.cumsum(plays_nb_events)])
+        self.codes = sequences["event_code"].to_numpy(dtype=np.int32)
+
+        padded_sequences = np.full((len(self.plays), plays_nb_events.max(initial=0)), -1, dtype=np.int32)
+        positions = np.arange(len(self.codes)) - np.repeat(self.offsets[:-1], plays_nb_events)
+        padded_sequences[sequences["play_code"].to_numpy(), positions] = self.codes
+        self.sequence_ids = np.unique(padded_sequences, axis=0, return_inverse=True)[1].reshape(-1)
+
+    def __len__(self) -> int:
+        """Return the number of plays in the index."""
+        return len(self.plays)
+
+    def encode(self, events: pd.Series | np.ndarray) -> np.ndarray:
+        """Get the codes of events.
+
+        Parameters
+        ----------
+        events : pd.Series | np.ndarray
+            Events to encode.
+
+        Returns
+        -------
+        np.ndarray
+            Array of codes, -1 for missing events and events out of the vocabulary.
+        """
+        return self.vocabulary.get_indexer(pd.Index(events, dtype=object))
+
+    def contains(self, events: list) -> np.ndarray:
+        """Check whether the events sequence of every play contains any of the events.
+
+        Parameters
+        ----------
+        events : list
+            Events to look for.
+
+        Returns
+        -------
+        np.ndarray
+            Boolean array with one value per play.
+        """
+        if len(self.codes) == 0:
+            return np.zeros(len(self.plays), dtype=bool)
+        is_event = np.isin(self.codes, self.encode(np.asarray(events, dtype=object)))
+        return np.logical_or.reduceat(is_event, self.offsets[:-1])
+
+    def get_sequences_counts(self) -> np.ndarray:
+        """Get the number of plays having the same events sequence as every play.
+
+        Returns
+        -------
+        np.ndarray
+            Array with one count per play.
+        """
+        return np.bincount(self.sequence_ids)[self.sequence_ids]
+
+    def get_play_positions(self, plays_keys: pd.DataFrame) -> np.ndarray:
+        """Get the positions in the index of plays.
+
+        Parameters
+        ----------
+        plays_keys : pd.DataFrame
+            DataFrame with gameId and playId columns.
+
+        Returns
+        -------
+        np.ndarray
+            Array of positions, -1 for plays that are not indexed.
+        """
+        return self.plays.get_indexer(pd.MultiIndex.from_frame(plays_keys[["gameId", "playId"]]))
+
+    def to_series(self) -> pd.Series:
+        """Convert the index to the events sequences of plays.
+
+        Returns
+        -------
+        pd.Series
+            Series indexed by gameId and playId with the array of unique events of every play.
+        """
+        events = self.vocabulary.to_numpy()[self.codes]
+        sequences = [events[start:end] for start, end in zip(self.offsets[:-1], self.offsets[1:])]
+        return pd.Series(sequences, index=self.plays, name="event", dtype=object)
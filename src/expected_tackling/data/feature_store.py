@@ -0,0 +1,159 @@
+import shutil
+from pathlib import Path
+from typing import Iterable, Optional
+
+import numpy as np
+import pandas as pd
+
+from expected_tackling.data.cache import read_cache, write_cache_partition
+from expected_tackling.data.features import (
+    FEATURES_VERSION,
+    compute_features_data,
+    compute_features_data_with_multiprocessing,
+)
+
+
+def compute_games_fingerprints(data: pd.DataFrame) -> pd.Series:
+    """Compute a content fingerprint of the rows of every game, independent of the rows order.
+
+    Parameters
+    ----------
+    data : pd.DataFrame
+        DataFrame with a gameId column.
+
+    Returns
+    -------
+    pd.Series
+        Series of uint64 fingerprints indexed by gameId.
+    """
+    rows_hashes = pd.util.hash_pandas_object(data[sorted(data.columns)], index=False)
+    # the sum of the rows hashes wraps around on overflow
+    return rows_hashes.groupby(data["gameId"].to_numpy()).sum().rename_axis("gameId").rename("fingerprint")
+
+
+class FeatureStore:
+    """Class for storing features data by game and recomputing only the games with new or changed inputs."""
+
+    def __init__(self, path: str) -> None:
+        """Initialize the FeatureStore object.
+
+        Parameters
+        ----------
+        path : str
+            Directory of the store, created if it does not exist.
+        """
+        self.path = Path(path)
+        self.path.mkdir(parents=True, exist_ok=True)
+        self.manifest_path = self.path / "manifest.csv"
+        if self.manifest_path.exists():
+            self.manifest = pd.read_csv(self.manifest_path, index_col="gameId", dtype={"fingerprint": np.uint64})
+        else:
+            self.manifest = pd.DataFrame(
+                {"fingerprint": pd.Series(dtype=np.uint64), "version": pd.Series(dtype=np.int64)},
+                index=pd.Index([], name="gameId", dtype=np.int64),
+            )
+
+    def _game_path(self, game_id: int) -> Path:
+        return self.path / "games" / str(game_id)
+
+    def get_outdated_games(self, targeted_data: pd.DataFrame, tracking: pd.DataFrame) -> pd.Series:
+        """Get the fingerprints of the games missing from the store or whose inputs or features version changed.
+
+        Parameters
+        ----------
+        targeted_data : pd.DataFrame
+            DataFrame containing visualization tracking data and ball carrier information.
+        tracking : pd.DataFrame
+            DataFrame containing complete tracking data.
+
+        Returns
+        -------
+        pd.Series
+            Series of the fingerprints of the outdated games indexed by gameId.
+        """
+        targeted_data_fingerprints = compute_games_fingerprints(targeted_data)
+        tracking_fingerprints = compute_games_fingerprints(tracking)
+        games = targeted_data_fingerprints.index.union(tracking_fingerprints.index)
+        fingerprints = targeted_data_fingerprints.reindex(games, fill_value=0) ^ tracking_fingerprints.reindex(
+            games, fill_value=0
+        )
+
+        # missing games get the version 0 that is never the current one
+        stored = self.manifest.reindex(games, fill_value=0)
+        is_outdated = (stored["version"].to_numpy() != FEATURES_VERSION) | (
+            stored["fingerprint"].to_numpy() != fingerprints.to_numpy()
+        )
+        return fingerprints[is_outdated]
+
+    def update(self, targeted_data: pd.DataFrame, tracking: pd.DataFrame, nb_process: Optional[int] = None) -> list:
+        """Compute and store the features of the games missing from the store or whose inputs changed.
+
+        Parameters
+        ----------
+        targeted_data : pd.DataFrame
+            DataFrame containing visualization tracking data and ball carrier information.
+        tracking : pd.DataFrame
+            DataFrame containing complete tracking data.
+        nb_process : Optional[int], optional
+            Number of processes to compute features with compute_features_data_with_multiprocessing, by default
+            None to compute them in the current process.
+
+        Returns
+        -------
+        list
+            gameId of the games whose features were computed.
+        """
+        outdated_games = self.get_outdated_games(targeted_data, tracking)
+        if len(outdated_games) == 0:
+            return []
+
+        games = outdated_games.index
+        outdated_targeted_data = targeted_data[targeted_data["gameId"].isin(games)]
+        outdated_tracking = tracking[tracking["gameId"].isin(games)]
+        if nb_process is None:
+            features_data = compute_features_data(outdated_targeted_data, outdated_tracking)
+        else:
+            features_data = compute_features_data_with_multiprocessing(
+                outdated_targeted_data, outdated_tracking, nb_process
+            )
+
+        games_features_data = dict(list(features_data.groupby("gameId", sort=False)))
+        for game_id in games:
+            game_path = self._game_path(game_id)
+            if game_path.exists():
+                shutil.rmtree(game_path)
+            write_cache_partition(games_features_data.get(game_id, features_data.iloc[:0]), game_path)
+
+        self.manifest = pd.concat(
+            [
+                self.manifest.drop(index=games, errors="ignore"),
+                pd.DataFrame({"fingerprint": outdated_games, "version": FEATURES_VERSION}),
+            ]
+        ).sort_index()
+        self.manifest.to_csv(self.manifest_path)
+
+        return games.to_list()
+
+    def read(
+        self, columns: Optional[list] = None, games: Optional[Iterable] = None, plays: Optional[Iterable] = None
+    ) -> pd.DataFrame:
+        """Read stored features data.
+
+        Parameters
+        ----------
+        columns : Optional[list], optional
+            Columns to read, by default None for all columns.
+        games : Optional[Iterable], optional
+            gameId of the games to read, by default None for all stored games.
+        plays : Optional[Iterable], optional
+            (gameId, playId) of the plays to read, by default None for all plays.
+
+        Returns
+        -------
+        pd.DataFrame
+            DataFrame with computed features for defensive players.
+        """
+        stored_games = self.manifest.index if games is None else self.manifest.index.intersection(list(games))
+        if len(stored_games) == 0:
+            return pd.DataFrame(columns=columns)
+        return read_cache([str(self._game_path(game_id)) for game_id in stored_games], columns, plays=plays)
@@ -1,10 +1,75 @@
 import concurrent.futures
+import tempfile
 from multiprocessing import Manager
 from multiprocessing.managers import ListProxy  # type: ignore
+from pathlib import Path
+from typing import Iterable, Optional
 
 import numpy as np
 import pandas as pd
 
+from expected_tackling.data.cache import read_table, read_tables
+from expected_tackling.data.joins import PLAYER_FRAME_KEYS, KeyedTable
+from expected_tackling.data.kernels import (
+    compute_angle_between_players,
+    compute_distance_between_players,
+    compute_distance_to_endzone,
+    compute_distance_to_nearest_sideline,
+)
+from expected_tackling.data.memory_mapping import read_memory_mapped_dataframe, write_memory_mapped_dataframe
+from expected_tackling.data.play_store import PlayStore
+from expected_tackling.data.schema import enforce_schema
+
+# to be incremented when compute_features_data outputs change, so that stored features are recomputed
+FEATURES_VERSION = 3
+BLOCKERS_COLUMNS = ["s", "a", "dis", "o", "dir"]
+
+
+def load_tackles(tackles_path: str, games: Optional[Iterable] = None) -> pd.DataFrame:
+    """Load tackles from a partition of a columnar cache built by build_cache, or from a CSV file.
+
+    Parameters
+    ----------
+    tackles_path : str
+        Path of the tackles partition of a cache or of "tackles.csv".
+    games : Optional[Iterable], optional
+        gameId of the games whose tackles are loaded, by default None for all games.
+
+    Returns
+    -------
+    pd.DataFrame
+        DataFrame containing information about tackles and assists.
+    """
+    return enforce_schema(read_table(tackles_path, games=games), "tackles")
+
+
+def load_features_data(
+    features_paths: list,
+    columns: Optional[list] = None,
+    games: Optional[Iterable] = None,
+    nb_workers: Optional[int] = None,
+) -> pd.DataFrame:
+    """Load features data shards concurrently from a columnar cache built by build_cache, or from CSV files.
+
+    Parameters
+    ----------
+    features_paths : list
+        Paths of the features data shards, as partitions "features_week_{i}" of a cache or
+        "features_week_{i}.csv".
+    columns : Optional[list], optional
+        Columns to load, by default None for all columns.
+    games : Optional[Iterable], optional
+        gameId of the games to load, by default None for all games.
+    nb_workers : Optional[int], optional
+        Number of shards read concurrently, by default None for the default of ThreadPoolExecutor.
+
+    Returns
+    -------
+    pd.DataFrame
+        DataFrame with computed features for defensive players.
+    """
+    return enforce_schema(read_tables(features_paths, columns, games, nb_workers=nb_workers), "features_data")
+
 
 def create_target(visualization_tracking_data: pd.DataFrame, tackles: pd.DataFrame) -> pd.DataFrame:
     """Create a target variable indicating whether a player will tackle or assist in a given play.
@@ -24,176 +89,159 @@ def create_target(visualization_tracking_data: pd.DataFrame, tackles: pd.DataFra
     tackles = tackles.copy()
     tackles["tackle_or_assist"] = tackles[["tackle", "assist"]].max(axis=1)
     tackles = tackles[(tackles["tackle_or_assist"] == 1)][["gameId", "playId", "nflId", "tackle_or_assist"]]
-    targeted_data = visualization_tracking_data.merge(tackles, how="left", on=["gameId", "playId", "nflId"])
+    targeted_data = KeyedTable(tackles, ["gameId", "playId", "nflId"]).join(
+        visualization_tracking_data, columns=["tackle_or_assist"], how="left"
+    )
 
     targeted_data["will_tackle"] = np.nan
     targeted_data.loc[~targeted_data["ball_carrier_id"].isna(), "will_tackle"] = 0
-    targeted_data.loc[
-        (targeted_data["ballCarrierId"] == targeted_data["ball_carrier_id"]) & (targeted_data["tackle_or_assist"] == 1),
-        "will_tackle",
-    ] = 1
-    return targeted_data
-
-
-def _compute_distance_between_players(x1: float, y1: float, x2: float, y2: float) -> float:
-    return np.sqrt((x2 - x1) ** 2 + (y2 - y1) ** 2)
-
-
-def _compute_angle_between_players(x1: float, y1: float, x2: float, y2: float) -> float:
-    angle = np.arctan2(x2 - x1, y2 - y1)
-    return (np.degrees(angle) + 360) % 360
-
-
-def _compute_distance_to_nearest_sideline(y: float, field_width: float = 53.3) -> float:
-    return min(y - 0, field_width - y)
-
-
-def _compute_distance_to_endzone(x: float, playDirection: str, field_length: float = 120.0) -> float:
-    field_subdivision = field_length / 12
-    if playDirection == "right":
-        distance = field_length - field_subdivision - x
-    elif playDirection == "left":
-        distance = x - field_subdivision
-    else:
-        raise ValueError
-    return distance
-
-
-def _compute_blockers_features(sample: pd.Series, frame_blockers: pd.DataFrame, nb_blockers: int = 3) -> pd.Series:
-    frame_blockers = frame_blockers.copy()
-    columns_to_suffix = ["s", "a", "dis", "o", "dir"]
-    columns_suffix_dict = {col: col + "_blocker" for col in columns_to_suffix}
-
-    frame_blockers["distance_to_blocker"] = frame_blockers.apply(
-        lambda x: _compute_distance_between_players(sample["x"], sample["y"], x["x"], x["y"]), axis=1
-    )
-    frame_blockers["direction_to_blocker"] = frame_blockers.apply(
-        lambda x: _compute_angle_between_players(sample["x"], sample["y"], x["x"], x["y"]), axis=1
-    )
-    frame_blockers = frame_blockers.sort_values(by="distance_to_blocker", ascending=True).reset_index()
-    frame_blockers = frame_blockers[columns_to_suffix + ["distance_to_blocker", "direction_to_blocker"]].head(
-        nb_blockers
-    )
-
-    frame_blockers = frame_blockers.rename(columns=columns_suffix_dict)
-
-    blockers_features = frame_blockers.stack().rename(sample.name)
-    blockers_features.index = blockers_features.index.map(lambda x: f"{x[1]}_{x[0]+1}")
-    return blockers_features
-
-
-def _compute_sample_features(
-    sample: pd.Series, frame_ball_carrier: pd.Series, frame_blockers: pd.DataFrame
-) -> pd.Series:
-    sample = sample.copy()
-    sample["distance_to_ball_carrier"] = _compute_distance_between_players(
-        sample["x"], sample["y"], frame_ball_carrier["x"], frame_ball_carrier["y"]
-    )
-    sample["direction_to_ball_carrier"] = _compute_angle_between_players(
-        sample["x"], sample["y"], frame_ball_carrier["x"], frame_ball_carrier["y"]
-    )
-
-    blockers_features = _compute_blockers_features(sample, frame_blockers)
-
-    sample_features = pd.concat([sample, blockers_features])
-
-    return sample_features
-
-
-def _compute_group_features(
-    group: pd.DataFrame, frame_ball_carrier: pd.Series, frame_blockers: pd.DataFrame
+    is_ball_carrier_tackled = targeted_data["ballCarrierId"].to_numpy(
+        dtype=np.float64, na_value=np.nan
+    ) == targeted_data["ball_carrier_id"].to_numpy(dtype=np.float64, na_value=np.nan)
+    targeted_data.loc[is_ball_carrier_tackled & (targeted_data["tackle_or_assist"] == 1), "will_tackle"] = 1
+    return enforce_schema(targeted_data, "targeted_data")
+
+
+def _select_nearest(distances: np.ndarray, k: int) -> np.ndarray:
+    if distances.shape[1] <= k:
+        return np.argsort(distances, axis=1, kind="stable")
+
+    nearest = np.argpartition(distances, k - 1, axis=1)[:, :k]
+    nearest_distances = np.take_along_axis(distances, nearest, axis=1)
+    nearest = np.take_along_axis(nearest, np.lexsort((nearest, nearest_distances)), axis=1)
+
+    # ties on the k-th distance make the partition arbitrary, these rows are fully sorted like sort_values does
+    has_tie = (distances <= nearest_distances.max(axis=1, keepdims=True)).sum(axis=1) > k
+    if has_tie.any():
+        nearest[has_tie] = np.argsort(distances[has_tie], axis=1, kind="stable")[:, :k]
+    return nearest
+
+
+def _compute_blockers_features(
+    play_store: PlayStore,
+    frame_rows: np.ndarray,
+    slots: np.ndarray,
+    is_blocker: np.ndarray,
+    nb_blockers: int = 3,
+    chunk_size: int = 500000,
 ) -> pd.DataFrame:
-    return group.apply(
-        lambda x: _compute_sample_features(
-            x,
-            frame_ball_carrier,
-            frame_blockers,
-        ),
-        axis=1,
-    )
-
-
-def _inverse_left_directed_plays(features_data: pd.DataFrame) -> pd.DataFrame:
-    left_playDirection = features_data["playDirection"] == "left"
-    blockers_columns = [
+    # blockers of every frame are gathered in their order of the store, padded up to nb_blockers slots
+    nb_slots = max(int(is_blocker.sum(axis=1).max(initial=0)), nb_blockers)
+    blocker_slots = np.argsort(~is_blocker, axis=1, kind="stable")
+    blocker_slots = np.pad(blocker_slots, ((0, 0), (0, max(nb_slots - blocker_slots.shape[1], 0))))[:, :nb_slots]
+    is_blocker = np.pad(is_blocker, ((0, 0), (0, max(nb_slots - is_blocker.shape[1], 0))))
+    is_blocker = np.take_along_axis(is_blocker, blocker_slots, axis=1)
+    channels = [play_store.channels.index(col) for col in ["x", "y"] + BLOCKERS_COLUMNS]
+    blockers = play_store.tensor[np.arange(len(blocker_slots))[:, None], blocker_slots][:, :, channels]
+    blockers[~is_blocker] = np.nan
+
+    features_columns = [
         col
-        for col in features_data.columns
-        if col.startswith("o_blocker") or col.startswith("dir_blocker") or col.startswith("direction_to_blocker")
+        for i in range(1, nb_blockers + 1)
+        for col in [f"{c}_blocker_{i}" for c in BLOCKERS_COLUMNS]
+        + [f"distance_to_blocker_{i}", f"direction_to_blocker_{i}"]
     ]
-    for col in ["o", "dir", "o_ball_carrier", "dir_ball_carrier", "direction_to_ball_carrier"] + blockers_columns:
-        features_data.loc[left_playDirection, col] = (features_data.loc[left_playDirection, col] - 180) % 360
+    blockers_features = np.empty((len(frame_rows), len(features_columns)))
+    for start in range(0, len(frame_rows), chunk_size):
+        end = start + chunk_size
+        frames = frame_rows[start:end]
+        players = play_store.tensor[frames, slots[start:end]]
+        frames_blockers = blockers[frames]
+
+        x, y = players[:, [0]], players[:, [1]]
+        distances = compute_distance_between_players(x, y, frames_blockers[:, :, 0], frames_blockers[:, :, 1])
+        directions = compute_angle_between_players(x, y, frames_blockers[:, :, 0], frames_blockers[:, :, 1])
+
+        # missing distances are ranked after the real ones and padding slots after everything
+        ranking = np.where(np.isnan(distances), np.finfo(float).max, distances)
+        ranking[~is_blocker[frames]] = np.inf
+        nearest = _select_nearest(ranking, nb_blockers)
+
+        chunk_features = np.concatenate(
+            [
+                np.take_along_axis(frames_blockers[:, :, 2:], nearest[:, :, None], axis=1),
+                np.take_along_axis(distances, nearest, axis=1)[:, :, None],
+                np.take_along_axis(directions, nearest, axis=1)[:, :, None],
+            ],
+            axis=2,
+        )
+        blockers_features[start:end] = chunk_features.reshape(len(frames), -1)
 
-    return features_data
+    return pd.DataFrame(blockers_features, columns=features_columns)
 
 
 def compute_features_data(targeted_data: pd.DataFrame, tracking: pd.DataFrame) -> pd.DataFrame:
     """Compute features for player movements and distances.
 
+    Frames with a ball carrier are held in a PlayStore, in which the ball carrier and the blockers of the frame of
+    every defensive player are indexed by position.
+
     Parameters
     ----------
     targeted_data : pd.DataFrame
-        DataFrame containing visualization tracking data and ball carrier information.
+        DataFrame containing visualization tracking data and ball carrier information, of plays going left to
+        right.
     tracking : pd.DataFrame
-        DataFrame containing complete tracking data.
+        DataFrame containing complete tracking data, of plays going left to right as loaded by load_data.
 
     Returns
     -------
     pd.DataFrame
         DataFrame with computed features for defensive players.
     """
-    merged_data = targeted_data.merge(
-        tracking[["gameId", "playId", "nflId", "frameId"] + [col for col in tracking if col not in targeted_data]],
-        on=["gameId", "playId", "nflId", "frameId"],
-    )
-
-    defense = merged_data[(merged_data["is_defense"]) & (~merged_data["ball_carrier_id"].isna())][
-        ["gameId", "playId", "nflId", "frameId", "x", "y", "playDirection", "will_tackle", "s", "a", "dis", "o", "dir"]
-    ].reset_index(drop=True)
+    for data in [targeted_data, tracking]:
+        if (data["playDirection"] == "left").any():
+            raise ValueError("plays must go left to right, as normalized by load_data or normalize_play_direction")
 
-    ball_carrier = merged_data[
-        (~merged_data["is_defense"]) & (~merged_data["ball_carrier_id"].isna()) & (merged_data["is_ball_carrying"])
-    ][["gameId", "playId", "nflId", "frameId", "x", "y", "playDirection", "s", "a", "dis", "o", "dir"]].set_index(
-        ["gameId", "playId", "frameId"]
+    merged_data = KeyedTable(tracking, PLAYER_FRAME_KEYS).join(
+        targeted_data, columns=[col for col in tracking if col not in targeted_data]
     )
+    has_ball_carrier_id = ~merged_data["ball_carrier_id"].isna().to_numpy()
+    is_defense = merged_data["is_defense"].to_numpy(dtype=bool)
+
+    # the ball carrier of a frame is the offensive player carrying the ball
+    play_data = merged_data.loc[has_ball_carrier_id, PLAYER_FRAME_KEYS + ["x", "y"] + BLOCKERS_COLUMNS]
+    play_data["is_defense"] = is_defense[has_ball_carrier_id]
+    play_data["is_ball_carrying"] = merged_data["is_ball_carrying"].to_numpy(dtype=bool)[has_ball_carrier_id]
+    play_data["is_ball_carrying"] &= ~play_data["is_defense"]
+    play_store = PlayStore(play_data, channels=["x", "y"] + BLOCKERS_COLUMNS, dtype=np.float64)
+
+    features_data = merged_data.loc[
+        has_ball_carrier_id & is_defense,
+        ["gameId", "playId", "nflId", "frameId", "x", "y", "playDirection", "will_tackle", "s", "a", "dis", "o", "dir"],
+    ]
+    features_data = features_data.sort_values(["gameId", "playId", "frameId"], kind="stable").reset_index(drop=True)
+    frame_rows, slots = play_store.get_positions(features_data)
 
-    blockers = merged_data[
-        (~merged_data["is_defense"]) & (~merged_data["ball_carrier_id"].isna()) & (~merged_data["is_ball_carrying"])
-    ][["gameId", "playId", "nflId", "frameId", "x", "y", "playDirection", "s", "a", "dis", "o", "dir"]].set_index(
-        ["gameId", "playId", "frameId", "nflId"]
-    )
+    ball_carrier_slots = play_store.ball_carrier_index[frame_rows]
+    has_ball_carrier = ball_carrier_slots >= 0
+    ball_carrier = play_store.tensor[frame_rows, ball_carrier_slots]
+    ball_carrier[~has_ball_carrier] = np.nan
 
-    features_data = (
-        defense.groupby(["gameId", "playId", "frameId"])
-        .apply(
-            lambda x: _compute_group_features(
-                x,
-                ball_carrier.loc[(x["gameId"].iloc[0], x["playId"].iloc[0], x["frameId"].iloc[0])],
-                blockers.loc[(x["gameId"].iloc[0], x["playId"].iloc[0], x["frameId"].iloc[0])],
-            )
-        )
-        .reset_index(drop=True)
+    frame_play_codes = np.repeat(
+        np.arange(len(play_store)), (play_store.plays["frame_end"] - play_store.plays["frame_start"]).to_numpy()
     )
-    features_data = features_data[
-        defense.columns.to_list() + [col for col in features_data.columns if col not in defense.columns]
-    ]
+    is_ball_carrier = np.arange(play_store.tensor.shape[1]) == play_store.ball_carrier_index[:, None]
+    is_blocker = play_store.is_present & ~play_store.is_defense[frame_play_codes] & ~is_ball_carrier
 
-    ball_carrier["ball_carrier_distance_to_sideline"] = ball_carrier["y"].apply(_compute_distance_to_nearest_sideline)
-    ball_carrier["ball_carrier_distance_to_endzone"] = ball_carrier.apply(
-        lambda x: _compute_distance_to_endzone(x["x"], x["playDirection"]), axis=1
+    x, y = features_data["x"].to_numpy(dtype=np.float64), features_data["y"].to_numpy(dtype=np.float64)
+    features_data["distance_to_ball_carrier"] = compute_distance_between_players(
+        x, y, ball_carrier[:, 0], ball_carrier[:, 1]
+    )
+    features_data["direction_to_ball_carrier"] = compute_angle_between_players(
+        x, y, ball_carrier[:, 0], ball_carrier[:, 1]
     )
 
-    features_data = features_data.merge(
-        ball_carrier[
-            ["s", "a", "dis", "o", "dir", "ball_carrier_distance_to_sideline", "ball_carrier_distance_to_endzone"]
-        ],
-        left_on=["gameId", "playId", "frameId"],
-        right_index=True,
-        suffixes=("", "_ball_carrier"),
+    features_data = pd.concat(
+        [features_data, _compute_blockers_features(play_store, frame_rows, slots, is_blocker)], axis=1
     )
 
-    features_data = _inverse_left_directed_plays(features_data)
+    for col in BLOCKERS_COLUMNS:
+        features_data[f"{col}_ball_carrier"] = ball_carrier[:, play_store.channels.index(col)]
+    features_data["ball_carrier_distance_to_sideline"] = compute_distance_to_nearest_sideline(ball_carrier[:, 1])
+    features_data["ball_carrier_distance_to_endzone"] = compute_distance_to_endzone(ball_carrier[:, 0])
 
-    return features_data
+    return enforce_schema(features_data[has_ball_carrier].reset_index(drop=True), "features_data")
 
 
 def process_function(
@@ -226,8 +274,35 @@ def process_function(
     shared_dataframe_list.append(features_data)
 
 
+def process_memory_mapped_shard(shard_path: str) -> str:
+    """Compute features for a memory-mapped shard of tracking games and write them memory-mapped next to it.
+
+    Parameters
+    ----------
+    shard_path : str
+        Directory containing the 'targeted_data' and 'tracking' shards written by write_memory_mapped_dataframe.
+
+    Returns
+    -------
+    str
+        Directory containing the computed features data.
+    """
+    targeted_data = read_memory_mapped_dataframe(Path(shard_path) / "targeted_data")
+    tracking = read_memory_mapped_dataframe(Path(shard_path) / "tracking")
+
+    features_data = compute_features_data(targeted_data, tracking)
+
+    features_path = str(Path(shard_path) / "features_data")
+    write_memory_mapped_dataframe(features_data, features_path)
+    return features_path
+
+
 def compute_features_data_with_multiprocessing(
-    targeted_data: pd.DataFrame, tracking: pd.DataFrame, nb_process: int = 10
+    targeted_data: pd.DataFrame,
+    tracking: pd.DataFrame,
+    nb_process: int = 10,
+    memory_mapped: bool = True,
+    tmp_dir: Optional[str] = None,
 ) -> pd.DataFrame:
     """Compute features for player movements and distances using multiprocessing.
 
@@ -239,6 +314,12 @@ def compute_features_data_with_multiprocessing(
         DataFrame containing complete tracking data.
     nb_process : int, optional
         Number of processes to use for parallel computation, by default 10.
+    memory_mapped : bool, optional
+        Flag to hand over to each process only its shard of games as memory-mapped files, and to get its features
+        back the same way, instead of pickling the complete data to every process, by default True.
+    tmp_dir : Optional[str], optional
+        Directory in which the memory-mapped shards are written, for example "/dev/shm" to keep them in shared
+        memory, by default None for the system temporary directory.
 
     Returns
     -------
@@ -252,6 +333,27 @@ def compute_features_data_with_multiprocessing(
         nb_process = nb_process - 1
         chunk_size = total_items // nb_process
 
+    shards_games = [
+        tracking_games[i * chunk_size : (i + 1) * chunk_size if i < nb_process - 1 else total_items]
+        for i in range(nb_process)
+    ]
+
+    if memory_mapped:
+        with tempfile.TemporaryDirectory(dir=tmp_dir) as shards_dir:
+            shards_paths = []
+            for i, games in enumerate(shards_games):
+                shard_path = Path(shards_dir) / f"shard_{i}"
+                write_memory_mapped_dataframe(
+                    targeted_data[targeted_data["gameId"].isin(games)], shard_path / "targeted_data"
+                )
+                write_memory_mapped_dataframe(tracking[tracking["gameId"].isin(games)], shard_path / "tracking")
+                shards_paths.append(str(shard_path))
+
+            with concurrent.futures.ProcessPoolExecutor() as executor:
+                features_paths = list(executor.map(process_memory_mapped_shard, shards_paths))
+
+            return pd.concat([read_memory_mapped_dataframe(path) for path in features_paths], ignore_index=True)
+
     manager = Manager()
     shared_dataframe_list: ListProxy = manager.list()
 
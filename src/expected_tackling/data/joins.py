@@ -0,0 +1,175 @@
+from typing import Optional
+
+import numpy as np
+import pandas as pd
+
+PLAY_KEYS = ["gameId", "playId"]
+FRAME_KEYS = ["gameId", "playId", "frameId"]
+PLAYER_FRAME_KEYS = ["gameId", "playId", "nflId", "frameId"]
+MAX_PACKED_BITS = 63
+
+
+class KeyPacker:
+    """Class packing integer key columns, with possible missing values, into single int64 keys."""
+
+    def __init__(self, data: pd.DataFrame, keys: list = PLAYER_FRAME_KEYS) -> None:
+        """Initialize the KeyPacker object.
+
+        Every key is coded by its offset to the minimum value of the key in data plus one, 0 coding missing values
+        as the football nflId, with just enough bits to code the range of values of the key in data.
+
+        Parameters
+        ----------
+        data : pd.DataFrame
+            DataFrame whose key values ranges are packed.
+        keys : list, optional
+            Key columns, by default ["gameId", "playId", "nflId", "frameId"].
+        """
+        self.keys = list(keys)
+        self.minimums = []
+        self.nb_bits = []
+        for key in self.keys:
+            values = data[key].to_numpy(dtype=np.float64, na_value=np.nan)
+            is_present = ~np.isnan(values)
+            minimum = int(values[is_present].min()) if is_present.any() else 0
+            maximum = int(values[is_present].max()) if is_present.any() else 0
+            self.minimums.append(minimum)
+            self.nb_bits.append((maximum - minimum + 1).bit_length())
+
+        if sum(self.nb_bits) > MAX_PACKED_BITS:
+            raise ValueError(f"ranges of the keys {self.keys} do not fit in {MAX_PACKED_BITS} bits")
+
+    def pack(self, data: pd.DataFrame) -> np.ndarray:
+        """Pack the keys of every row of data.
+
+        Parameters
+        ----------
+        data : pd.DataFrame
+            DataFrame with the key columns.
+
+        Returns
+        -------
+        np.ndarray
+            Array of int64 packed keys, -1 for rows with key values out of the packed ranges.
+        """
+        packed_keys = np.zeros(len(data), dtype=np.int64)
+        is_packed = np.ones(len(data), dtype=bool)
+        for key, minimum, nb_bits in zip(self.keys, self.minimums, self.nb_bits):
+            column = data[key]
+            if isinstance(column.dtype, np.dtype) and column.dtype.kind in "iu":
+                codes = column.to_numpy().astype(np.int64) - (minimum - 1)
+            else:
+                values = column.to_numpy(dtype=np.float64, na_value=np.nan)
+                codes = np.where(np.isnan(values), 0, values - (minimum - 1)).astype(np.int64)
+            is_packed &= (codes >= 0) & (codes < 2**nb_bits)
+            packed_keys <<= nb_bits
+            packed_keys |= codes
+        packed_keys[~is_packed] = -1
+        return packed_keys
+
+
+class KeyedTable:
+    """Class holding a table sorted on packed keys, to join it to other tables with binary searches."""
+
+    def __init__(self, data: pd.DataFrame, keys: list = PLAYER_FRAME_KEYS) -> None:
+        """Initialize the KeyedTable object.
+
+        Parameters
+        ----------
+        data : pd.DataFrame
+            DataFrame with unique keys, as tracking data for ["gameId", "playId", "nflId", "frameId"]. It is not
+            copied and must not be modified while the table is used.
+        keys : list, optional
+            Key columns, by default ["gameId", "playId", "nflId", "frameId"].
+        """
+        self.data = data
+        self.keys = list(keys)
+        self.packer = KeyPacker(data, self.keys)
+
+        packed_keys = self.packer.pack(data)
+        self.order = np.argsort(packed_keys, kind="stable")
+        self.sorted_keys = packed_keys[self.order]
+        if (np.diff(self.sorted_keys) == 0).any():
+            raise ValueError(f"keys {self.keys} of a keyed table must be unique")
+
+    def lookup(self, data: pd.DataFrame) -> np.ndarray:
+        """Find the rows of the table with the keys of every row of data.
+
+        Parameters
+        ----------
+        data : pd.DataFrame
+            DataFrame with the key columns.
+
+        Returns
+        -------
+        np.ndarray
+            Array of positions of the rows in the table, -1 for keys missing from the table.
+        """
+        if len(self.sorted_keys) == 0:
+            return np.full(len(data), -1, dtype=np.int64)
+        packed_keys = self.packer.pack(data)
+        positions = np.minimum(np.searchsorted(self.sorted_keys, packed_keys), len(self.sorted_keys) - 1)
+        is_found = (self.sorted_keys[positions] == packed_keys) & (packed_keys >= 0)
+        return np.where(is_found, self.order[positions], -1)
+
+    def join(
+        self,
+        data: pd.DataFrame,
+        columns: Optional[list] = None,
+        how: str = "inner",
+        suffix: str = "",
+        data_columns: Optional[list] = None,
+        table_order: bool = False,
+    ) -> pd.DataFrame:
+        """Join columns of the table to data on the keys, as data.merge(table, on=keys, how=how).
+
+        Rows keep the order of data unless table_order is set, and only the requested columns are copied.
+
+        Parameters
+        ----------
+        data : pd.DataFrame
+            DataFrame with the key columns.
+        columns : Optional[list], optional
+            Columns of the table to join, by default None for all columns except the keys.
+        how : str, optional
+            'inner' to keep only rows of data whose keys are in the table or 'left' to keep all rows of data, with
+            missing values for the joined columns, by default "inner".
+        suffix : str, optional
+            Suffix added to joined columns that are also columns of data, by default "".
+        data_columns : Optional[list], optional
+            Columns of data to keep, by default None for all columns.
+        table_order : bool, optional
+            Flag to order the rows of an inner join as the rows of the table they are joined to, rows joined to the
+            same row keeping the order of data, by default False.
+
+        Returns
+        -------
+        pd.DataFrame
+            DataFrame with the columns of data and the joined columns, with a RangeIndex.
+        """
+        if how not in ["inner", "left"]:
+            raise ValueError("how must be 'inner' or 'left'")
+        if table_order and how != "inner":
+            raise ValueError("table_order is only available for inner joins")
+        if columns is None:
+            columns = [col for col in self.data if col not in self.keys]
+        if data_columns is None:
+            data_columns = list(data.columns)
+
+        positions = self.lookup(data)
+        if how == "inner":
+            rows = np.flatnonzero(positions >= 0)
+            if table_order:
+                rows = rows[np.argsort(positions[rows], kind="stable")]
+            positions = positions[rows]
+            joined_data = data.iloc[rows, data.columns.get_indexer(data_columns)]
+        else:
+            joined_data = data.loc[:, data_columns]
+        joined_data.index = pd.RangeIndex(len(joined_data))
+
+        for col in columns:
+            joined_col = col + suffix if col in joined_data else col
+            if joined_col in joined_data:
+                raise ValueError(f"column {col} is already in data")
+            joined_data[joined_col] = self.data[col].array.take(positions, allow_fill=how == "left")
+        return joined_data
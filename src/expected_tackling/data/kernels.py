@@ -0,0 +1,137 @@
+import functools
+import importlib.util
+import math
+from typing import Callable
+
+import numpy as np
+
+from expected_tackling.data.process_data import FIELD_LENGTH, FIELD_WIDTH
+
+# numba is only imported when a kernel is first compiled, which keeps imports and worker processes startup cheap
+HAS_NUMBA = importlib.util.find_spec("numba") is not None
+# below this number of values, compiled kernels run on a single thread to avoid the threads start overhead
+PARALLEL_MIN_SIZE = 100000
+
+
+def _distance(x1: float, y1: float, x2: float, y2: float) -> float:
+    return math.sqrt((x2 - x1) ** 2 + (y2 - y1) ** 2)
+
+
+def _angle(x1: float, y1: float, x2: float, y2: float) -> float:
+    return (math.degrees(math.atan2(x2 - x1, y2 - y1)) + 360) % 360
+
+
+def _distance_to_nearest_sideline(y: float, field_width: float) -> float:
+    return min(y - 0, field_width - y)
+
+
+def _distance_to_endzone(x: float, field_length: float) -> float:
+    return field_length - field_length / 12 - x
+
+
+@functools.lru_cache(maxsize=None)
+def _get_kernel(function: Callable[..., float], nb_arguments: int, parallel: bool) -> Callable[..., np.ndarray]:
+    import numba
+
+    signature = f"float64({', '.join(['float64'] * nb_arguments)})"
+    return numba.vectorize([signature], target="parallel" if parallel else "cpu", cache=True)(function)
+
+
+def _as_float_arrays(*values: float | np.ndarray) -> list:
+    return [np.asarray(value, dtype=np.float64) for value in values]
+
+
+def _run_kernel(function: Callable[..., float], *values: float | np.ndarray) -> np.ndarray:
+    arrays = _as_float_arrays(*values)
+    size = max(array.size for array in arrays)
+    return _get_kernel(function, len(arrays), size >= PARALLEL_MIN_SIZE)(*arrays)
+
+
+def compute_distance_between_players(
+    x1: float | np.ndarray, y1: float | np.ndarray, x2: float | np.ndarray, y2: float | np.ndarray
+) -> np.ndarray:
+    """Compute euclidean distances between players, broadcasting the coordinates arrays.
+
+    Parameters
+    ----------
+    x1, y1 : float | np.ndarray
+        Coordinates of the first players.
+    x2, y2 : float | np.ndarray
+        Coordinates of the second players.
+
+    Returns
+    -------
+    np.ndarray
+        Array of float64 distances in yards.
+    """
+    if HAS_NUMBA:
+        return _run_kernel(_distance, x1, y1, x2, y2)
+    x1, y1, x2, y2 = _as_float_arrays(x1, y1, x2, y2)
+    return np.sqrt((x2 - x1) ** 2 + (y2 - y1) ** 2)
+
+
+def compute_angle_between_players(
+    x1: float | np.ndarray, y1: float | np.ndarray, x2: float | np.ndarray, y2: float | np.ndarray
+) -> np.ndarray:
+    """Compute directions from first players to second players, broadcasting the coordinates arrays.
+
+    Directions are in degrees in [0, 360), clockwise from the y axis as the tracking data orientations.
+
+    Parameters
+    ----------
+    x1, y1 : float | np.ndarray
+        Coordinates of the first players.
+    x2, y2 : float | np.ndarray
+        Coordinates of the second players.
+
+    Returns
+    -------
+    np.ndarray
+        Array of float64 directions in degrees.
+    """
+    if HAS_NUMBA:
+        return _run_kernel(_angle, x1, y1, x2, y2)
+    x1, y1, x2, y2 = _as_float_arrays(x1, y1, x2, y2)
+    return (np.degrees(np.arctan2(x2 - x1, y2 - y1)) + 360) % 360
+
+
+def compute_distance_to_nearest_sideline(y: float | np.ndarray, field_width: float = FIELD_WIDTH) -> np.ndarray:
+    """Compute distances of players to the nearest sideline.
+
+    Parameters
+    ----------
+    y : float | np.ndarray
+        y coordinates of the players.
+    field_width : float, optional
+        Width of the field in yards, by default FIELD_WIDTH.
+
+    Returns
+    -------
+    np.ndarray
+        Array of float64 distances in yards.
+    """
+    if HAS_NUMBA:
+        return _run_kernel(_distance_to_nearest_sideline, y, field_width)
+    (y,) = _as_float_arrays(y)
+    return np.minimum(y - 0, field_width - y)
+
+
+def compute_distance_to_endzone(x: float | np.ndarray, field_length: float = FIELD_LENGTH) -> np.ndarray:
+    """Compute distances of players to the endzone they are going to, on plays going left to right.
+
+    Parameters
+    ----------
+    x : float | np.ndarray
+        x coordinates of the players.
+    field_length : float, optional
+        Length of the field in yards including endzones, by default FIELD_LENGTH.
+
+    Returns
+    -------
+    np.ndarray
+        Array of float64 distances in yards.
+    """
+    if HAS_NUMBA:
+        return _run_kernel(_distance_to_endzone, x, field_length)
+    (x,) = _as_float_arrays(x)
+    return np.asarray(field_length - field_length / 12 - x)
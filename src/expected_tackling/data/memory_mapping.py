@@ -0,0 +1,98 @@
+import pickle
+from pathlib import Path
+from typing import Optional
+
+import numpy as np
+import pandas as pd
+
+# arrays of the nullable dtypes of pandas, stored as their values and their missing values mask
+MASKED_ARRAYS = (pd.arrays.IntegerArray, pd.arrays.FloatingArray, pd.arrays.BooleanArray)
+
+
+def write_memory_mapped_dataframe(data: pd.DataFrame, path: str | Path) -> None:
+    """Write a DataFrame as one .npy file per column so that it can be read back memory-mapped.
+
+    Object columns are stored as integer codes with their unique values kept in the metadata file, and nullable
+    columns as their values with a separate file of their missing values mask.
+
+    Parameters
+    ----------
+    data : pd.DataFrame
+        DataFrame to write, its index is not kept.
+    path : str | Path
+        Directory in which the columns are written.
+    """
+    path = Path(path)
+    path.mkdir(parents=True, exist_ok=True)
+
+    columns_metadata = []
+    for i, (column, values) in enumerate(data.items()):
+        if isinstance(values.dtype, pd.CategoricalDtype):
+            np.save(path / f"{i}.npy", values.cat.codes.to_numpy())
+            columns_metadata.append((column, "categorical", values.dtype))
+        elif isinstance(values.dtype, np.dtype) and values.dtype != object:
+            np.save(path / f"{i}.npy", values.to_numpy())
+            columns_metadata.append((column, "numpy", None))
+        elif isinstance(values.array, MASKED_ARRAYS):
+            np.save(path / f"{i}.npy", values.to_numpy(dtype=values.dtype.numpy_dtype, na_value=0))
+            np.save(path / f"{i}_mask.npy", values.isna().to_numpy())
+            columns_metadata.append((column, "masked", values.dtype))
+        else:
+            codes, uniques = pd.factorize(values)
+            np.save(path / f"{i}.npy", codes)
+            columns_metadata.append((column, "object", np.asarray(uniques, dtype=object)))
+
+    with open(path / "metadata.pkl", "wb") as file:
+        pickle.dump(columns_metadata, file)
+
+
+def read_memory_mapped_dataframe(
+    path: str | Path, columns: Optional[list] = None, rows: Optional[np.ndarray] = None
+) -> pd.DataFrame:
+    """Read a DataFrame written by write_memory_mapped_dataframe.
+
+    Numeric columns are memory-mapped read-only and are not copied until they are modified, unless rows are
+    selected in which case only the selected rows are read.
+
+    Parameters
+    ----------
+    path : str | Path
+        Directory in which the columns were written.
+    columns : Optional[list], optional
+        Columns to read, by default None for all columns.
+    rows : Optional[np.ndarray], optional
+        Positions of the rows to read, by default None for all rows.
+
+    Returns
+    -------
+    pd.DataFrame
+        DataFrame with a RangeIndex.
+    """
+    path = Path(path)
+    with open(path / "metadata.pkl", "rb") as file:
+        columns_metadata = pickle.load(file)
+
+    columns_values = {}
+    for i, (column, kind, metadata) in enumerate(columns_metadata):
+        if columns is not None and column not in columns:
+            continue
+        values = np.load(path / f"{i}.npy", mmap_mode="r")
+        if rows is not None:
+            values = values[rows]
+        if kind == "categorical":
+            columns_values[column] = pd.Categorical.from_codes(values, dtype=metadata)
+        elif kind == "numpy":
+            columns_values[column] = values
+        elif kind == "masked":
+            mask = np.load(path / f"{i}_mask.npy", mmap_mode="r")
+            if rows is not None:
+                mask = mask[rows]
+            columns_values[column] = metadata.construct_array_type()(values, mask)
+        else:
+            objects = np.full(len(values), np.nan, dtype=object)
+            objects[values >= 0] = metadata[values[values >= 0]]
+            columns_values[column] = objects
+
+    if columns is not None:
+        columns_values = {column: columns_values[column] for column in columns if column in columns_values}
+    return pd.DataFrame(columns_values, copy=False)
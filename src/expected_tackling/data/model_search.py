@@ -0,0 +1,336 @@
+import concurrent.futures
+import itertools
+import os
+from typing import Any, Callable, Optional
+
+import numpy as np
+import pandas as pd
+
+from expected_tackling.data.mott_features import sample_training_data
+from expected_tackling.data.training_data import TrainingDataset
+
+SEARCH_SCORES = [
+    "nb_folds",
+    "balanced_accuracy",
+    "balanced_accuracy_std",
+    "train_balanced_accuracy",
+    "confusion_matrix",
+    "train_confusion_matrix",
+]
+NB_FOLDS = 5
+NB_THREADS = 4
+# share of the configurations kept after every fold, the others being stopped
+KEEP_FRACTION = 0.5
+
+# data, folds and model factory shared by the jobs of a worker process
+_search: dict[str, Any] = {}
+
+
+def _set_search(
+    kind: str, data: Any, folds: list, model_factory: Callable, nb_threads: int, seed: int, quantized: bool
+) -> None:
+    if kind == "probability":
+        data = TrainingDataset(data)
+    _search.update(
+        kind=kind,
+        data=data,
+        folds=folds,
+        model_factory=model_factory,
+        nb_threads=nb_threads,
+        seed=seed,
+        quantized=quantized,
+        pool=None,
+    )
+
+
+def _get_train_pool(data: TrainingDataset, fold: int, train_rows: np.ndarray) -> Any:
+    # folds are evaluated one after the other, so a worker keeps the pool of its current fold for all configurations
+    if _search["pool"] is None or _search["pool"][0] != fold:
+        # the pool of the previous fold is released before the next one is built
+        _search["pool"] = None
+        _search["pool"] = (fold, data.get_catboost_pool(train_rows))
+    return _search["pool"][1]
+
+
+def make_catboost_classifier(params: dict, nb_threads: int, seed: int) -> Any:
+    """Create a CatBoostClassifier for a job of a search, silent and without training files.
+
+    Parameters
+    ----------
+    params : dict
+        Hyperparameters of the configuration, as {"scale_pos_weight": 2, "max_depth": 6}.
+    nb_threads : int
+        Number of threads of the job.
+    seed : int
+        Random seed.
+
+    Returns
+    -------
+    Any
+        Untrained CatBoostClassifier.
+    """
+    from catboost import CatBoostClassifier
+
+    return CatBoostClassifier(**params, thread_count=nb_threads, random_seed=seed, verbose=0, allow_writing_files=False)
+
+
+def split_game_folds(games: np.ndarray, nb_folds: int = NB_FOLDS, seed: int = 42) -> list:
+    """Split games in folds of similar numbers of rows, the rows of a game being in a single fold.
+
+    Parameters
+    ----------
+    games : np.ndarray
+        gameId of every row.
+    nb_folds : int, optional
+        Number of folds, by default 5.
+    seed : int, optional
+        Random seed of the order of the games, by default 42.
+
+    Returns
+    -------
+    list
+        Sorted arrays of the games of every fold.
+    """
+    unique_games, nb_rows = np.unique(np.asarray(games), return_counts=True)
+    if len(unique_games) < nb_folds:
+        raise ValueError(f"{len(unique_games)} games cannot be split in {nb_folds} folds")
+    # largest games first, each in the fold with the fewest rows, shuffled to break ties
+    order = np.random.default_rng(seed).permutation(len(unique_games))
+    order = order[np.argsort(-nb_rows[order], kind="stable")]
+    folds_games: list[list] = [[] for _ in range(nb_folds)]
+    folds_nb_rows = np.zeros(nb_folds, dtype=np.int64)
+    for i in order:
+        fold = int(np.argmin(folds_nb_rows))
+        folds_games[fold].append(unique_games[i])
+        folds_nb_rows[fold] += nb_rows[i]
+    return [np.sort(np.array(fold_games)) for fold_games in folds_games]
+
+
+def balanced_accuracy(confusion_matrix: np.ndarray) -> float:
+    """Compute the balanced accuracy of a confusion matrix, the mean recall of the classes.
+
+    Parameters
+    ----------
+    confusion_matrix : np.ndarray
+        Confusion matrix, actual classes in rows and predicted classes in columns.
+
+    Returns
+    -------
+    float
+        Balanced accuracy, classes without actual rows being ignored.
+    """
+    confusion_matrix = np.asarray(confusion_matrix)
+    nb_actual = confusion_matrix.sum(axis=1)
+    return float(np.mean(np.diag(confusion_matrix)[nb_actual > 0] / nb_actual[nb_actual > 0]))
+
+
+def _fit_and_score(
+    model: Any, fit_args: tuple, X_train: Any, y_train: np.ndarray, X_test: Any, y_test: np.ndarray
+) -> tuple:
+    from sklearn.metrics import confusion_matrix
+
+    model.fit(*fit_args)
+    return (
+        confusion_matrix(y_train, np.asarray(model.predict(X_train)).astype(np.int64), labels=[0, 1]),
+        confusion_matrix(y_test, np.asarray(model.predict(X_test)).astype(np.int64), labels=[0, 1]),
+    )
+
+
+def _run_job(job: tuple) -> tuple:
+    config_index, fold, params = job
+    data, test_games = _search["data"], _search["folds"][fold]
+    if _search["kind"] == "probability":
+        is_test = np.isin(data.get_groups(), test_games)
+        train_rows, test_rows = np.flatnonzero(~is_test), np.flatnonzero(is_test)
+        X_train, y_train = data.get_features(train_rows), data.get_labels(train_rows).astype(np.int64)
+        X_test, y_test = data.get_features(test_rows), data.get_labels(test_rows).astype(np.int64)
+        # features are quantized with the borders of the dataset, models then split them on the same borders
+        fit_args = (_get_train_pool(data, fold, train_rows),) if _search["quantized"] else (X_train, y_train)
+    else:
+        # opportunities of training games are sampled as the MOTT model was trained, test games are kept whole
+        params = params.copy()
+        negatives_multplier = params.pop("negatives_multplier", 10)
+        is_test = data.index.get_level_values("gameId").isin(test_games)
+        train_data = sample_training_data(data[~is_test], negatives_multplier)
+        test_data = data[is_test]
+        X_train, y_train = train_data.drop(columns=["pff_missedTackle"]), train_data["pff_missedTackle"].astype(int)
+        X_test, y_test = test_data.drop(columns=["pff_missedTackle"]), test_data["pff_missedTackle"].astype(int)
+        fit_args = (X_train, y_train)
+
+    model = _search["model_factory"](params, _search["nb_threads"], _search["seed"])
+    return (config_index, *_fit_and_score(model, fit_args, X_train, y_train, X_test, y_test))
+
+
+def _run_search(
+    kind: str,
+    data: Any,
+    games: np.ndarray,
+    param_grid: dict,
+    nb_folds: int,
+    nb_threads: int,
+    nb_process: Optional[int],
+    keep_fraction: float,
+    model_factory: Callable,
+    seed: int,
+    quantized: bool,
+) -> pd.DataFrame:
+    configs = [dict(zip(param_grid, values)) for values in itertools.product(*param_grid.values())]
+    folds = split_game_folds(games, nb_folds, seed)
+    if nb_process is None:
+        nb_process = max((os.cpu_count() or 1) // nb_threads, 1)
+
+    train_confusion_matrices: list[list[np.ndarray]] = [[] for _ in configs]
+    confusion_matrices: list[list[np.ndarray]] = [[] for _ in configs]
+    running_configs = list(range(len(configs)))
+    with concurrent.futures.ProcessPoolExecutor(
+        max(min(nb_process, len(configs)), 1),
+        initializer=_set_search,
+        initargs=(kind, data, folds, model_factory, nb_threads, seed, quantized),
+    ) as executor:
+        for fold in range(nb_folds):
+            jobs = [(i, fold, configs[i]) for i in running_configs]
+            for i, train_confusion_matrix, confusion_matrix in executor.map(_run_job, jobs):
+                train_confusion_matrices[i].append(train_confusion_matrix)
+                confusion_matrices[i].append(confusion_matrix)
+            # successive halving, configurations with the lowest mean balanced accuracy so far are stopped
+            scores = [np.mean([balanced_accuracy(cm) for cm in confusion_matrices[i]]) for i in running_configs]
+            nb_kept = max(int(np.ceil(keep_fraction * len(running_configs))), 1)
+            running_configs = [running_configs[i] for i in np.argsort(scores, kind="stable")[::-1][:nb_kept]]
+
+    scores = []
+    for config, train_cms, cms in zip(configs, train_confusion_matrices, confusion_matrices):
+        folds_scores = [balanced_accuracy(cm) for cm in cms]
+        scores.append(
+            {
+                **config,
+                "nb_folds": len(cms),
+                "balanced_accuracy": np.mean(folds_scores),
+                "balanced_accuracy_std": np.std(folds_scores),
+                "train_balanced_accuracy": np.mean([balanced_accuracy(cm) for cm in train_cms]),
+                "confusion_matrix": np.sum(cms, axis=0),
+                "train_confusion_matrix": np.sum(train_cms, axis=0),
+            }
+        )
+    scores = pd.DataFrame.from_records(scores, columns=list(param_grid) + SEARCH_SCORES)
+    return scores.sort_values(["nb_folds", "balanced_accuracy"], ascending=False, kind="stable", ignore_index=True)
+
+
+def search_probability_model(
+    dataset: TrainingDataset,
+    param_grid: dict,
+    nb_folds: int = NB_FOLDS,
+    nb_threads: int = NB_THREADS,
+    nb_process: Optional[int] = None,
+    keep_fraction: float = KEEP_FRACTION,
+    model_factory: Callable = make_catboost_classifier,
+    seed: int = 42,
+    quantized: bool = True,
+) -> pd.DataFrame:
+    """Cross-validate a grid of hyperparameters of the tackling probability model on folds of games.
+
+    Jobs fitting a configuration on a fold run in worker processes with nb_threads threads each, reading the
+    memory-mapped features of the dataset. Models are fitted on CatBoost pools quantized with the borders of the
+    dataset, built once per fold by every worker process, so that features are not binned again for every
+    configuration, and are evaluated on the features. Folds are evaluated one after the other, and after each of
+    them only the keep_fraction best configurations are evaluated on the next folds.
+
+    Parameters
+    ----------
+    dataset : TrainingDataset
+        Built training dataset of features data, grouped by gameId.
+    param_grid : dict
+        Lists of values of the hyperparameters, as {"scale_pos_weight": [1, 2, 5], "max_depth": [4, 6]}.
+    nb_folds : int, optional
+        Number of folds, by default 5.
+    nb_threads : int, optional
+        Number of threads of a job, by default 4.
+    nb_process : Optional[int], optional
+        Number of worker processes, by default None for the number of processors divided by nb_threads.
+    keep_fraction : float, optional
+        Share of the configurations evaluated on the next fold, by default 0.5, 1 to evaluate all configurations on
+        all folds.
+    model_factory : Callable, optional
+        Function creating the model of a job from the hyperparameters, the number of threads and the seed, by
+        default make_catboost_classifier.
+    seed : int, optional
+        Random seed of the folds and the models, by default 42.
+    quantized : bool, optional
+        Flag to fit the models on quantized CatBoost pools, by default True, False to fit them on the features with
+        their labels.
+
+    Returns
+    -------
+    pd.DataFrame
+        DataFrame with the hyperparameters, the number of evaluated folds, the mean and standard deviation of the
+        test balanced accuracy, the mean train balanced accuracy and the test and train confusion matrices summed
+        over folds of every configuration, ranked by decreasing number of folds and balanced accuracy.
+    """
+    return _run_search(
+        "probability",
+        str(dataset.path),
+        dataset.get_groups(),
+        param_grid,
+        nb_folds,
+        nb_threads,
+        nb_process,
+        keep_fraction,
+        model_factory,
+        seed,
+        quantized,
+    )
+
+
+def search_mott_model(
+    mott_features_data: pd.DataFrame,
+    param_grid: dict,
+    nb_folds: int = NB_FOLDS,
+    nb_threads: int = NB_THREADS,
+    nb_process: Optional[int] = None,
+    keep_fraction: float = KEEP_FRACTION,
+    model_factory: Callable = make_catboost_classifier,
+    seed: int = 42,
+) -> pd.DataFrame:
+    """Cross-validate a grid of hyperparameters of the MOTT model on folds of games.
+
+    Opportunities of the training games are sampled by sample_training_data, with the "negatives_multplier"
+    hyperparameter of the configuration, and models are evaluated on all opportunities of the test games. Jobs run
+    as in search_probability_model.
+
+    Parameters
+    ----------
+    mott_features_data : pd.DataFrame
+        DataFrame with MOTT features and labels of the opportunities, as computed by compute_mott_features_data.
+    param_grid : dict
+        Lists of values of the hyperparameters, as {"negatives_multplier": [5, 10], "scale_pos_weight": [1, 5]}.
+    nb_folds : int, optional
+        Number of folds, by default 5.
+    nb_threads : int, optional
+        Number of threads of a job, by default 4.
+    nb_process : Optional[int], optional
+        Number of worker processes, by default None for the number of processors divided by nb_threads.
+    keep_fraction : float, optional
+        Share of the configurations evaluated on the next fold, by default 0.5.
+    model_factory : Callable, optional
+        Function creating the model of a job from the hyperparameters, the number of threads and the seed, by
+        default make_catboost_classifier.
+    seed : int, optional
+        Random seed of the folds and the models, by default 42.
+
+    Returns
+    -------
+    pd.DataFrame
+        DataFrame with the hyperparameters and the scores of every configuration, as search_probability_model.
+    """
+    return _run_search(
+        "mott",
+        mott_features_data,
+        mott_features_data.index.get_level_values("gameId").to_numpy(),
+        param_grid,
+        nb_folds,
+        nb_threads,
+        nb_process,
+        keep_fraction,
+        model_factory,
+        seed,
+        False,
+    )
@@ -1,40 +1,165 @@
+from typing import Optional
+
 import numpy as np
 import pandas as pd
-from scipy.signal import find_peaks
+from pandas.core.groupby import SeriesGroupBy
+
+from expected_tackling.data.joins import PLAYER_FRAME_KEYS, KeyedTable
+from expected_tackling.data.schema import enforce_schema
+
+PEAKS_HEIGHT = 0.5
+PEAKS_DISTANCE = 16
+MOTT_FEATURES = ["ott", "mean_distance_to_ball_carrier_from_peak", "ball_carrier_distance_won_to_last_frame"]
 
 
-def _find_peaks(ott: pd.Series) -> list:
-    peaks = find_peaks(ott.tolist() + [0], height=0.5, distance=16)[0].tolist()
-    if len(peaks) == 0:
+def _find_peaks(
+    ott: pd.Series,
+    height: float = PEAKS_HEIGHT,
+    distance: int = PEAKS_DISTANCE,
+    prominence: Optional[float] = None,
+    fallback: bool = True,
+) -> list:
+    from scipy.signal import find_peaks
+
+    peaks = find_peaks(ott.tolist() + [0], height=height, distance=distance, prominence=prominence)[0].tolist()
+    if len(peaks) == 0 and fallback:
         peaks = [ott.argmax()]
     return peaks
 
 
-def _compute_peak_features(group: pd.DataFrame, peak: int) -> pd.Series:
-    res = group[["frameId", "ott", "ball_carrier_distance_to_endzone"]].iloc[peak]
-    res["mean_distance_to_ball_carrier_from_peak"] = group.iloc[peak:]["distance_to_ball_carrier"].mean()
-    res["ball_carrier_distance_won_to_last_frame"] = max(
-        res["ball_carrier_distance_to_endzone"] - group.iloc[-1]["ball_carrier_distance_to_endzone"], 0
+def _group_by_segment(values: np.ndarray, segment_codes: np.ndarray) -> SeriesGroupBy:
+    return pd.Series(values).groupby(segment_codes, sort=False)
+
+
+def _select_by_distance(
+    positions: np.ndarray, segments: np.ndarray, heights: np.ndarray, distance: float
+) -> np.ndarray:
+    # the highest peak is kept and the peaks closer than distance to it are removed, then the highest remaining
+    # peak and so on: every round keeps the peaks that are the highest of the remaining peaks around them
+    keys = positions + segments * distance
+    is_remaining = np.ones(len(positions), dtype=bool)
+    is_kept = np.zeros(len(positions), dtype=bool)
+    while is_remaining.any():
+        remaining = np.flatnonzero(is_remaining)
+        remaining_keys = keys[remaining]
+        starts = np.searchsorted(remaining_keys, remaining_keys - distance, side="right")
+        ends = np.searchsorted(remaining_keys, remaining_keys + distance, side="left")
+        windows_max = np.maximum.reduceat(np.append(heights[remaining], 0), np.stack([starts, ends], axis=1).ravel())
+        is_window_max = heights[remaining] >= windows_max[::2]
+
+        nb_kept = np.concatenate([[0], np.cumsum(is_window_max)])
+        is_removed = nb_kept[ends] - nb_kept[starts] > 0
+        is_kept[remaining[is_window_max]] = True
+        is_remaining[remaining[is_removed]] = False
+    return is_kept
+
+
+def find_segments_peaks(
+    values: np.ndarray,
+    offsets: np.ndarray,
+    height: float = PEAKS_HEIGHT,
+    distance: int = PEAKS_DISTANCE,
+    prominence: Optional[float] = None,
+    fallback: bool = True,
+) -> np.ndarray:
+    """Find the peaks of every segment of an array, as _find_peaks does on every segment separately.
+
+    Segments are values[offsets[i]:offsets[i + 1]]. Every segment is followed by a 0 and its peaks are detected
+    with the semantics of scipy.signal.find_peaks with height, distance and prominence, the first maximum of a
+    segment without any peak being its only peak with fallback.
+
+    Parameters
+    ----------
+    values : np.ndarray
+        Values of all segments, one after the other.
+    offsets : np.ndarray
+        Offsets of the segments in values, with the end of the last segment, the segments being non-empty.
+    height : float, optional
+        Minimal height of the peaks, by default 0.5.
+    distance : int, optional
+        Minimal distance between two peaks of a segment, the highest ones being kept, by default 16.
+    prominence : Optional[float], optional
+        Minimal prominence of the peaks, by default None.
+    fallback : bool, optional
+        Flag to make the first maximum of a segment without peaks its only peak, by default True.
+
+    Returns
+    -------
+    np.ndarray
+        Sorted positions of the peaks in values.
+    """
+    values = np.asarray(values, dtype=np.float64)
+    offsets = np.asarray(offsets, dtype=np.int64)
+    distance = np.ceil(distance)
+    nb_segments = len(offsets) - 1
+    segment_lengths = np.diff(offsets)
+
+    # plateaus are runs of equal values of a segment followed by its 0, NaN never being equal, and peaks are the
+    # middles of the plateaus higher than both their neighbors in the segment
+    padded_values = np.insert(values, offsets[1:], 0)
+    padded_offsets = offsets + np.arange(nb_segments + 1)
+    padded_segments = np.repeat(np.arange(nb_segments), segment_lengths + 1)
+    is_plateau_start = np.ones(len(padded_values), dtype=bool)
+    is_plateau_start[1:] = (padded_values[1:] != padded_values[:-1]) | (np.diff(padded_segments) != 0)
+    plateau_starts = np.flatnonzero(is_plateau_start)
+    plateau_ends = np.append(plateau_starts[1:], len(padded_values)) - 1
+    plateau_segments = padded_segments[plateau_starts]
+    plateau_values = padded_values[plateau_starts]
+
+    is_peak = (plateau_starts > padded_offsets[plateau_segments]) & (
+        plateau_ends < padded_offsets[plateau_segments + 1] - 1
     )
-    res = res.drop(index="ball_carrier_distance_to_endzone")
-    return res
+    is_peak[is_peak] = (padded_values[plateau_starts[is_peak] - 1] < plateau_values[is_peak]) & (
+        padded_values[plateau_ends[is_peak] + 1] < plateau_values[is_peak]
+    )
+    is_peak &= plateau_values >= height
 
+    peak_segments = plateau_segments[is_peak]
+    peaks = (plateau_starts[is_peak] + plateau_ends[is_peak]) // 2 - peak_segments
+    peak_heights = plateau_values[is_peak]
 
-def _compute_group_features(group: pd.DataFrame) -> pd.DataFrame:
-    group = group.sort_values("frameId")
-    peaks = _find_peaks(group["ott"])
-    res = pd.concat([_compute_peak_features(group, peak) for peak in peaks], axis=1)
-    res = res.T.reset_index(drop=True)
-    res.index.name = "opportunityId"
-    res = res.set_index("frameId", append=True)
-    return res
+    # find_peaks orders equal heights arbitrarily, segments with equal peaks heights are left to it
+    order = np.lexsort((peak_heights, peak_segments))
+    sorted_heights, sorted_segments = peak_heights[order], peak_segments[order]
+    is_tie = (sorted_heights[1:] == sorted_heights[:-1]) & (sorted_segments[1:] == sorted_segments[:-1])
+    tie_segments = np.unique(sorted_segments[1:][is_tie])
+    is_tie_segment = np.isin(peak_segments, tie_segments)
+    is_kept = ~is_tie_segment
+    is_kept[is_kept] = _select_by_distance(peaks[is_kept], peak_segments[is_kept], peak_heights[is_kept], distance)
+    peaks = peaks[is_kept]
+    if prominence is not None and len(peaks) > 0:
+        from scipy.signal import peak_prominences
 
+        # segments separated by NaN, which is never lower than a peak, bound the search of the bases of the peaks
+        separated_values = np.insert(padded_values, padded_offsets[1:-1], np.nan)
+        separated_peaks = peaks + 2 * (np.searchsorted(offsets, peaks, side="right") - 1)
+        peaks = peaks[peak_prominences(separated_values, separated_peaks)[0] >= prominence]
+    segments_peaks = [peaks]
+    for segment in tie_segments:
+        start, end = offsets[segment], offsets[segment + 1]
+        segment_peaks = _find_peaks(pd.Series(values[start:end]), height, distance, prominence, fallback=False)
+        segments_peaks.append(start + np.array(segment_peaks, dtype=np.int64))
+
+    # segments without peak get the first maximum, or their last value if they only have missing values
+    has_peak = np.zeros(nb_segments, dtype=bool)
+    has_peak[np.searchsorted(offsets, np.concatenate(segments_peaks), side="right") - 1] = True
+    no_peak_segments = np.flatnonzero(~has_peak)
+    if fallback and len(no_peak_segments) > 0:
+        comparable_values = np.where(np.isnan(values), -np.inf, values)
+        segments_max = np.maximum.reduceat(comparable_values, offsets[:-1])
+        is_max = comparable_values == np.repeat(segments_max, segment_lengths)
+        first_max = np.minimum.reduceat(np.where(is_max, np.arange(len(values)), len(values)), offsets[:-1])
+        is_missing = np.logical_and.reduceat(np.isnan(values), offsets[:-1])
+        first_max = np.where(is_missing, offsets[1:] - 1, first_max)
+        segments_peaks.append(first_max[no_peak_segments])
+
+    return np.sort(np.concatenate(segments_peaks).astype(np.int64))
 
-def compute_mott_features_data(
-    features_data: pd.DataFrame, tackling_probability: pd.DataFrame, tackles: pd.DataFrame
-) -> pd.DataFrame:
-    """Compute MOTT (Missed Opportunities To Tackle) features for every identified tackling
-    opportunities for each defensive player.
+
+def compute_frames_mott_features(
+    features_data: pd.DataFrame, tackling_probability: pd.DataFrame
+) -> tuple[pd.DataFrame, np.ndarray]:
+    """Compute the MOTT features that every frame of a defensive player would have as a tackling opportunity.
 
     Parameters
     ----------
@@ -42,22 +167,106 @@ def compute_mott_features_data(
         DataFrame with computed movement features for defensive players.
     tackling_probability : pd.DataFrame
         DataFrame containing tackling probabilities.
-    tackles : pd.DataFrame
-        DataFrame containing information about tackles and assists.
+
+    Returns
+    -------
+    tuple[pd.DataFrame, np.ndarray]
+        DataFrame with the keys and MOTT features of the frames, sorted by player of every play and by frame, and
+        the offsets of the segments of frames of every player of a play, with the end of the last one.
+    """
+    frames = KeyedTable(tackling_probability, PLAYER_FRAME_KEYS).join(
+        features_data,
+        data_columns=PLAYER_FRAME_KEYS + ["distance_to_ball_carrier", "ball_carrier_distance_to_endzone"],
+    )
+
+    frames["ott"] = frames["tackling_probability"] / frames["distance_to_ball_carrier"]
+
+    # every player of a play is a segment of frames, as groups of groupby(["gameId", "playId", "nflId"])
+    frames = frames.dropna(subset=["gameId", "playId", "nflId"]).sort_values(
+        ["gameId", "playId", "nflId", "frameId"], kind="stable", ignore_index=True
+    )
+    segment_codes = frames.groupby(["gameId", "playId", "nflId"], sort=True).ngroup().to_numpy()
+    offsets = np.concatenate([[0], np.cumsum(np.bincount(segment_codes))]).astype(np.int64)
+
+    # reverse cumulative sums per segment give the sums from every frame to the last frame of its player
+    distances = frames["distance_to_ball_carrier"].to_numpy(dtype=np.float64)
+    is_distance = ~np.isnan(distances)
+    reversed_segment_codes = segment_codes[::-1]
+    distances_sums = _group_by_segment(np.where(is_distance, distances, 0)[::-1], reversed_segment_codes).cumsum()
+    distances_counts = _group_by_segment(is_distance[::-1].astype(np.int64), reversed_segment_codes).cumsum()
+    with np.errstate(invalid="ignore", divide="ignore"):
+        mean_distances = distances_sums.to_numpy()[::-1] / distances_counts.to_numpy()[::-1]
+
+    distances_to_endzone = frames["ball_carrier_distance_to_endzone"].to_numpy(dtype=np.float64)
+    distances_won = distances_to_endzone - np.repeat(distances_to_endzone[offsets[1:] - 1], np.diff(offsets))
+
+    frames_mott_features = pd.DataFrame(
+        {
+            "gameId": frames["gameId"],
+            "playId": frames["playId"],
+            "nflId": frames["nflId"],
+            "frameId": frames["frameId"].to_numpy(dtype=np.float64),
+            "ott": frames["ott"].to_numpy(dtype=np.float64),
+            "mean_distance_to_ball_carrier_from_peak": mean_distances,
+            "ball_carrier_distance_won_to_last_frame": np.where(0 > distances_won, 0, distances_won),
+        }
+    )
+    return frames_mott_features, offsets
+
+
+def select_opportunities(frames_mott_features: pd.DataFrame, offsets: np.ndarray, peaks: np.ndarray) -> pd.DataFrame:
+    """Select the MOTT features of the frames of the tackling opportunities.
+
+    Parameters
+    ----------
+    frames_mott_features : pd.DataFrame
+        DataFrame with MOTT features of every frame, as computed by compute_frames_mott_features.
+    offsets : np.ndarray
+        Offsets of the segments of frames of every player of a play, as computed by compute_frames_mott_features.
+    peaks : np.ndarray
+        Sorted positions of the frames of the tackling opportunities.
 
     Returns
     -------
     pd.DataFrame
-        DataFrame with MOTT features.
+        DataFrame with MOTT features of the opportunities, indexed by play, player, opportunity and frame.
     """
-    features_data = features_data[
-        ["gameId", "playId", "nflId", "frameId", "distance_to_ball_carrier", "ball_carrier_distance_to_endzone"]
-    ].merge(tackling_probability, on=["gameId", "playId", "nflId", "frameId"])
+    peak_segments = np.searchsorted(offsets, peaks, side="right") - 1
+    opportunities = frames_mott_features.iloc[peaks]
+    return pd.DataFrame(
+        {col: opportunities[col].to_numpy() for col in MOTT_FEATURES},
+        index=pd.MultiIndex.from_arrays(
+            [
+                opportunities["gameId"].array,
+                opportunities["playId"].array,
+                opportunities["nflId"].array,
+                np.arange(len(peaks)) - np.searchsorted(peak_segments, peak_segments),
+                opportunities["frameId"].to_numpy(),
+            ],
+            names=["gameId", "playId", "nflId", "opportunityId", "frameId"],
+        ),
+    )
+
 
-    features_data["ott"] = features_data["tackling_probability"] / features_data["distance_to_ball_carrier"]
+def label_opportunities(mott_features_data: pd.DataFrame, tackles: pd.DataFrame) -> pd.DataFrame:
+    """Label the tackling opportunities with the tackles and missed tackles of their players.
 
-    mott_features_data = features_data.groupby(["gameId", "playId", "nflId"]).apply(_compute_group_features)
+    The last opportunity of a player who tackled or assisted is the tackle and the previous ones, if the player
+    missed a tackle, are the missed tackles.
 
+    Parameters
+    ----------
+    mott_features_data : pd.DataFrame
+        DataFrame with MOTT features of the opportunities, as selected by select_opportunities.
+    tackles : pd.DataFrame
+        DataFrame containing information about tackles and assists.
+
+    Returns
+    -------
+    pd.DataFrame
+        DataFrame with MOTT features and 'tackle_or_assist' and 'pff_missedTackle' labels.
+    """
+    tackles = tackles.copy()
     tackles["tackle_or_assist"] = tackles[["tackle", "assist"]].max(axis=1)
     mott_features_data = mott_features_data.merge(
         tackles[(tackles["tackle_or_assist"] == 1)].set_index(["gameId", "playId", "nflId"])[["tackle_or_assist"]],
@@ -82,7 +291,54 @@ def compute_mott_features_data(
         "pff_missedTackle",
     ] = 0
 
-    return mott_features_data
+    return enforce_schema(mott_features_data, "mott_features_data")
+
+
+def compute_mott_features_data(
+    features_data: pd.DataFrame,
+    tackling_probability: pd.DataFrame,
+    tackles: pd.DataFrame,
+    peaks_height: float = PEAKS_HEIGHT,
+    peaks_distance: int = PEAKS_DISTANCE,
+    peaks_prominence: Optional[float] = None,
+    peaks_fallback: bool = True,
+) -> pd.DataFrame:
+    """Compute MOTT (Missed Opportunities To Tackle) features for every identified tackling
+    opportunities for each defensive player.
+
+    Parameters
+    ----------
+    features_data : pd.DataFrame
+        DataFrame with computed movement features for defensive players.
+    tackling_probability : pd.DataFrame
+        DataFrame containing tackling probabilities.
+    tackles : pd.DataFrame
+        DataFrame containing information about tackles and assists.
+    peaks_height : float, optional
+        Minimal opportunity to tackle of the peaks identified as tackling opportunities, by default 0.5.
+    peaks_distance : int, optional
+        Minimal number of frames between two tackling opportunities of a player, by default 16.
+    peaks_prominence : Optional[float], optional
+        Minimal prominence of the peaks identified as tackling opportunities, by default None.
+    peaks_fallback : bool, optional
+        Flag to make the frame of maximal opportunity to tackle the opportunity of a player without peaks, by
+        default True.
+
+    Returns
+    -------
+    pd.DataFrame
+        DataFrame with MOTT features.
+    """
+    frames_mott_features, offsets = compute_frames_mott_features(features_data, tackling_probability)
+    peaks = find_segments_peaks(
+        frames_mott_features["ott"].to_numpy(),
+        offsets,
+        peaks_height,
+        peaks_distance,
+        peaks_prominence,
+        peaks_fallback,
+    )
+    return label_opportunities(select_opportunities(frames_mott_features, offsets, peaks), tackles)
 
 
 def sample_training_data(mott_features_data: pd.DataFrame, negatives_multplier: int = 10) -> pd.DataFrame:
@@ -0,0 +1,176 @@
+from typing import Iterator
+
+import numpy as np
+import pandas as pd
+
+from expected_tackling.data.features import _select_nearest
+from expected_tackling.data.kernels import compute_angle_between_players, compute_distance_between_players
+from expected_tackling.data.play_store import PlayStore
+
+ROLES = ["defense", "offense", "blocker", "ball_carrier"]
+
+
+def _get_frame_play_codes(play_store: PlayStore) -> np.ndarray:
+    plays_nb_frames = (play_store.plays["frame_end"] - play_store.plays["frame_start"]).to_numpy()
+    return np.repeat(np.arange(len(play_store)), plays_nb_frames)
+
+
+def get_roles_masks(play_store: PlayStore) -> dict:
+    """Get the masks of the players of every role on every frame of a play store.
+
+    Parameters
+    ----------
+    play_store : PlayStore
+        Play store built from visualization tracking data, with defense flags and ball carrier index.
+
+    Returns
+    -------
+    dict
+        Dictionary of boolean arrays of shape [frames x players] for the roles 'defense', 'offense', 'blocker'
+        (offense players not carrying the ball) and 'ball_carrier'.
+    """
+    frame_play_codes = _get_frame_play_codes(play_store)
+
+    is_player = play_store.is_present & ~np.isnan(play_store.nfl_ids)[frame_play_codes]
+    is_defense = play_store.is_defense[frame_play_codes]
+    is_ball_carrier = np.arange(play_store.tensor.shape[1]) == play_store.ball_carrier_index[:, None]
+
+    return {
+        "defense": is_player & is_defense,
+        "offense": is_player & ~is_defense,
+        "blocker": is_player & ~is_defense & ~is_ball_carrier,
+        "ball_carrier": is_player & is_ball_carrier,
+    }
+
+
+def _iterate_sources_distances(
+    play_store: PlayStore, source_role: str, target_role: str, chunk_size: int
+) -> Iterator[tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]]:
+    if source_role not in ROLES or target_role not in ROLES:
+        raise ValueError(f"roles must be in {ROLES}")
+
+    roles_masks = get_roles_masks(play_store)
+    x = play_store.get_channel("x").astype(float)
+    y = play_store.get_channel("y").astype(float)
+
+    # at least one chunk, even empty, so that the queries return DataFrames with their columns
+    for start in range(0, max(len(play_store.frame_ids), 1), chunk_size):
+        frames = slice(start, start + chunk_size)
+        source_frames, source_slots = np.nonzero(roles_masks[source_role][frames])
+
+        source_x = x[frames][source_frames, source_slots, None]
+        source_y = y[frames][source_frames, source_slots, None]
+        targets_x = x[frames][source_frames]
+        targets_y = y[frames][source_frames]
+        distances = compute_distance_between_players(source_x, source_y, targets_x, targets_y)
+        directions = compute_angle_between_players(source_x, source_y, targets_x, targets_y)
+
+        # players that are not targets, as the source itself, are ranked after all targets
+        ranking = np.where(roles_masks[target_role][frames][source_frames], distances, np.inf)
+        ranking[np.arange(len(source_slots)), source_slots] = np.inf
+
+        yield source_frames + start, source_slots, ranking, directions
+
+
+def _get_sources_keys(play_store: PlayStore, source_frames: np.ndarray, source_slots: np.ndarray) -> pd.DataFrame:
+    play_codes = _get_frame_play_codes(play_store)[source_frames]
+    return pd.DataFrame(
+        {
+            "gameId": play_store.plays.index.get_level_values("gameId").to_numpy()[play_codes],
+            "playId": play_store.plays.index.get_level_values("playId").to_numpy()[play_codes],
+            "nflId": play_store.nfl_ids[play_codes, source_slots],
+            "frameId": play_store.frame_ids[source_frames],
+        }
+    )
+
+
+def query_nearest_neighbors(
+    play_store: PlayStore, source_role: str, target_role: str, k: int = 3, chunk_size: int = 50000
+) -> pd.DataFrame:
+    """Query the k nearest players of a target role of every player of a source role, on all frames at once.
+
+    With at most a few dozen players per frame, distances between all players of a frame are computed in batch
+    over frames, which is faster than building a spatial index per frame.
+
+    Parameters
+    ----------
+    play_store : PlayStore
+        Play store built from visualization tracking data, with defense flags and ball carrier index.
+    source_role : str
+        Role of the players whose neighbors are queried, in ROLES.
+    target_role : str
+        Role of the neighbors, in ROLES. Players are not their own neighbors, so that the same role queries
+        teammates.
+    k : int, optional
+        Number of neighbors, by default 3.
+    chunk_size : int, optional
+        Number of frames processed at once, by default 50000.
+
+    Returns
+    -------
+    pd.DataFrame
+        DataFrame with one row per source player and frame, and for every neighbor i its 'nflId_{target_role}_i',
+        'distance_to_{target_role}_i' and 'direction_to_{target_role}_i', NaN when there are less than k targets.
+    """
+    neighbors_data = []
+    for source_frames, source_slots, ranking, directions in _iterate_sources_distances(
+        play_store, source_role, target_role, chunk_size
+    ):
+        if ranking.shape[1] < k:
+            ranking = np.pad(ranking, ((0, 0), (0, k - ranking.shape[1])), constant_values=np.inf)
+            directions = np.pad(directions, ((0, 0), (0, k - directions.shape[1])), constant_values=np.nan)
+        nearest = _select_nearest(ranking, k)
+        nearest_distances = np.take_along_axis(ranking, nearest, axis=1)
+        is_neighbor = nearest_distances != np.inf
+
+        play_codes = _get_frame_play_codes(play_store)[source_frames]
+        nfl_ids = np.pad(play_store.nfl_ids, ((0, 0), (0, max(k - play_store.nfl_ids.shape[1], 0))))
+
+        chunk_neighbors_data = _get_sources_keys(play_store, source_frames, source_slots)
+        for i in range(k):
+            chunk_neighbors_data[f"nflId_{target_role}_{i + 1}"] = np.where(
+                is_neighbor[:, i], nfl_ids[play_codes, nearest[:, i]], np.nan
+            )
+            chunk_neighbors_data[f"distance_to_{target_role}_{i + 1}"] = np.where(
+                is_neighbor[:, i], nearest_distances[:, i], np.nan
+            )
+            chunk_neighbors_data[f"direction_to_{target_role}_{i + 1}"] = np.where(
+                is_neighbor[:, i], directions[np.arange(len(nearest)), nearest[:, i]], np.nan
+            )
+        neighbors_data.append(chunk_neighbors_data)
+
+    return pd.concat(neighbors_data, ignore_index=True)
+
+
+def count_neighbors_within_radius(
+    play_store: PlayStore, source_role: str, target_role: str, radius: float, chunk_size: int = 50000
+) -> pd.DataFrame:
+    """Count the players of a target role within a radius of every player of a source role, on all frames at once.
+
+    Parameters
+    ----------
+    play_store : PlayStore
+        Play store built from visualization tracking data, with defense flags and ball carrier index.
+    source_role : str
+        Role of the players whose neighbors are counted, in ROLES.
+    target_role : str
+        Role of the neighbors, in ROLES. Players are not their own neighbors.
+    radius : float
+        Radius in yards.
+    chunk_size : int, optional
+        Number of frames processed at once, by default 50000.
+
+    Returns
+    -------
+    pd.DataFrame
+        DataFrame with one row per source player and frame and the column 'nb_{target_role}_within_{radius}'.
+    """
+    neighbors_data = []
+    for source_frames, source_slots, ranking, _ in _iterate_sources_distances(
+        play_store, source_role, target_role, chunk_size
+    ):
+        chunk_neighbors_data = _get_sources_keys(play_store, source_frames, source_slots)
+        chunk_neighbors_data[f"nb_{target_role}_within_{radius}"] = (ranking <= radius).sum(axis=1)
+        neighbors_data.append(chunk_neighbors_data)
+
+    return pd.concat(neighbors_data, ignore_index=True)
@@ -0,0 +1,306 @@
+"""Export CatBoost models to NumPy arrays of oblivious trees, scored without importing catboost.
+
+    python src/expected_tackling/data/oblivious_trees.py models/model_probability.pkl models/model_mott.pkl
+
+writes models/model_probability.npz and models/model_mott.npz, loaded with ObliviousTrees.load.
+"""
+
+import argparse
+import json
+import pickle
+import tempfile
+from pathlib import Path
+from typing import Any, Optional
+
+import numpy as np
+import pandas as pd
+
+# rows scored together, bounding the [trees x rows] arrays of leaves
+ROWS_CHUNK_SIZE = 4096
+
+
+class ObliviousTrees:
+    """Class scoring an ensemble of oblivious trees, as CatBoost models, on float32 feature matrices."""
+
+    def __init__(
+        self,
+        split_features: np.ndarray,
+        split_borders: np.ndarray,
+        split_nan_values: np.ndarray,
+        leaf_values: np.ndarray,
+        scale: float,
+        bias: np.ndarray,
+        feature_names: list,
+        class_names: Optional[list] = None,
+    ) -> None:
+        """Initialize the ObliviousTrees object.
+
+        The split of depth d of a tree sends a row to the leaves whose d-th bit is set when its feature is greater
+        than the border, or when it is missing and the split sends missing values there. Trees shallower than the
+        deepest one have splits with infinite borders, which never set their bit.
+
+        Parameters
+        ----------
+        split_features : np.ndarray
+            [trees x depth] array of the feature indices of the splits.
+        split_borders : np.ndarray
+            [trees x depth] float32 array of the borders of the splits.
+        split_nan_values : np.ndarray
+            [trees x depth] boolean array of the bits set by missing values.
+        leaf_values : np.ndarray
+            [trees x 2 ** depth x dimensions] array of the values of the leaves.
+        scale : float
+            Scale of the sum of the leaf values.
+        bias : np.ndarray
+            Bias of every dimension added to the scaled sum of the leaf values.
+        feature_names : list
+            Names of the features, in the order of the columns of feature matrices.
+        class_names : Optional[list], optional
+            Labels of the classes of a classifier, by default None.
+        """
+        self.split_features = np.asarray(split_features, dtype=np.int32)
+        self.split_borders = np.asarray(split_borders, dtype=np.float32)
+        self.split_nan_values = np.asarray(split_nan_values, dtype=bool)
+        self.leaf_values = np.asarray(leaf_values, dtype=np.float64)
+        self.scale = float(scale)
+        self.bias = np.asarray(bias, dtype=np.float64)
+        self.feature_names = list(feature_names)
+        self.class_names = list(class_names) if class_names is not None else None
+
+        nb_trees, depth = self.split_features.shape
+        self.flat_leaf_values = self.leaf_values.reshape(nb_trees * 2**depth, -1)
+        self.tree_offsets = np.arange(nb_trees, dtype=np.int64) * 2**depth
+
+    @classmethod
+    def from_json(
+        cls, model_json: dict, feature_names: Optional[list] = None, class_names: Optional[list] = None
+    ) -> "ObliviousTrees":
+        """Create the ensemble of a model saved by CatBoost in the JSON format.
+
+        Parameters
+        ----------
+        model_json : dict
+            Content of the JSON file of the model.
+        feature_names : Optional[list], optional
+            Names of the features, by default None for the feature identifiers of the JSON file.
+        class_names : Optional[list], optional
+            Labels of the classes of a classifier, by default None.
+
+        Returns
+        -------
+        ObliviousTrees
+            Ensemble of the oblivious trees of the model.
+        """
+        features_info = model_json["features_info"]
+        if len(features_info.get("categorical_features", [])) > 0:
+            raise ValueError("models with categorical features are not supported")
+        float_features = features_info["float_features"]
+        if feature_names is None:
+            feature_names = [
+                feature.get("feature_id", str(feature["flat_feature_index"])) for feature in float_features
+            ]
+
+        trees = model_json["oblivious_trees"]
+        depth = max([len(tree["splits"]) for tree in trees], default=0)
+        nb_dimensions = len(model_json["scale_and_bias"][1])
+        split_features = np.zeros((len(trees), depth), dtype=np.int32)
+        split_borders = np.full((len(trees), depth), np.inf, dtype=np.float32)
+        split_nan_values = np.zeros((len(trees), depth), dtype=bool)
+        leaf_values = np.zeros((len(trees), 2**depth, nb_dimensions))
+        for i, tree in enumerate(trees):
+            for d, split in enumerate(tree["splits"]):
+                if split["split_type"] != "FloatFeature":
+                    raise ValueError(f"splits of type {split['split_type']} are not supported")
+                feature = float_features[split["float_feature_index"]]
+                split_features[i, d] = feature["flat_feature_index"]
+                split_borders[i, d] = split["border"]
+                split_nan_values[i, d] = feature.get("nan_value_treatment") == "AsTrue"
+            tree_leaf_values = np.reshape(tree["leaf_values"], (-1, nb_dimensions))
+            leaf_values[i, : len(tree_leaf_values)] = tree_leaf_values
+
+        scale, bias = model_json["scale_and_bias"]
+        return cls(
+            split_features, split_borders, split_nan_values, leaf_values, scale, bias, feature_names, class_names
+        )
+
+    @classmethod
+    def from_catboost(cls, model: Any) -> "ObliviousTrees":
+        """Export the oblivious trees of a trained CatBoost model.
+
+        Parameters
+        ----------
+        model : Any
+            Trained CatBoostClassifier or CatBoostRegressor with symmetric trees and numerical features.
+
+        Returns
+        -------
+        ObliviousTrees
+            Ensemble of the oblivious trees of the model.
+        """
+        with tempfile.TemporaryDirectory() as directory:
+            json_path = Path(directory) / "model.json"
+            model.save_model(str(json_path), format="json")
+            with open(json_path) as file:
+                model_json = json.load(file)
+        class_names = getattr(model, "classes_", None)
+        return cls.from_json(model_json, model.feature_names_, list(class_names) if class_names is not None else None)
+
+    def save(self, path: str | Path) -> None:
+        """Save the arrays of the ensemble in a NumPy .npz file.
+
+        Parameters
+        ----------
+        path : str | Path
+            Path of the file.
+        """
+        arrays = {
+            "split_features": self.split_features,
+            "split_borders": self.split_borders,
+            "split_nan_values": self.split_nan_values,
+            "leaf_values": self.leaf_values,
+            "scale": np.array(self.scale),
+            "bias": self.bias,
+            "feature_names": np.array(self.feature_names, dtype=str),
+        }
+        if self.class_names is not None:
+            arrays["class_names"] = np.array(self.class_names)
+        with open(path, "wb") as file:
+            np.savez(file, **arrays)
+
+    @classmethod
+    def load(cls, path: str | Path) -> "ObliviousTrees":
+        """Load an ensemble saved in a NumPy .npz file.
+
+        Parameters
+        ----------
+        path : str | Path
+            Path of the file.
+
+        Returns
+        -------
+        ObliviousTrees
+            Ensemble of oblivious trees.
+        """
+        with np.load(path, allow_pickle=False) as arrays:
+            return cls(
+                arrays["split_features"],
+                arrays["split_borders"],
+                arrays["split_nan_values"],
+                arrays["leaf_values"],
+                arrays["scale"],
+                arrays["bias"],
+                arrays["feature_names"].tolist(),
+                arrays["class_names"].tolist() if "class_names" in arrays else None,
+            )
+
+    def _to_matrix(self, features: pd.DataFrame | np.ndarray) -> np.ndarray:
+        if isinstance(features, pd.DataFrame):
+            return features[self.feature_names].to_numpy(dtype=np.float32)
+        return np.atleast_2d(np.asarray(features, dtype=np.float32))
+
+    def predict_raw(self, features: pd.DataFrame | np.ndarray) -> np.ndarray:
+        """Compute the raw scores of the ensemble, scaled sums of the leaf values plus the bias.
+
+        Parameters
+        ----------
+        features : pd.DataFrame | np.ndarray
+            DataFrame with the features columns, or [rows x features] matrix in the order of feature_names.
+
+        Returns
+        -------
+        np.ndarray
+            [rows x dimensions] array of raw scores.
+        """
+        features = self._to_matrix(features)
+        has_nan_values = self.split_nan_values.any()
+        raw_scores = np.empty((len(features), self.flat_leaf_values.shape[1]))
+        for start in range(0, len(features), ROWS_CHUNK_SIZE):
+            # splits of a depth are compared at once for all trees on features transposed to [features x rows]
+            chunk = np.ascontiguousarray(features[start : start + ROWS_CHUNK_SIZE].T)
+            leaves = np.repeat(self.tree_offsets[:, None], chunk.shape[1], axis=1)
+            for depth in range(self.split_features.shape[1]):
+                split_values = chunk[self.split_features[:, depth]]
+                is_greater = split_values > self.split_borders[:, depth, None]
+                if has_nan_values:
+                    is_greater |= np.isnan(split_values) & self.split_nan_values[:, depth, None]
+                leaves |= is_greater.astype(np.int64) << depth
+            raw_scores[start : start + ROWS_CHUNK_SIZE] = self.flat_leaf_values[leaves].sum(axis=0)
+        return self.scale * raw_scores + self.bias
+
+    def predict_proba(self, features: pd.DataFrame | np.ndarray) -> np.ndarray:
+        """Compute the probabilities of the classes, as CatBoostClassifier.predict_proba.
+
+        Parameters
+        ----------
+        features : pd.DataFrame | np.ndarray
+            DataFrame with the features columns, or [rows x features] matrix in the order of feature_names.
+
+        Returns
+        -------
+        np.ndarray
+            [rows x classes] array of probabilities.
+        """
+        raw_scores = self.predict_raw(features)
+        if raw_scores.shape[1] == 1:
+            probabilities = 1 / (1 + np.exp(-raw_scores[:, 0]))
+            return np.stack([1 - probabilities, probabilities], axis=1)
+        exp_scores = np.exp(raw_scores - raw_scores.max(axis=1, keepdims=True))
+        return exp_scores / exp_scores.sum(axis=1, keepdims=True)
+
+    def predict(self, features: pd.DataFrame | np.ndarray) -> np.ndarray:
+        """Predict the classes, as CatBoostClassifier.predict, or the values of a regressor.
+
+        Parameters
+        ----------
+        features : pd.DataFrame | np.ndarray
+            DataFrame with the features columns, or [rows x features] matrix in the order of feature_names.
+
+        Returns
+        -------
+        np.ndarray
+            Array of predicted class labels, or of predicted values without classes.
+        """
+        raw_scores = self.predict_raw(features)
+        if self.class_names is None:
+            return raw_scores[:, 0] if raw_scores.shape[1] == 1 else raw_scores
+        classes = (raw_scores[:, 0] > 0).astype(np.int64) if raw_scores.shape[1] == 1 else raw_scores.argmax(axis=1)
+        return np.asarray(self.class_names)[classes]
+
+
+def load_model(path: str | Path) -> Any:
+    """Load a model, exported oblivious trees from a .npz file or a pickled model otherwise.
+
+    Parameters
+    ----------
+    path : str | Path
+        Path of the model file.
+
+    Returns
+    -------
+    Any
+        Model with predict and predict_proba methods.
+    """
+    if Path(path).suffix == ".npz":
+        return ObliviousTrees.load(path)
+    with open(path, "rb") as file:
+        return pickle.load(file)
+
+
+def main(model_paths: list) -> None:
+    """Export pickled CatBoost models to .npz files of oblivious trees next to them.
+
+    Parameters
+    ----------
+    model_paths : list
+        Paths of the pickled models, as "models/model_probability.pkl".
+    """
+    for model_path in model_paths:
+        with open(model_path, "rb") as file:
+            model = pickle.load(file)
+        ObliviousTrees.from_catboost(model).save(Path(model_path).with_suffix(".npz"))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("model_paths", nargs="+", help="paths of the pickled CatBoost models")
+    main(parser.parse_args().model_paths)
@@ -0,0 +1,245 @@
+import math
+
+import numpy as np
+import pandas as pd
+
+from expected_tackling.data.mott_features import MOTT_FEATURES, PEAKS_DISTANCE, PEAKS_HEIGHT
+
+OPPORTUNITIES_INDEX = ["gameId", "playId", "nflId", "opportunityId", "frameId"]
+
+
+class _DefenderState:
+    def __init__(self) -> None:
+        self.frame_ids: list[int] = []
+        self.ott: list[float] = []
+        self.distances_to_endzone: list[float] = []
+        # sums and counts of the known distances to the ball carrier up to every frame, excluded
+        self.distances_sums = [0.0]
+        self.distances_counts = [0]
+        self.plateau_start = 0
+        self.is_rising = False
+        # positions and heights of the peaks not yet confirmed or discarded
+        self.candidates: list[tuple[int, float]] = []
+        self.opportunities: list[int] = []
+        self.first_max = -1
+
+    def __len__(self) -> int:
+        return len(self.frame_ids)
+
+
+class OpportunityDetector:
+    """Class detecting tackling opportunities of defenders while a play is received frame by frame."""
+
+    def __init__(
+        self, height: float = PEAKS_HEIGHT, distance: int = PEAKS_DISTANCE, latency: int = PEAKS_DISTANCE
+    ) -> None:
+        """Initialize the OpportunityDetector object.
+
+        Opportunities are the peaks of the OTT of every defender, as found by compute_mott_features_data: middles of
+        plateaus higher than height and than both their neighbors, the play being followed by a 0. A peak is
+        confirmed or discarded latency frames after it, or when its plateau ends if later, from the peaks known at
+        that frame: it is discarded if a higher peak within distance frames of it is kept among them, as
+        scipy.signal.find_peaks selects peaks from the highest one, or if it is within distance frames after a
+        confirmed opportunity. With a latency of at least distance frames, opportunities are the ones found by
+        compute_mott_features_data, but for two cases. On chains of rising peaks closer than distance frames, a peak
+        is discarded by the next one even when that one is discarded later by an even higher peak, while
+        scipy.signal.find_peaks selects the highest peak first and keeps the first one. A peak in the middle of a
+        plateau still growing latency frames after a previous peak is not known yet and cannot discard it. Besides,
+        the last of peaks of equal heights closer than distance frames is kept, while the unstable sort of
+        scipy.signal.find_peaks may keep another one on plays with many peaks. When a play is closed, a defender
+        without opportunity gets the first maximum of its OTT.
+
+        Parameters
+        ----------
+        height : float, optional
+            Minimal OTT of the opportunities, by default 0.5.
+        distance : int, optional
+            Minimal number of frames between two opportunities of a defender, by default 16.
+        latency : int, optional
+            Number of frames received after a peak before it is confirmed as an opportunity or discarded, by default
+            16.
+        """
+        if distance < 1:
+            raise ValueError("distance must be at least 1")
+        if latency < 0:
+            raise ValueError("latency must be positive")
+        self.height = height
+        self.distance = math.ceil(distance)
+        self.latency = latency
+        self.defenders: dict[tuple, _DefenderState] = {}
+
+    def _add_candidate(self, state: _DefenderState, position: int, height: float) -> None:
+        if len(state.opportunities) > 0 and position - state.opportunities[-1] < self.distance:
+            return
+        state.candidates.append((position, height))
+
+    def _end_plateau(self, state: _DefenderState, value: float) -> None:
+        # the plateau of the previous frames ends with value, which starts a new one
+        position = len(state) - 1
+        plateau_value = state.ott[state.plateau_start]
+        if state.is_rising and value < plateau_value and plateau_value >= self.height:
+            self._add_candidate(state, (state.plateau_start + position) // 2, plateau_value)
+        state.is_rising = plateau_value < value
+        state.plateau_start = position + 1
+
+    def _confirm_candidates(self, state: _DefenderState, key: tuple, is_closed: bool = False) -> list:
+        # candidates are selected as scipy.signal.find_peaks does, from the highest one and the last of equal ones,
+        # among the candidates known, a selection being final latency frames after the candidate
+        order = sorted(range(len(state.candidates)), key=lambda i: state.candidates[i][::-1], reverse=True)
+        is_kept = [False] * len(state.candidates)
+        is_final = [False] * len(state.candidates)
+        for rank, i in enumerate(order):
+            position = state.candidates[i][0]
+            higher_candidates = [j for j in order[:rank] if abs(state.candidates[j][0] - position) < self.distance]
+            is_kept[i] = not any(is_kept[j] for j in higher_candidates) and not (
+                len(state.opportunities) > 0 and position - state.opportunities[-1] < self.distance
+            )
+            is_final[i] = is_closed or position + self.latency <= len(state) - 1
+
+        # opportunities are confirmed in the order of their frames
+        confirmed = []
+        nb_final = 0
+        while nb_final < len(state.candidates) and is_final[nb_final]:
+            if is_kept[nb_final]:
+                position = state.candidates[nb_final][0]
+                confirmed.append((*key, len(state.opportunities), state.frame_ids[position]))
+                state.opportunities.append(position)
+            nb_final += 1
+        del state.candidates[:nb_final]
+        return confirmed
+
+    def update(
+        self,
+        game_id: int,
+        play_id: int,
+        nfl_id: int,
+        frame_id: int,
+        ott: float,
+        distance_to_ball_carrier: float,
+        ball_carrier_distance_to_endzone: float,
+    ) -> list:
+        """Receive the next frame of a defender and confirm the opportunities it reveals.
+
+        Parameters
+        ----------
+        game_id : int
+            Game identifier.
+        play_id : int
+            Play identifier.
+        nfl_id : int
+            Defender identifier.
+        frame_id : int
+            Frame identifier, greater than the previous frame received for the defender.
+        ott : float
+            Opportunity to tackle of the defender on the frame.
+        distance_to_ball_carrier : float
+            Distance between the defender and the ball carrier on the frame.
+        ball_carrier_distance_to_endzone : float
+            Distance between the ball carrier and the endzone on the frame.
+
+        Returns
+        -------
+        list
+            List of the (gameId, playId, nflId, opportunityId, frameId) keys of the opportunities confirmed.
+        """
+        key = (game_id, play_id, nfl_id)
+        state = self.defenders.setdefault(key, _DefenderState())
+        if len(state) > 0 and frame_id <= state.frame_ids[-1]:
+            raise ValueError(f"frame {frame_id} of defender {key} is not after frame {state.frame_ids[-1]}")
+
+        if len(state) > 0 and not ott == state.ott[-1]:
+            self._end_plateau(state, ott)
+        state.frame_ids.append(frame_id)
+        state.ott.append(ott)
+        state.distances_to_endzone.append(ball_carrier_distance_to_endzone)
+        is_distance = not math.isnan(distance_to_ball_carrier)
+        state.distances_sums.append(state.distances_sums[-1] + (distance_to_ball_carrier if is_distance else 0.0))
+        state.distances_counts.append(state.distances_counts[-1] + is_distance)
+        if not math.isnan(ott) and (state.first_max < 0 or ott > state.ott[state.first_max]):
+            state.first_max = len(state) - 1
+
+        return self._confirm_candidates(state, key)
+
+    def update_frame(self, frame_data: pd.DataFrame) -> list:
+        """Receive the next frame of several defenders and confirm the opportunities it reveals.
+
+        Parameters
+        ----------
+        frame_data : pd.DataFrame
+            DataFrame with one row per defender and the columns 'gameId', 'playId', 'nflId', 'frameId', 'ott',
+            'distance_to_ball_carrier' and 'ball_carrier_distance_to_endzone'.
+
+        Returns
+        -------
+        list
+            List of the (gameId, playId, nflId, opportunityId, frameId) keys of the opportunities confirmed.
+        """
+        confirmed = []
+        columns = ["gameId", "playId", "nflId", "frameId", "ott"]
+        columns += ["distance_to_ball_carrier", "ball_carrier_distance_to_endzone"]
+        for row in frame_data[columns].itertuples(index=False):
+            confirmed.extend(self.update(*row))
+        return confirmed
+
+    def _get_records(self, key: tuple, state: _DefenderState) -> list:
+        records = []
+        for opportunity_id, position in enumerate(state.opportunities):
+            distances_count = state.distances_counts[-1] - state.distances_counts[position]
+            distances_sum = state.distances_sums[-1] - state.distances_sums[position]
+            distance_won = state.distances_to_endzone[position] - state.distances_to_endzone[-1]
+            records.append(
+                (
+                    *key,
+                    opportunity_id,
+                    float(state.frame_ids[position]),
+                    state.ott[position],
+                    distances_sum / distances_count if distances_count > 0 else np.nan,
+                    max(distance_won, 0),
+                )
+            )
+        return records
+
+    def _to_dataframe(self, records: list) -> pd.DataFrame:
+        return pd.DataFrame.from_records(records, columns=OPPORTUNITIES_INDEX + MOTT_FEATURES).set_index(
+            OPPORTUNITIES_INDEX
+        )
+
+    def get_opportunities(self) -> pd.DataFrame:
+        """Get the opportunities confirmed on the plays received so far, with their MOTT features up to now.
+
+        Returns
+        -------
+        pd.DataFrame
+            DataFrame indexed as compute_mott_features_data with the OTT of the opportunities, the mean distance
+            between the defender and the ball carrier from the opportunity and the distance won by the ball carrier
+            since the opportunity.
+        """
+        records = []
+        for key, state in self.defenders.items():
+            records.extend(self._get_records(key, state))
+        return self._to_dataframe(records)
+
+    def close_play(self, game_id: int, play_id: int) -> pd.DataFrame:
+        """End a play, confirming its remaining opportunities, and get their final MOTT features.
+
+        Parameters
+        ----------
+        game_id : int
+            Game identifier.
+        play_id : int
+            Play identifier.
+
+        Returns
+        -------
+        pd.DataFrame
+            DataFrame of the opportunities of the play, as get_opportunities.
+        """
+        records = []
+        for key in [key for key in self.defenders if key[:2] == (game_id, play_id)]:
+            state = self.defenders.pop(key)
+            self._end_plateau(state, 0)
+            self._confirm_candidates(state, key, is_closed=True)
+            if len(state.opportunities) == 0:
+                state.opportunities.append(state.first_max if state.first_max >= 0 else len(state) - 1)
+            records.extend(self._get_records(key, state))
+        return self._to_dataframe(records)
@@ -0,0 +1,132 @@
+import concurrent.futures
+import itertools
+import os
+from typing import Any, Optional
+
+import numpy as np
+import pandas as pd
+from scipy.stats import rankdata
+
+from expected_tackling.data.mott_features import (
+    PEAKS_DISTANCE,
+    PEAKS_HEIGHT,
+    compute_frames_mott_features,
+    find_segments_peaks,
+    label_opportunities,
+    select_opportunities,
+)
+
+PEAKS_PARAMETERS = ["height", "distance", "prominence", "fallback"]
+SCORES = ["nb_opportunities", "nb_missed_tackles", "roc_auc"]
+
+# frames MOTT features, segments offsets and tackles shared by the configurations scored in a worker process
+_segments: dict[str, Any] = {}
+
+
+def _set_segments(frames_mott_features: pd.DataFrame, offsets: np.ndarray, tackles: pd.DataFrame) -> None:
+    _segments.update(frames_mott_features=frames_mott_features, offsets=offsets, tackles=tackles)
+
+
+def score_opportunities(mott_features_data: pd.DataFrame) -> dict:
+    """Score the tackling opportunities against their missed tackles labels.
+
+    The score is the ROC AUC of the OTT of the opportunities as a predictor of 'pff_missedTackle', opportunities
+    with a missing OTT being ignored.
+
+    Parameters
+    ----------
+    mott_features_data : pd.DataFrame
+        DataFrame with MOTT features and labels of the opportunities, as computed by compute_mott_features_data.
+
+    Returns
+    -------
+    dict
+        Dictionary with the number of opportunities, the number of missed tackles and the ROC AUC, NaN without
+        missed tackles or without other opportunities.
+    """
+    ott = mott_features_data["ott"].to_numpy(dtype=np.float64)
+    is_missed_tackle = mott_features_data["pff_missedTackle"].to_numpy() == 1
+    is_scored = ~np.isnan(ott)
+    nb_positives = int(is_missed_tackle[is_scored].sum())
+    nb_negatives = int(is_scored.sum()) - nb_positives
+
+    roc_auc = np.nan
+    if nb_positives > 0 and nb_negatives > 0:
+        ranks = rankdata(ott[is_scored])
+        roc_auc = (ranks[is_missed_tackle[is_scored]].sum() - nb_positives * (nb_positives + 1) / 2) / (
+            nb_positives * nb_negatives
+        )
+    return {
+        "nb_opportunities": len(mott_features_data),
+        "nb_missed_tackles": int(is_missed_tackle.sum()),
+        "roc_auc": roc_auc,
+    }
+
+
+def _score_peaks_parameters(parameters: tuple) -> dict:
+    height, distance, prominence, fallback = parameters
+    frames_mott_features, offsets = _segments["frames_mott_features"], _segments["offsets"]
+    peaks = find_segments_peaks(frames_mott_features["ott"].to_numpy(), offsets, height, distance, prominence, fallback)
+    mott_features_data = label_opportunities(
+        select_opportunities(frames_mott_features, offsets, peaks), _segments["tackles"]
+    )
+    return {**dict(zip(PEAKS_PARAMETERS, parameters)), **score_opportunities(mott_features_data)}
+
+
+def search_peaks_parameters(
+    features_data: pd.DataFrame,
+    tackling_probability: pd.DataFrame,
+    tackles: pd.DataFrame,
+    heights: list = [PEAKS_HEIGHT],
+    distances: list = [PEAKS_DISTANCE],
+    prominences: list = [None],
+    fallbacks: list = [True],
+    nb_process: Optional[int] = None,
+) -> pd.DataFrame:
+    """Score every configuration of a grid of peak detection parameters on the tackling opportunities it finds.
+
+    MOTT features of every frame are computed once and shared by worker processes, which only detect the peaks and
+    label the opportunities of the configurations, scored by score_opportunities.
+
+    Parameters
+    ----------
+    features_data : pd.DataFrame
+        DataFrame with computed movement features for defensive players.
+    tackling_probability : pd.DataFrame
+        DataFrame containing tackling probabilities.
+    tackles : pd.DataFrame
+        DataFrame containing information about tackles and assists.
+    heights : list, optional
+        Minimal opportunities to tackle of the peaks, by default [0.5].
+    distances : list, optional
+        Minimal numbers of frames between two peaks of a player, by default [16].
+    prominences : list, optional
+        Minimal prominences of the peaks, None for no minimum, by default [None].
+    fallbacks : list, optional
+        Flags to make the frame of maximal opportunity to tackle the opportunity of a player without peaks, by
+        default [True].
+    nb_process : Optional[int], optional
+        Number of worker processes, by default None for the number of processors.
+
+    Returns
+    -------
+    pd.DataFrame
+        DataFrame with the parameters and the scores of every configuration, ranked by decreasing ROC AUC.
+    """
+    frames_mott_features, offsets = compute_frames_mott_features(features_data, tackling_probability)
+    # peaks are detected on the exact OTT while the other features end as float32 in MOTT features data
+    frames_mott_features = frames_mott_features.astype(
+        {"mean_distance_to_ball_carrier_from_peak": np.float32, "ball_carrier_distance_won_to_last_frame": np.float32}
+    )
+
+    grid = list(itertools.product(heights, distances, prominences, fallbacks))
+    nb_process = nb_process if nb_process is not None else os.cpu_count() or 1
+    with concurrent.futures.ProcessPoolExecutor(
+        max(min(nb_process, len(grid)), 1),
+        initializer=_set_segments,
+        initargs=(frames_mott_features, offsets, tackles),
+    ) as executor:
+        scores = list(executor.map(_score_peaks_parameters, grid, chunksize=max(len(grid) // (4 * nb_process), 1)))
+
+    scores = pd.DataFrame.from_records(scores, columns=PEAKS_PARAMETERS + SCORES)
+    return scores.sort_values("roc_auc", ascending=False, kind="stable", na_position="last", ignore_index=True)
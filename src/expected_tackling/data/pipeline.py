@@ -0,0 +1,439 @@
+import hashlib
+import pickle
+from pathlib import Path
+from typing import Any, Callable, Optional
+
+import pandas as pd
+
+from expected_tackling.data.features import FEATURES_VERSION, compute_features_data_with_multiprocessing, create_target
+from expected_tackling.data.joins import PLAYER_FRAME_KEYS, KeyedTable
+from expected_tackling.data.mott_features import PEAKS_DISTANCE, PEAKS_HEIGHT, compute_mott_features_data
+from expected_tackling.data.process_data import (
+    compute_visualization_data_with_multiprocessing,
+    get_valid_plays_from_events,
+)
+
+FEATURES_ID_COLUMNS = ["gameId", "playId", "nflId", "frameId", "x", "y", "playDirection", "will_tackle"]
+
+
+def compute_fingerprint(value: Any) -> str:
+    """Compute a content fingerprint of a DataFrame, a Series or any other picklable object.
+
+    Parameters
+    ----------
+    value : Any
+        Value to fingerprint.
+
+    Returns
+    -------
+    str
+        Hexadecimal SHA-256 digest of the value.
+    """
+    hasher = hashlib.sha256()
+    if isinstance(value, pd.DataFrame):
+        hasher.update(repr([(str(col), str(dtype)) for col, dtype in value.dtypes.items()]).encode())
+        hasher.update(pd.util.hash_pandas_object(value, index=True).to_numpy().tobytes())
+    elif isinstance(value, pd.Series):
+        hasher.update(repr((str(value.name), str(value.dtype))).encode())
+        hasher.update(pd.util.hash_pandas_object(value, index=True).to_numpy().tobytes())
+    else:
+        hasher.update(pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL))
+    return hasher.hexdigest()
+
+
+class Stage:
+    """Class declaring a stage of a pipeline, a function computing artifacts from other artifacts."""
+
+    def __init__(
+        self,
+        name: str,
+        function: Callable,
+        inputs: list,
+        outputs: Optional[list] = None,
+        parameters: Optional[dict] = None,
+        options: Optional[dict] = None,
+        version: int = 1,
+    ) -> None:
+        """Initialize the Stage object.
+
+        The function is called with the input artifacts as positional arguments, then the parameters and the
+        options as keyword arguments. It returns the output artifact, or a tuple of artifacts if there are several.
+
+        Parameters
+        ----------
+        name : str
+            Name of the stage.
+        function : Callable
+            Function computing the outputs of the stage.
+        inputs : list
+            Names of the input artifacts, sources or outputs of previous stages.
+        outputs : Optional[list], optional
+            Names of the output artifacts, by default None for a single output named as the stage.
+        parameters : Optional[dict], optional
+            Keyword arguments changing the outputs, part of the key of the artifacts, by default None.
+        options : Optional[dict], optional
+            Keyword arguments not changing the outputs, as numbers of processes, by default None.
+        version : int, optional
+            Version of the function, to be incremented when its outputs change, by default 1.
+        """
+        self.name = name
+        self.function = function
+        self.inputs = list(inputs)
+        self.outputs = [name] if outputs is None else list(outputs)
+        self.parameters = {} if parameters is None else dict(parameters)
+        self.options = {} if options is None else dict(options)
+        self.version = version
+
+    def get_key(self, inputs_keys: list) -> str:
+        """Get the key of the outputs of the stage.
+
+        Parameters
+        ----------
+        inputs_keys : list
+            Keys of the input artifacts.
+
+        Returns
+        -------
+        str
+            Hexadecimal SHA-256 digest of the function, its version, its parameters and the keys of its inputs.
+        """
+        function_name = f"{self.function.__module__}.{self.function.__qualname__}"
+        hasher = hashlib.sha256()
+        hasher.update(repr((self.name, function_name, self.version, inputs_keys)).encode())
+        hasher.update(compute_fingerprint(sorted(self.parameters.items())).encode())
+        return hasher.hexdigest()
+
+    def run(self, *inputs: Any) -> tuple:
+        """Run the function of the stage.
+
+        Parameters
+        ----------
+        *inputs : Any
+            Input artifacts, in the order of the inputs names.
+
+        Returns
+        -------
+        tuple
+            Output artifacts, in the order of the outputs names.
+        """
+        outputs = self.function(*inputs, **self.parameters, **self.options)
+        return (outputs,) if len(self.outputs) == 1 else tuple(outputs)
+
+
+class Pipeline:
+    """Class running stages in order and caching their artifacts on disk, keyed by their inputs and parameters."""
+
+    def __init__(self, path: str, stages: list) -> None:
+        """Initialize the Pipeline object.
+
+        The key of a source artifact is the fingerprint of its content, and the key of the outputs of a stage is
+        derived from the keys of its inputs, so that a stage is run only if one of its inputs, parameters or
+        version changed, or if its outputs were never computed.
+
+        Parameters
+        ----------
+        path : str
+            Directory in which the artifacts are stored, created if it does not exist.
+        stages : list
+            Stages of the pipeline, in an order in which every stage comes after the stages of its inputs.
+        """
+        self.path = Path(path)
+        self.path.mkdir(parents=True, exist_ok=True)
+        self.stages = list(stages)
+
+        self.producers: dict = {}
+        for stage in self.stages:
+            for output in stage.outputs:
+                if output in self.producers:
+                    raise ValueError(f"artifact {output} is the output of several stages")
+                self.producers[output] = stage
+
+    def _artifact_path(self, output: str, key: str) -> Path:
+        return self.path / output / f"{key}.pkl"
+
+    def _get_key(self, name: str, sources: dict, keys: dict) -> str:
+        if name not in keys:
+            if name in sources:
+                keys[name] = compute_fingerprint(sources[name])
+            elif name in self.producers:
+                stage = self.producers[name]
+                stage_key = stage.get_key([self._get_key(input_name, sources, keys) for input_name in stage.inputs])
+                for output in stage.outputs:
+                    if output not in sources:
+                        keys[output] = stage_key
+            else:
+                raise KeyError(f"artifact {name} is neither a source nor the output of a stage")
+        return keys[name]
+
+    def _get_outdated_stages(self, targets: list, sources: dict, keys: dict) -> list:
+        outdated_stages: list = []
+        names = list(targets)
+        while len(names) > 0:
+            name = names.pop()
+            if name in sources or name not in self.producers:
+                continue
+            stage = self.producers[name]
+            if stage in outdated_stages or all(
+                self._artifact_path(output, self._get_key(output, sources, keys)).exists()
+                for output in stage.outputs
+                if output not in sources
+            ):
+                continue
+            outdated_stages.append(stage)
+            names.extend(stage.inputs)
+        return [stage for stage in self.stages if stage in outdated_stages]
+
+    def _load(self, name: str, sources: dict, keys: dict, artifacts: dict) -> Any:
+        if name not in artifacts:
+            with open(self._artifact_path(name, self._get_key(name, sources, keys)), "rb") as file:
+                artifacts[name] = pickle.load(file)
+        return artifacts[name]
+
+    def _save(self, name: str, key: str, value: Any) -> None:
+        artifact_path = self._artifact_path(name, key)
+        artifact_path.parent.mkdir(parents=True, exist_ok=True)
+        # the artifact appears only once completely written, an interrupted run leaves no truncated artifact
+        tmp_path = artifact_path.with_suffix(".tmp")
+        with open(tmp_path, "wb") as file:
+            pickle.dump(value, file, protocol=pickle.HIGHEST_PROTOCOL)
+        tmp_path.replace(artifact_path)
+
+    def get_outdated_stages(self, sources: dict, targets: Optional[list] = None) -> list:
+        """Get the names of the stages to run to get target artifacts.
+
+        Parameters
+        ----------
+        sources : dict
+            Source artifacts by name, as tracking, plays, players and tackles DataFrames.
+        targets : Optional[list], optional
+            Names of the target artifacts, by default None for the outputs of all stages.
+
+        Returns
+        -------
+        list
+            Names of the stages whose outputs are not stored, in the order of the pipeline.
+        """
+        targets = list(self.producers) if targets is None else targets
+        return [stage.name for stage in self._get_outdated_stages(targets, sources, {})]
+
+    def run(self, sources: dict, targets: Optional[list] = None) -> dict:
+        """Run the stages needed to get target artifacts, reading the stored artifacts of the other stages.
+
+        Parameters
+        ----------
+        sources : dict
+            Source artifacts by name, as tracking, plays, players and tackles DataFrames. An artifact given as a
+            source is used in place of the output of its stage.
+        targets : Optional[list], optional
+            Names of the target artifacts, by default None for the outputs of all stages.
+
+        Returns
+        -------
+        dict
+            Target artifacts by name.
+        """
+        targets = list(self.producers) if targets is None else targets
+        keys: dict = {}
+        artifacts = dict(sources)
+        for stage in self._get_outdated_stages(targets, sources, keys):
+            inputs = [self._load(input_name, sources, keys, artifacts) for input_name in stage.inputs]
+            for output, value in zip(stage.outputs, stage.run(*inputs)):
+                self._save(output, self._get_key(output, sources, keys), value)
+                artifacts[output] = value
+
+        return {target: self._load(target, sources, keys, artifacts) for target in targets}
+
+
+def predict_tackling_probability(features_data: pd.DataFrame, tracking: pd.DataFrame, model: Any) -> pd.DataFrame:
+    """Predict the tackling probability of every player on every frame of tracking data.
+
+    Parameters
+    ----------
+    features_data : pd.DataFrame
+        DataFrame with computed features for defensive players.
+    tracking : pd.DataFrame
+        DataFrame containing tracking data.
+    model : Any
+        Tackling model with a predict_proba method, as a CatBoostClassifier.
+
+    Returns
+    -------
+    pd.DataFrame
+        DataFrame with the tackling probability of every player and frame of tracking data, 0 for the players
+        without features.
+    """
+    predictions = features_data[PLAYER_FRAME_KEYS].copy()
+    predictions["tackling_probability"] = model.predict_proba(features_data.drop(columns=FEATURES_ID_COLUMNS))[:, 1]
+
+    tackling_probability = KeyedTable(predictions, PLAYER_FRAME_KEYS).join(
+        tracking, columns=["tackling_probability"], how="left", data_columns=PLAYER_FRAME_KEYS
+    )
+    tackling_probability["tackling_probability"] = tackling_probability["tackling_probability"].fillna(0)
+    return tackling_probability
+
+
+def predict_mott(mott_features_data: pd.DataFrame, model: Any) -> pd.DataFrame:
+    """Predict whether every tackling opportunity is missed.
+
+    Parameters
+    ----------
+    mott_features_data : pd.DataFrame
+        DataFrame with MOTT features.
+    model : Any
+        MOTT model with a predict method, as a CatBoostClassifier.
+
+    Returns
+    -------
+    pd.DataFrame
+        DataFrame with MOTT features and a 'mott' column with the predictions.
+    """
+    mott_predictions = mott_features_data.copy()
+    mott_predictions["mott"] = model.predict(mott_features_data.drop(columns=["pff_missedTackle"]))
+    return mott_predictions
+
+
+def compute_players_statistics(
+    mott_predictions: pd.DataFrame, players: pd.DataFrame, visualization_tracking_data: pd.DataFrame
+) -> pd.DataFrame:
+    """Compute the tackles, missed tackles and MOTT statistics of every defensive player.
+
+    Parameters
+    ----------
+    mott_predictions : pd.DataFrame
+        DataFrame with MOTT features and predictions.
+    players : pd.DataFrame
+        DataFrame containing player information.
+    visualization_tracking_data : pd.DataFrame
+        DataFrame with visualization data, giving the teams of the players.
+
+    Returns
+    -------
+    pd.DataFrame
+        DataFrame indexed by nflId with the numbers of tackles, missed tackles and MOTT, the mean distance won by
+        the ball carriers, the position, the name and the teams of every player.
+    """
+    teams = visualization_tracking_data[visualization_tracking_data["is_defense"]][["nflId", "defensiveTeam"]]
+    teams = teams.astype({"nflId": "int64", "defensiveTeam": object}).drop_duplicates()
+    teams = teams.groupby("nflId").agg(team=("defensiveTeam", lambda x: "/".join(x)))
+
+    plays_statistics = (
+        mott_predictions.reset_index()
+        .groupby(["gameId", "playId", "nflId"])
+        .agg(
+            {
+                "tackle_or_assist": "max",
+                "pff_missedTackle": "max",
+                "mott": "sum",
+                "ball_carrier_distance_won_to_last_frame": "max",
+            }
+        )
+    )
+    players_statistics = plays_statistics.groupby("nflId").agg(
+        {
+            "tackle_or_assist": "sum",
+            "pff_missedTackle": "sum",
+            "mott": "sum",
+            "ball_carrier_distance_won_to_last_frame": "mean",
+        }
+    )
+    players_statistics.index = players_statistics.index.astype("int64")
+
+    players_statistics = players_statistics.merge(
+        players.astype({"nflId": "int64"}).set_index("nflId")[["position", "displayName"]],
+        left_index=True,
+        right_index=True,
+    )
+    return players_statistics.merge(teams, left_index=True, right_index=True)
+
+
+def create_pipeline(
+    path: str,
+    tackling_model: Any = None,
+    mott_model: Any = None,
+    peaks_height: float = PEAKS_HEIGHT,
+    peaks_distance: int = PEAKS_DISTANCE,
+    nb_process: int = 10,
+) -> Pipeline:
+    """Create the pipeline from tracking data to players statistics.
+
+    Its sources are the 'tracking', 'plays', 'players' and 'tackles' DataFrames, as loaded from a columnar cache or
+    CSV files by load_data, which normalizes every play to go left to right, and load_tackles. Its stages compute
+    the valid plays, the visualization data, the target, the features, the tackling probability, the MOTT features,
+    the MOTT predictions and the players statistics. Without a tackling model, the 'tackling_probability' artifact
+    must be given as a source, and without a MOTT model the pipeline stops at the MOTT features.
+
+    Parameters
+    ----------
+    path : str
+        Directory in which the artifacts are stored.
+    tackling_model : Any, optional
+        Tackling model with a predict_proba method, by default None.
+    mott_model : Any, optional
+        MOTT model with a predict method, by default None.
+    peaks_height : float, optional
+        Minimal opportunity to tackle of the tackling opportunities, by default 0.5.
+    peaks_distance : int, optional
+        Minimal number of frames between two tackling opportunities of a player, by default 16.
+    nb_process : int, optional
+        Number of processes to compute visualization data and features, by default 10.
+
+    Returns
+    -------
+    Pipeline
+        Pipeline whose artifacts are stored in path.
+    """
+    stages = [
+        Stage(
+            "valid_plays",
+            get_valid_plays_from_events,
+            ["tracking"],
+            outputs=["plays_frames_valid", "events_index"],
+        ),
+        Stage(
+            "visualization_data",
+            compute_visualization_data_with_multiprocessing,
+            ["plays_frames_valid", "events_index", "plays", "players", "tracking"],
+            outputs=["visualization_tracking_data"],
+            options={"nb_process": nb_process},
+        ),
+        Stage("target", create_target, ["visualization_tracking_data", "tackles"], outputs=["targeted_data"]),
+        Stage(
+            "features",
+            compute_features_data_with_multiprocessing,
+            ["targeted_data", "tracking"],
+            outputs=["features_data"],
+            options={"nb_process": nb_process},
+            version=FEATURES_VERSION,
+        ),
+    ]
+    if tackling_model is not None:
+        stages.append(
+            Stage(
+                "tackling_probability",
+                predict_tackling_probability,
+                ["features_data", "tracking"],
+                parameters={"model": tackling_model},
+            )
+        )
+    stages.append(
+        Stage(
+            "mott_features",
+            compute_mott_features_data,
+            ["features_data", "tackling_probability", "tackles"],
+            outputs=["mott_features_data"],
+            parameters={"peaks_height": peaks_height, "peaks_distance": peaks_distance},
+        )
+    )
+    if mott_model is not None:
+        stages.extend(
+            [
+                Stage("mott_predictions", predict_mott, ["mott_features_data"], parameters={"model": mott_model}),
+                Stage(
+                    "players_statistics",
+                    compute_players_statistics,
+                    ["mott_predictions", "players", "visualization_tracking_data"],
+                ),
+            ]
+        )
+
+    return Pipeline(path, stages)
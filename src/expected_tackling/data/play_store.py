@@ -0,0 +1,178 @@
+import numpy as np
+import pandas as pd
+
+from expected_tackling.data.joins import FRAME_KEYS, KeyedTable
+
+TRACKING_CHANNELS = ["x", "y", "s", "a", "dis", "o", "dir"]
+
+
+class PlayStore:
+    """Class holding tracking data of plays as contiguous [frames x players x channels] float32 arrays."""
+
+    def __init__(self, tracking: pd.DataFrame, channels: list = TRACKING_CHANNELS, dtype: type = np.float32) -> None:
+        """Initialize the PlayStore object.
+
+        Frames of all plays are stacked along the first axis, play after play, so that every play is a contiguous
+        slice of the arrays. Players of a play are sorted by nflId, the football being the last one, and the
+        player axis is padded with NaN up to the largest number of players on a play.
+
+        Parameters
+        ----------
+        tracking : pd.DataFrame
+            DataFrame containing tracking data. The optional columns 'is_defense' and 'is_ball_carrying', as in
+            visualization tracking data, fill the defense flags and the ball carrier index.
+        channels : list, optional
+            Tracking columns stored in the tensor, by default ["x", "y", "s", "a", "dis", "o", "dir"]
+        dtype : type, optional
+            Float type of the tensor, by default np.float32.
+        """
+        tracking = tracking.sort_values(["gameId", "playId", "frameId"], kind="stable")
+        plays_groups = tracking.groupby(["gameId", "playId"], sort=True)
+
+        play_codes = plays_groups.ngroup().to_numpy()
+        frame_positions = plays_groups["frameId"].rank(method="dense").to_numpy(dtype=np.int64) - 1
+        slots = plays_groups["nflId"].rank(method="dense")
+        slots = slots.fillna(plays_groups["nflId"].transform("nunique") + 1).to_numpy(dtype=np.int64) - 1
+
+        plays_nb_frames = plays_groups["frameId"].nunique().to_numpy()
+        frame_end = np.cumsum(plays_nb_frames)
+        self.plays = pd.DataFrame(
+            {"frame_start": frame_end - plays_nb_frames, "frame_end": frame_end},
+            index=plays_groups.size().index,
+        )
+        self.channels = list(channels)
+
+        nb_frames = int(frame_end[-1]) if len(frame_end) > 0 else 0
+        nb_slots = int(slots.max(initial=-1)) + 1
+        frame_rows = self.plays["frame_start"].to_numpy()[play_codes] + frame_positions
+
+        self.frame_ids = np.zeros(nb_frames, dtype=np.int32)
+        self.frame_ids[frame_rows] = tracking["frameId"].to_numpy()
+
+        self.tensor = np.full((nb_frames, nb_slots, len(self.channels)), np.nan, dtype=dtype)
+        self.tensor[frame_rows, slots] = tracking[self.channels].to_numpy(dtype=dtype, na_value=np.nan)
+
+        self.is_present = np.zeros((nb_frames, nb_slots), dtype=bool)
+        self.is_present[frame_rows, slots] = True
+
+        self.nfl_ids = np.full((len(self.plays), nb_slots), np.nan)
+        self.nfl_ids[play_codes, slots] = tracking["nflId"].to_numpy(dtype=float, na_value=np.nan)
+
+        self.is_defense = np.zeros((len(self.plays), nb_slots), dtype=bool)
+        if "is_defense" in tracking:
+            self.is_defense[play_codes, slots] = tracking["is_defense"].to_numpy(dtype=bool)
+
+        self.ball_carrier_index = np.full(nb_frames, -1, dtype=np.int16)
+        if "is_ball_carrying" in tracking:
+            is_ball_carrying = tracking["is_ball_carrying"].to_numpy(dtype=bool)
+            self.ball_carrier_index[frame_rows[is_ball_carrying]] = slots[is_ball_carrying]
+
+    def __len__(self) -> int:
+        """Return the number of plays in the store."""
+        return len(self.plays)
+
+    def get_play(self, game_id: int, play_id: int) -> dict:
+        """Get the arrays of a play, as views on the store arrays.
+
+        Parameters
+        ----------
+        game_id : int
+            Game identifier.
+        play_id : int
+            Play identifier.
+
+        Returns
+        -------
+        dict
+            Dictionary with 'frame_ids' [frames], 'tensor' [frames x players x channels], 'is_present'
+            [frames x players], 'nfl_ids' [players], 'is_defense' [players] and 'ball_carrier_index' [frames].
+        """
+        play_position = self.plays.index.get_loc((game_id, play_id))
+        frames = slice(*self.plays.iloc[play_position][["frame_start", "frame_end"]])
+        return {
+            "frame_ids": self.frame_ids[frames],
+            "tensor": self.tensor[frames],
+            "is_present": self.is_present[frames],
+            "nfl_ids": self.nfl_ids[play_position],
+            "is_defense": self.is_defense[play_position],
+            "ball_carrier_index": self.ball_carrier_index[frames],
+        }
+
+    def get_positions(self, tracking: pd.DataFrame) -> tuple[np.ndarray, np.ndarray]:
+        """Get the positions in the tensor of the rows of tracking data, as their frame and player slot.
+
+        Parameters
+        ----------
+        tracking : pd.DataFrame
+            DataFrame with the gameId, playId, nflId and frameId of every row, as the tracking data of the store.
+
+        Returns
+        -------
+        tuple[np.ndarray, np.ndarray]
+            Arrays of the frame and the player slot of every row, -1 for rows that are not in the store.
+        """
+        plays_nb_frames = (self.plays["frame_end"] - self.plays["frame_start"]).to_numpy()
+        frames = pd.DataFrame(
+            {
+                "gameId": np.repeat(self.plays.index.get_level_values("gameId").to_numpy(), plays_nb_frames),
+                "playId": np.repeat(self.plays.index.get_level_values("playId").to_numpy(), plays_nb_frames),
+                "frameId": self.frame_ids,
+            }
+        )
+        frame_rows = KeyedTable(frames, FRAME_KEYS).lookup(tracking)
+
+        # players of a play are followed by the slot of the football, whose nflId is missing
+        nb_players = (~np.isnan(self.nfl_ids)).sum(axis=1)
+        play_codes, slots = np.nonzero(np.arange(self.nfl_ids.shape[1]) <= nb_players[:, None])
+        players = pd.DataFrame(
+            {
+                "gameId": self.plays.index.get_level_values("gameId").to_numpy()[play_codes],
+                "playId": self.plays.index.get_level_values("playId").to_numpy()[play_codes],
+                "nflId": self.nfl_ids[play_codes, slots],
+            }
+        )
+        player_rows = KeyedTable(players, ["gameId", "playId", "nflId"]).lookup(tracking)
+
+        is_found = (frame_rows >= 0) & (player_rows >= 0)
+        return np.where(is_found, frame_rows, -1), np.where(is_found, slots[player_rows], -1)
+
+    def get_channel(self, channel: str) -> np.ndarray:
+        """Get a channel of the tensor for all frames and players.
+
+        Parameters
+        ----------
+        channel : str
+            Name of the channel.
+
+        Returns
+        -------
+        np.ndarray
+            Array of shape [frames x players].
+        """
+        return self.tensor[:, :, self.channels.index(channel)]
+
+    def to_dataframe(self) -> pd.DataFrame:
+        """Convert the store back to long format tracking data.
+
+        Returns
+        -------
+        pd.DataFrame
+            DataFrame with one row per player and frame, sorted by gameId, playId, frameId and nflId.
+        """
+        plays_nb_frames = (self.plays["frame_end"] - self.plays["frame_start"]).to_numpy()
+        frame_play_codes = np.repeat(np.arange(len(self.plays)), plays_nb_frames)
+        frame_rows, slots = np.nonzero(self.is_present)
+        play_codes = frame_play_codes[frame_rows]
+
+        data = pd.DataFrame(
+            {
+                "gameId": self.plays.index.get_level_values("gameId").to_numpy()[play_codes],
+                "playId": self.plays.index.get_level_values("playId").to_numpy()[play_codes],
+                "nflId": self.nfl_ids[play_codes, slots],
+                "frameId": self.frame_ids[frame_rows],
+            }
+        )
+        data[self.channels] = self.tensor[frame_rows, slots]
+        data["is_defense"] = self.is_defense[play_codes, slots]
+        data["is_ball_carrying"] = self.ball_carrier_index[frame_rows] == slots
+        return data
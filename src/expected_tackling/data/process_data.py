@@ -1,100 +1,290 @@
-from typing import Optional
+import concurrent.futures
+from typing import Iterable, Optional
 
+import numpy as np
 import pandas as pd
+from pandas.api.types import union_categoricals
+from pandas.core.groupby import SeriesGroupBy
+
+from expected_tackling.data.cache import read_table, read_tables
+from expected_tackling.data.events_index import EventsIndex
+from expected_tackling.data.joins import FRAME_KEYS, PLAY_KEYS, KeyedTable
+from expected_tackling.data.schema import enforce_schema
+
+FIELD_LENGTH = 120.0
+FIELD_WIDTH = 53.3
 
 POSSIBLE_LAST_EVENT = ["tackle", "out_of_bounds", "touchdown", "fumble", "qb_slide", "safety"]
 RUN_EVENT = ["handoff", "run"]
 BALL_SNAP_EVENT = ["ball_snap", "snap_direct", "autoevent_ballsnap"]
+BALL_CARRIER_ROLES = np.array([None, "qb", "ball_carrier"], dtype=object)
+
+
+def load_tracking(
+    tracking_paths: list,
+    columns: Optional[list] = None,
+    games: Optional[Iterable] = None,
+    plays: Optional[Iterable] = None,
+    nb_workers: Optional[int] = None,
+) -> pd.DataFrame:
+    """Load tracking data shards concurrently from a columnar cache built by build_cache, or from CSV files.
+
+    Parameters
+    ----------
+    tracking_paths : list
+        Paths of the tracking data shards, as partitions "tracking_week_{i}" of a cache or "tracking_week_{i}.csv".
+    columns : Optional[list], optional
+        Columns to load, by default None for all columns.
+    games : Optional[Iterable], optional
+        gameId of the games to load, by default None for all games.
+    plays : Optional[Iterable], optional
+        (gameId, playId) of the plays to load, by default None for all plays.
+    nb_workers : Optional[int], optional
+        Number of shards read concurrently, by default None for the default of ThreadPoolExecutor.
+
+    Returns
+    -------
+    pd.DataFrame
+        DataFrame containing tracking data with the dtypes of its schema.
+    """
+    return enforce_schema(read_tables(tracking_paths, columns, games, plays, nb_workers), "tracking")
+
+
+def load_plays_and_players(
+    plays_path: str, players_path: str, games: Optional[Iterable] = None
+) -> tuple[pd.DataFrame, pd.DataFrame]:
+    """Load play and player information from partitions of a columnar cache, or from CSV files.
 
+    Parameters
+    ----------
+    plays_path : str
+        Path of the plays partition of a cache or of "plays.csv".
+    players_path : str
+        Path of the players partition of a cache or of "players.csv".
+    games : Optional[Iterable], optional
+        gameId of the games whose plays are loaded, by default None for all games.
+
+    Returns
+    -------
+    tuple[pd.DataFrame, pd.DataFrame]
+        DataFrame containing play information and DataFrame containing player information.
+    """
+    plays = enforce_schema(read_table(plays_path, games=games), "plays")
+    return plays, enforce_schema(read_table(players_path), "players")
+
+
+def normalize_tracking_direction(tracking: pd.DataFrame) -> pd.DataFrame:
+    """Rotate left directed plays on the field so that every play goes left to right.
+
+    Positions x and y are mirrored, orientation o and direction dir are rotated by 180 degrees and playDirection
+    becomes 'right', so that normalizing twice has no effect.
+
+    Parameters
+    ----------
+    tracking : pd.DataFrame
+        DataFrame containing tracking data, with a playDirection column.
+
+    Returns
+    -------
+    pd.DataFrame
+        DataFrame with tracking data of plays going left to right.
+    """
+    is_left = (tracking["playDirection"] == "left").to_numpy()
+    if not is_left.any():
+        return tracking
+
+    tracking = tracking.copy()
+    for col, field_size in [("x", FIELD_LENGTH), ("y", FIELD_WIDTH)]:
+        if col in tracking:
+            tracking[col] = np.where(is_left, field_size - tracking[col], tracking[col])
+    for col in ["o", "dir"]:
+        if col in tracking:
+            tracking[col] = np.where(is_left, (tracking[col] + 180) % 360, tracking[col])
+    tracking["playDirection"] = "right"
+    return tracking
+
+
+def normalize_play_direction(tracking: pd.DataFrame, plays: pd.DataFrame) -> tuple[pd.DataFrame, pd.DataFrame]:
+    """Rotate left directed plays on the field so that every play goes left to right, right after loading data.
+
+    Parameters
+    ----------
+    tracking : pd.DataFrame
+        DataFrame containing tracking data.
+    plays : pd.DataFrame
+        DataFrame containing play information, whose absoluteYardlineNumber is mirrored for left directed plays.
+
+    Returns
+    -------
+    tuple[pd.DataFrame, pd.DataFrame]
+        DataFrame with tracking data and DataFrame with play information of plays going left to right.
+    """
+    plays_directions = tracking[["gameId", "playId", "playDirection"]].drop_duplicates(["gameId", "playId"])
+    is_left_play = (
+        plays[["gameId", "playId"]]
+        .merge(plays_directions, how="left", on=["gameId", "playId"])["playDirection"]
+        .eq("left")
+        .to_numpy()
+    )
+
+    plays = plays.copy()
+    plays["absoluteYardlineNumber"] = np.where(
+        is_left_play, FIELD_LENGTH - plays["absoluteYardlineNumber"], plays["absoluteYardlineNumber"]
+    ).astype(plays["absoluteYardlineNumber"].dtype)
+
+    return normalize_tracking_direction(tracking), plays
+
+
+def load_data(
+    tracking_paths: list,
+    plays_path: str,
+    players_path: str,
+    games: Optional[Iterable] = None,
+    nb_workers: Optional[int] = None,
+) -> tuple[pd.DataFrame, pd.DataFrame, pd.DataFrame]:
+    """Load tracking data, play and player information, and normalize every play to go left to right.
+
+    Plays are normalized once, right after loading, so that visualization data and features computed from them
+    share the same orientation.
+
+    Parameters
+    ----------
+    tracking_paths : list
+        Paths of the tracking data shards, as partitions "tracking_week_{i}" of a cache or "tracking_week_{i}.csv".
+    plays_path : str
+        Path of the plays partition of a cache or of "plays.csv".
+    players_path : str
+        Path of the players partition of a cache or of "players.csv".
+    games : Optional[Iterable], optional
+        gameId of the games to load, by default None for all games.
+    nb_workers : Optional[int], optional
+        Number of tracking data shards read concurrently, by default None for the default of ThreadPoolExecutor.
+
+    Returns
+    -------
+    tuple[pd.DataFrame, pd.DataFrame, pd.DataFrame]
+        DataFrames with tracking data and play information of plays going left to right, and DataFrame with
+        player information.
+    """
+    games = list(games) if games is not None else None
+    tracking = load_tracking(tracking_paths, games=games, nb_workers=nb_workers)
+    plays, players = load_plays_and_players(plays_path, players_path, games)
+    tracking, plays = normalize_play_direction(tracking, plays)
+    return tracking, plays, players
 
-def get_valid_plays_from_events(tracking: pd.DataFrame) -> tuple[pd.DataFrame, pd.Series]:
+
+def get_valid_plays_from_events(
+    tracking: pd.DataFrame, min_sequence_count: int = 2
+) -> tuple[pd.DataFrame, EventsIndex]:
     """Extract valid plays and events sequences from tracking data.
 
+    Valid plays have an events sequence shared with other plays, in which a caught pass has arrived.
+
     Parameters
     ----------
     tracking : pd.DataFrame
         DataFrame containing tracking data.
+    min_sequence_count : int, optional
+        Minimal number of plays of tracking data sharing the events sequence of a valid play, by default 2.
 
     Returns
     -------
-    tuple[pd.DataFrame, pd.Series]
-        DataFrame with valid plays frames, Series with events sequences for valid plays.
+    tuple[pd.DataFrame, EventsIndex]
+        DataFrame with valid plays frames, EventsIndex with events sequences of all plays.
     """
     plays_frames = tracking.drop_duplicates(["gameId", "playId", "frameId"])[["gameId", "playId", "frameId", "event"]]
-    plays_events = plays_frames.dropna(subset=["event"]).groupby(["gameId", "playId"])["event"].unique()
+    events_index = EventsIndex(plays_frames)
 
-    events_sequences_counts = plays_events.astype(str).value_counts()
-    events_sequences = pd.Series(events_sequences_counts[events_sequences_counts > 1].index)
-    events_sequences = events_sequences[
-        events_sequences.apply(
-            lambda x: "pass_outcome_caught" not in x or ("pass_outcome_caught" in x and "pass_arrived" in x)
-        )
-    ]
-
-    valid_plays = plays_events[plays_events.astype(str).isin(events_sequences.values)]
+    is_valid = (events_index.get_sequences_counts() >= min_sequence_count) & (
+        ~events_index.contains(["pass_outcome_caught"]) | events_index.contains(["pass_arrived"])
+    )
 
     plays_frames_valid = plays_frames.set_index(["gameId", "playId"])
-    plays_frames_valid = plays_frames_valid.loc[valid_plays.index]
+    plays_frames_valid = plays_frames_valid.loc[events_index.plays[is_valid]]
 
-    return plays_frames_valid, plays_events
+    return plays_frames_valid, events_index
 
 
-def _get_ball_carrier_from_event(group: pd.DataFrame, plays_events: pd.Series) -> pd.DataFrame:
-    events = plays_events.loc[(group["gameId"].iloc[0], group["playId"].iloc[0])]
-    if any(element in events for element in RUN_EVENT):
-        is_RUN_EVENT = group["event"].isin(RUN_EVENT)
-        group.loc[is_RUN_EVENT, "ball_carrier"] = "ball_carrier"
-        if any(element in events for element in POSSIBLE_LAST_EVENT):
-            group.loc[group["event"].isin(POSSIBLE_LAST_EVENT), "ball_carrier"] = "ball_carrier"
+def _group_by_play(values: np.ndarray, play_codes: np.ndarray) -> SeriesGroupBy:
+    return pd.Series(values).groupby(play_codes, sort=False)
 
-        if is_RUN_EVENT.idxmax() != 0:
-            group.loc[is_RUN_EVENT.idxmax() - 1, "ball_carrier"] = "qb"
 
-        if any(element in events for element in BALL_SNAP_EVENT):
-            group.loc[group["event"].isin(BALL_SNAP_EVENT), "ball_carrier"] = "qb"
+def _is_event(event_codes: np.ndarray, events_index: EventsIndex, events: list) -> np.ndarray:
+    return np.isin(event_codes, events_index.encode(np.asarray(events, dtype=object))) & (event_codes >= 0)
 
-            valid_indices = group["ball_carrier"].notnull()
-            start_index = valid_indices.idxmax()
-            end_index = valid_indices[::-1].idxmax()
-            group.loc[start_index:end_index, "ball_carrier"] = (
-                group.loc[start_index:end_index, "ball_carrier"].ffill().bfill()
-            )
 
-        else:
-            group["ball_carrier"] = group["ball_carrier"].bfill()
+def _has_event(play_positions: np.ndarray, events_index: EventsIndex, events: list) -> np.ndarray:
+    # plays that are not indexed, at position -1, have no event
+    return np.append(events_index.contains(events), False)[play_positions]
 
-    elif "pass_arrived" in events:
-        is_pass_event = group["event"] == "pass_arrived"
-        group.loc[is_pass_event, "ball_carrier"] = "ball_carrier"
-        if any(element in events for element in POSSIBLE_LAST_EVENT):
-            group.loc[group["event"].isin(POSSIBLE_LAST_EVENT), "ball_carrier"] = "ball_carrier"
 
-        valid_indices = group["ball_carrier"].notnull()
-        start_index = valid_indices.idxmax()
-        end_index = valid_indices[::-1].idxmax()
-        group.loc[start_index:end_index, "ball_carrier"] = (
-            group.loc[start_index:end_index, "ball_carrier"].ffill().bfill()
-        )
+def _compute_ball_carrier_roles(plays_frames: pd.DataFrame, events_index: EventsIndex) -> np.ndarray:
+    play_codes = events_index.get_play_positions(plays_frames)
+    event_codes = events_index.encode(plays_frames["event"])
 
-    return group
+    is_run_event = _is_event(event_codes, events_index, RUN_EVENT)
+    is_last_event = _is_event(event_codes, events_index, POSSIBLE_LAST_EVENT)
+    is_ball_snap_event = _is_event(event_codes, events_index, BALL_SNAP_EVENT)
+    is_pass_arrived_event = _is_event(event_codes, events_index, ["pass_arrived"])
 
+    has_run_event = _has_event(play_codes, events_index, RUN_EVENT)
+    has_ball_snap_event = _has_event(play_codes, events_index, BALL_SNAP_EVENT)
+    has_pass_arrived_event = _has_event(play_codes, events_index, ["pass_arrived"])
 
-def _get_ball_carrier_id(x: pd.Series) -> Optional[float]:
-    if x["ball_carrier"] == "qb":
-        res = x["qbId"]
-    elif x["ball_carrier"] == "ball_carrier":
-        res = x["ballCarrierId"]
-    else:
-        res = None
-    return res
+    # the frame before the first run event is the last one of the quarterback
+    is_first_run_event = is_run_event & (_group_by_play(is_run_event, play_codes).cumsum().to_numpy() == 1)
+    is_before_first_run_event = (
+        _group_by_play(is_first_run_event, play_codes).shift(-1, fill_value=False).to_numpy(dtype=bool)
+    )
+
+    # roles are coded as indices of BALL_CARRIER_ROLES, 0 for no role
+    run_roles = np.select(
+        [has_ball_snap_event & is_ball_snap_event, is_before_first_run_event, is_run_event | is_last_event],
+        [1, 1, 2],
+        0,
+    )
+    pass_roles = np.where(is_pass_arrived_event | is_last_event, 2, 0)
+    roles = pd.Series(np.where(has_run_event, run_roles, pass_roles), dtype=float).replace(0, np.nan)
+
+    # roles are propagated forward between the first and the last frames with a role, or backward for run plays
+    # without ball snap event
+    has_role = roles.notna().to_numpy()
+    is_after_first_role = _group_by_play(has_role, play_codes).cummax().to_numpy()
+    is_before_last_role = _group_by_play(has_role[::-1], play_codes[::-1]).cummax().to_numpy()[::-1]
+    is_forward_filled = has_ball_snap_event | ~has_run_event
+    forward_roles = np.where(
+        is_after_first_role & is_before_last_role, _group_by_play(roles.to_numpy(), play_codes).ffill(), np.nan
+    )
+    backward_roles = _group_by_play(roles.to_numpy(), play_codes).bfill().to_numpy()
+    roles = np.where(is_forward_filled, forward_roles, backward_roles)
+
+    roles = np.where(has_run_event | has_pass_arrived_event, roles, np.nan)
+    return BALL_CARRIER_ROLES[np.nan_to_num(roles).astype(np.int64)]
+
+
+def _select_quarterbacks(players: pd.DataFrame, tracking: pd.DataFrame) -> pd.DataFrame:
+    # the quarterback of a play depends on the order of the merge over the complete tracking data
+    players_positions = (
+        tracking[["gameId", "playId", "nflId"]]
+        .drop_duplicates()
+        .dropna()
+        .merge(players[["nflId", "position"]], on="nflId")
+    )
+    return (
+        players_positions[players_positions["position"] == "QB"]
+        .drop_duplicates(subset=["gameId", "playId"])
+        .drop(columns="position")
+        .rename(columns={"nflId": "qbId"})
+    )
 
 
 def compute_visualization_data(
     plays_frames_valid: pd.DataFrame,
-    plays_events: pd.Series,
+    events_index: EventsIndex,
     plays: pd.DataFrame,
     players: pd.DataFrame,
     tracking: pd.DataFrame,
+    qb_players: Optional[pd.DataFrame] = None,
 ) -> pd.DataFrame:
     """Compute visualization data during valid plays.
 
@@ -102,14 +292,16 @@ def compute_visualization_data(
     ----------
     plays_frames_valid : pd.DataFrame
         DataFrame with valid plays frames.
-    plays_events : pd.Series
-        Series with events sequences for valid plays.
+    events_index : EventsIndex
+        EventsIndex with events sequences of the plays.
     plays : pd.DataFrame
         DataFrame containing play information.
     players : pd.DataFrame
         DataFrame containing player information.
     tracking : pd.DataFrame
         DataFrame containing tracking data.
+    qb_players : Optional[pd.DataFrame], optional
+        DataFrame with the qbId of the quarterback of every play, by default None to select them in tracking.
 
     Returns
     -------
@@ -117,47 +309,109 @@ def compute_visualization_data(
         DataFrame with visualization data.
     """
     visualization_data = plays_frames_valid.reset_index()
-    visualization_data["ball_carrier"] = None
+    visualization_data["ball_carrier"] = _compute_ball_carrier_roles(visualization_data, events_index)
 
-    visualization_data = (
-        visualization_data.groupby(["gameId", "playId"])
-        .apply(lambda x: _get_ball_carrier_from_event(x, plays_events))
-        .reset_index(drop=True)
+    visualization_data = KeyedTable(plays, PLAY_KEYS).join(
+        visualization_data, columns=["ballCarrierId", "defensiveTeam", "absoluteYardlineNumber", "yardsToGo"]
     )
 
-    visualization_data = visualization_data.merge(
-        plays[["gameId", "playId", "ballCarrierId", "defensiveTeam", "absoluteYardlineNumber", "yardsToGo"]],
-        on=["gameId", "playId"],
+    if qb_players is None:
+        qb_players = _select_quarterbacks(players, tracking)
+    visualization_data = KeyedTable(qb_players, PLAY_KEYS).join(visualization_data)
+
+    visualization_data["ball_carrier_id"] = np.select(
+        [visualization_data["ball_carrier"] == "qb", visualization_data["ball_carrier"] == "ball_carrier"],
+        [
+            visualization_data["qbId"].to_numpy(dtype=np.float64, na_value=np.nan),
+            visualization_data["ballCarrierId"].to_numpy(dtype=np.float64, na_value=np.nan),
+        ],
+        np.nan,
     )
 
-    players_positions = (
-        tracking[["gameId", "playId", "nflId"]]
-        .drop_duplicates()
-        .dropna()
-        .merge(players[["nflId", "position"]], on="nflId")
+    # rows are grouped by frame, in the order of the frames of the visualization data
+    visualization_tracking_data = KeyedTable(visualization_data, FRAME_KEYS).join(
+        tracking,
+        data_columns=["gameId", "playId", "nflId", "frameId", "club", "x", "y", "playDirection"],
+        table_order=True,
     )
-    qb_players = (
-        players_positions[players_positions["position"] == "QB"]
-        .drop_duplicates(subset=["gameId", "playId"])
-        .drop(columns="position")
-        .rename(columns={"nflId": "qbId"})
+    # club and defensiveTeam may be categoricals with different categories
+    clubs = visualization_tracking_data["club"].to_numpy(dtype=object)
+    defensive_teams = visualization_tracking_data["defensiveTeam"].to_numpy(dtype=object)
+    visualization_tracking_data["is_defense"] = clubs == defensive_teams
+    # nullable ids are compared as floats so that missing ids never match
+    visualization_tracking_data["is_ball_carrying"] = visualization_tracking_data["nflId"].to_numpy(
+        dtype=np.float64, na_value=np.nan
+    ) == visualization_tracking_data["ball_carrier_id"].to_numpy(dtype=np.float64, na_value=np.nan)
+
+    visualization_tracking_data = KeyedTable(players, ["nflId"]).join(
+        visualization_tracking_data, columns=["position", "displayName"], how="left"
     )
-    visualization_data = visualization_data.merge(qb_players, on=["gameId", "playId"])
 
-    visualization_data["ball_carrier_id"] = visualization_data.apply(_get_ball_carrier_id, axis=1)
+    return enforce_schema(visualization_tracking_data, "visualization_tracking_data")
 
-    visualization_tracking_data = tracking[
-        ["gameId", "playId", "nflId", "frameId", "club", "x", "y", "playDirection"]
-    ].merge(visualization_data, how="inner", on=["gameId", "playId", "frameId"])
-    visualization_tracking_data["is_defense"] = (
-        visualization_tracking_data["club"] == visualization_tracking_data["defensiveTeam"]
-    )
-    visualization_tracking_data["is_ball_carrying"] = (
-        visualization_tracking_data["nflId"] == visualization_tracking_data["ball_carrier_id"]
-    )
 
-    visualization_tracking_data = visualization_tracking_data.merge(
-        players[["nflId", "position", "displayName"]], how="left", on="nflId"
-    )
+def compute_visualization_data_with_multiprocessing(
+    plays_frames_valid: pd.DataFrame,
+    events_index: EventsIndex,
+    plays: pd.DataFrame,
+    players: pd.DataFrame,
+    tracking: pd.DataFrame,
+    nb_process: int = 10,
+) -> pd.DataFrame:
+    """Compute visualization data during valid plays using multiprocessing, with identical output.
+
+    Games are split into contiguous shards computed by a pool of processes, the quarterbacks of the plays being
+    selected beforehand on the complete tracking data, and the shards are concatenated in order.
 
+    Parameters
+    ----------
+    plays_frames_valid : pd.DataFrame
+        DataFrame with valid plays frames, the frames of every game being contiguous as returned by
+        get_valid_plays_from_events.
+    events_index : EventsIndex
+        EventsIndex with events sequences of the plays.
+    plays : pd.DataFrame
+        DataFrame containing play information.
+    players : pd.DataFrame
+        DataFrame containing player information.
+    tracking : pd.DataFrame
+        DataFrame containing tracking data.
+    nb_process : int, optional
+        Number of processes to use for parallel computation, by default 10.
+
+    Returns
+    -------
+    pd.DataFrame
+        DataFrame with visualization data.
+    """
+    frames_games = plays_frames_valid.index.get_level_values("gameId")
+    game_codes, games = pd.factorize(frames_games)
+    if (np.diff(game_codes) < 0).any():
+        raise ValueError("frames of every game must be contiguous in plays_frames_valid")
+
+    qb_players = _select_quarterbacks(players, tracking)
+    shards_games = np.array_split(games.to_numpy(), max(min(nb_process, len(games)), 1))
+
+    with concurrent.futures.ProcessPoolExecutor(len(shards_games)) as executor:
+        futures = [
+            executor.submit(
+                compute_visualization_data,
+                plays_frames_valid[frames_games.isin(shard_games)],
+                events_index,
+                plays,
+                players,
+                tracking[tracking["gameId"].isin(shard_games)],
+                qb_players,
+            )
+            for shard_games in shards_games
+        ]
+        shards = [future.result() for future in futures]
+
+    # categories of every shard are those of its values, the serial version has the sorted categories of all values
+    visualization_tracking_data = pd.concat(shards, ignore_index=True)
+    for col, values in shards[0].items():
+        if isinstance(values.dtype, pd.CategoricalDtype):
+            visualization_tracking_data[col] = union_categoricals(
+                [shard[col] for shard in shards], sort_categories=True
+            )
     return visualization_tracking_data
@@ -0,0 +1,133 @@
+import numpy as np
+import pandas as pd
+
+# float64 columns missing from a schema, as kinematics and computed features, are downcast to float32
+FLOAT_DTYPE = "float32"
+# ids of players are nullable because the football has no nflId
+IDS_DTYPES = {"gameId": "int32", "playId": "int32", "nflId": "Int32", "frameId": "int32"}
+# positions rounded to the hundredth of a yard keep float64 so that equal distances between players stay equal,
+# float32 rounding would break the ties ordering blockers and the plateaus of tackling opportunities
+POSITIONS_DTYPES = {"x": "float64", "y": "float64"}
+KINEMATICS_DTYPES = {col: FLOAT_DTYPE for col in ["s", "a", "dis", "o", "dir"]}
+VISUALIZATION_DTYPES = {
+    **IDS_DTYPES,
+    "club": "category",
+    "playDirection": "category",
+    "ball_carrier": "category",
+    "ballCarrierId": "int32",
+    "defensiveTeam": "category",
+    "qbId": "Int32",
+    "ball_carrier_id": "Int32",
+    **POSITIONS_DTYPES,
+    "is_defense": "bool",
+    "is_ball_carrying": "bool",
+    "position": "category",
+    "displayName": "category",
+}
+
+SCHEMAS = {
+    "tracking": {
+        **IDS_DTYPES,
+        "displayName": "category",
+        "jerseyNumber": "Int8",
+        "club": "category",
+        "playDirection": "category",
+        "event": "category",
+        **POSITIONS_DTYPES,
+        **KINEMATICS_DTYPES,
+    },
+    "plays": {
+        "gameId": "int32",
+        "playId": "int32",
+        "ballCarrierId": "int32",
+        "ballCarrierDisplayName": "category",
+        "possessionTeam": "category",
+        "defensiveTeam": "category",
+    },
+    "players": {"nflId": "int32", "position": "category", "displayName": "category"},
+    "tackles": {
+        "gameId": "int32",
+        "playId": "int32",
+        "nflId": "int32",
+        "tackle": "int8",
+        "assist": "int8",
+        "forcedFumble": "int8",
+        "pff_missedTackle": "int8",
+    },
+    "visualization_tracking_data": VISUALIZATION_DTYPES,
+    "targeted_data": VISUALIZATION_DTYPES,
+    "features_data": {**IDS_DTYPES, "playDirection": "category"},
+    "tackling_probability": IDS_DTYPES,
+    "mott_features_data": {"tackle_or_assist": "int8", "pff_missedTackle": "int8"},
+}
+
+
+def enforce_schema(data: pd.DataFrame, table: str, downcast_floats: bool = True) -> pd.DataFrame:
+    """Convert the columns of a pipeline table to the dtypes of its schema.
+
+    Columns missing from the schema keep their dtype, except float64 columns which are downcast to float32.
+    Columns already having the right dtype are not copied.
+
+    Parameters
+    ----------
+    data : pd.DataFrame
+        DataFrame of a pipeline table.
+    table : str
+        Name of the table, in SCHEMAS.
+    downcast_floats : bool, optional
+        Flag to convert float64 columns missing from the schema to float32, by default True.
+
+    Returns
+    -------
+    pd.DataFrame
+        DataFrame with the dtypes of the schema.
+    """
+    schema = SCHEMAS[table]
+    dtypes = {}
+    for column, values in data.items():
+        dtype = schema.get(column)
+        if dtype is None and downcast_floats and values.dtype == np.float64:
+            dtype = FLOAT_DTYPE
+        if dtype is not None and values.dtype != dtype:
+            dtypes[column] = dtype
+    if len(dtypes) == 0:
+        return data
+    return data.astype(dtypes, copy=False)
+
+
+def get_memory_report(tables: dict) -> pd.DataFrame:
+    """Report the memory usage of every column of the tables of pipeline stages.
+
+    Parameters
+    ----------
+    tables : dict
+        Dictionary of the DataFrames of the stages, by stage name.
+
+    Returns
+    -------
+    pd.DataFrame
+        DataFrame indexed by stage and column with the dtype and the bytes of every column, including the index,
+        and a 'total' row per stage.
+    """
+    reports = []
+    for stage, data in tables.items():
+        memory_usage = data.memory_usage(index=True, deep=True)
+        report = pd.DataFrame(
+            {
+                "dtype": [str(data.index.dtype)] + [str(dtype) for dtype in data.dtypes],
+                "bytes": memory_usage.to_numpy(),
+            },
+            index=pd.MultiIndex.from_product([[stage], memory_usage.index], names=["stage", "column"]),
+        )
+        total = pd.DataFrame(
+            {"dtype": [""], "bytes": [memory_usage.sum()]},
+            index=pd.MultiIndex.from_tuples([(stage, "total")], names=["stage", "column"]),
+        )
+        reports.extend([report, total])
+
+    if len(reports) == 0:
+        return pd.DataFrame(
+            {"dtype": pd.Series(dtype=object), "bytes": pd.Series(dtype=np.int64)},
+            index=pd.MultiIndex.from_tuples([], names=["stage", "column"]),
+        )
+    return pd.concat(reports)
@@ -0,0 +1,426 @@
+r"""Serve the tackling probability and MOTT models to score plays of raw tracking data.
+
+Requests and responses are JSON lines over TCP or a Unix socket. A request holds the tracking rows of whole plays,
+and optionally their plays and tackles rows:
+
+    {"id": 1, "tracking": [{"gameId": ..., "playId": ..., "nflId": ..., "frameId": ..., ...}, ...]}
+
+and its response the tackling probability of every defender on every frame and the MOTT predictions of their
+tackling opportunities. Frames of a play in progress are not accepted: the ball carrier of a frame, from which its
+features are computed, is only known from the events of the whole play, the last event ending the span of the ball
+carrier and run plays without ball snap taking it from later events, and plays are kept or dropped on their whole
+events sequence. A replay tool following a play in progress feeds the OTT of its frames, once known, to an
+OpportunityDetector instead.
+
+The request {"command": "latency"} returns the p50 and p99 latencies of the last requests. The service is started
+with:
+
+    python src/expected_tackling/data/scoring_service.py --tackling-model models/model_probability.npz \
+        --mott-model models/model_mott.npz --players data/players.csv --plays data/plays.csv --socket /tmp/mott.sock
+"""
+
+import argparse
+import asyncio
+import collections
+import concurrent.futures
+import json
+import time
+from typing import Any, Callable, Optional
+
+import numpy as np
+import pandas as pd
+
+from expected_tackling.data.features import compute_features_data, create_target
+from expected_tackling.data.joins import PLAYER_FRAME_KEYS
+from expected_tackling.data.mott_features import PEAKS_DISTANCE, PEAKS_HEIGHT, compute_mott_features_data
+from expected_tackling.data.oblivious_trees import load_model
+from expected_tackling.data.pipeline import FEATURES_ID_COLUMNS
+from expected_tackling.data.process_data import (
+    compute_visualization_data,
+    get_valid_plays_from_events,
+    normalize_play_direction,
+)
+from expected_tackling.data.schema import SCHEMAS, enforce_schema
+
+MAX_BATCH_ROWS = 50_000
+MAX_BATCH_DELAY = 0.005
+LATENCIES_WINDOW = 10_000
+# requests and responses hold whole plays, far longer than the 64 KiB lines of asyncio streams by default
+MAX_LINE_BYTES = 2**28
+
+
+class MicroBatcher:
+    """Class gathering concurrent calls of a model into single calls on the concatenation of their inputs."""
+
+    def __init__(
+        self,
+        predict: Callable[[pd.DataFrame], np.ndarray],
+        executor: concurrent.futures.Executor,
+        max_batch_rows: int = MAX_BATCH_ROWS,
+        max_delay: float = MAX_BATCH_DELAY,
+    ) -> None:
+        """Initialize the MicroBatcher object.
+
+        Inputs are gathered until max_delay seconds after the first one or until they reach max_batch_rows rows,
+        then the model is called once, in the executor, on all of them.
+
+        Parameters
+        ----------
+        predict : Callable[[pd.DataFrame], np.ndarray]
+            Prediction function of the model, returning one prediction per row.
+        executor : concurrent.futures.Executor
+            Executor in which the model is called.
+        max_batch_rows : int, optional
+            Number of rows from which gathered inputs are predicted without waiting, by default 50000.
+        max_delay : float, optional
+            Maximal number of seconds an input waits for other inputs, by default 0.005.
+        """
+        self.predict = predict
+        self.executor = executor
+        self.max_batch_rows = max_batch_rows
+        self.max_delay = max_delay
+        self.pending: list[tuple[pd.DataFrame, asyncio.Future]] = []
+        self.nb_pending_rows = 0
+        self.flush_handle: Optional[asyncio.TimerHandle] = None
+        self.tasks: set[asyncio.Task] = set()
+        self.nb_calls = 0
+        self.nb_batches = 0
+
+    async def __call__(self, data: pd.DataFrame) -> np.ndarray:
+        """Predict the rows of data within the next batch.
+
+        Parameters
+        ----------
+        data : pd.DataFrame
+            DataFrame of model inputs.
+
+        Returns
+        -------
+        np.ndarray
+            Predictions of the rows of data.
+        """
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self.pending.append((data, future))
+        self.nb_pending_rows += len(data)
+        self.nb_calls += 1
+        if self.nb_pending_rows >= self.max_batch_rows:
+            self._flush()
+        elif self.flush_handle is None:
+            self.flush_handle = loop.call_later(self.max_delay, self._flush)
+        return await future
+
+    def _flush(self) -> None:
+        if self.flush_handle is not None:
+            self.flush_handle.cancel()
+            self.flush_handle = None
+        pending, self.pending, self.nb_pending_rows = self.pending, [], 0
+        if len(pending) > 0:
+            self.nb_batches += 1
+            task = asyncio.get_running_loop().create_task(self._predict_batch(pending))
+            self.tasks.add(task)
+            task.add_done_callback(self.tasks.discard)
+
+    async def _predict_batch(self, pending: list) -> None:
+        try:
+            data = pd.concat([data for data, _ in pending], ignore_index=True)
+            predictions = np.asarray(
+                await asyncio.get_running_loop().run_in_executor(self.executor, self.predict, data)
+            )
+        except Exception as error:
+            for _, future in pending:
+                if not future.done():
+                    future.set_exception(error)
+            return
+
+        splits = np.cumsum([len(data) for data, _ in pending])[:-1]
+        for (_, future), data_predictions in zip(pending, np.split(predictions, splits)):
+            if not future.done():
+                future.set_result(data_predictions)
+
+
+class ScoringService:
+    """Class scoring plays of raw tracking data with the tackling probability and MOTT models."""
+
+    def __init__(
+        self,
+        tackling_model: Any,
+        mott_model: Any,
+        players: pd.DataFrame,
+        plays: Optional[pd.DataFrame] = None,
+        peaks_height: float = PEAKS_HEIGHT,
+        peaks_distance: int = PEAKS_DISTANCE,
+        max_batch_rows: int = MAX_BATCH_ROWS,
+        max_delay: float = MAX_BATCH_DELAY,
+        nb_threads: Optional[int] = None,
+    ) -> None:
+        """Initialize the ScoringService object.
+
+        Features of every request are computed in a thread pool, and the models are called on micro-batches of the
+        features of concurrent requests.
+
+        Parameters
+        ----------
+        tackling_model : Any
+            Tackling model with a predict_proba method, as a CatBoostClassifier.
+        mott_model : Any
+            MOTT model with a predict method, as a CatBoostClassifier.
+        players : pd.DataFrame
+            DataFrame containing players information.
+        plays : Optional[pd.DataFrame], optional
+            DataFrame containing plays information, by default None for requests giving their plays.
+        peaks_height : float, optional
+            Minimal opportunity to tackle of the tackling opportunities, by default 0.5.
+        peaks_distance : int, optional
+            Minimal number of frames between two tackling opportunities of a player, by default 16.
+        max_batch_rows : int, optional
+            Number of rows from which the model is called without waiting for other requests, by default 50000.
+        max_delay : float, optional
+            Maximal number of seconds a request waits for other requests before calling a model, by default 0.005.
+        nb_threads : Optional[int], optional
+            Number of threads computing features and calling the models, by default None for the default of
+            ThreadPoolExecutor.
+        """
+        self.tackling_model = tackling_model
+        self.mott_model = mott_model
+        self.players = players
+        self.plays = plays
+        self.peaks_height = peaks_height
+        self.peaks_distance = peaks_distance
+
+        self.executor = concurrent.futures.ThreadPoolExecutor(nb_threads)
+        self.tackling_batcher = MicroBatcher(
+            self._predict_tackling_probability, self.executor, max_batch_rows, max_delay
+        )
+        self.mott_batcher = MicroBatcher(mott_model.predict, self.executor, max_batch_rows, max_delay)
+        self.latencies: collections.deque[float] = collections.deque(maxlen=LATENCIES_WINDOW)
+
+    def _predict_tackling_probability(self, features: pd.DataFrame) -> np.ndarray:
+        return self.tackling_model.predict_proba(features)[:, 1]
+
+    def _compute_features_data(
+        self, tracking: pd.DataFrame, plays: pd.DataFrame, tackles: pd.DataFrame
+    ) -> pd.DataFrame:
+        # raw tracking data of a request is normalized on arrival, as load_data does
+        tracking, plays = normalize_play_direction(tracking, plays)
+        # plays of a request are scored on their own, without other plays sharing their events sequences
+        plays_frames_valid, events_index = get_valid_plays_from_events(tracking, min_sequence_count=1)
+        visualization_tracking_data = compute_visualization_data(
+            plays_frames_valid, events_index, plays, self.players, tracking
+        )
+        return compute_features_data(create_target(visualization_tracking_data, tackles), tracking)
+
+    async def score(
+        self, tracking: pd.DataFrame, plays: Optional[pd.DataFrame] = None, tackles: Optional[pd.DataFrame] = None
+    ) -> dict:
+        """Score the plays of raw tracking data.
+
+        Parameters
+        ----------
+        tracking : pd.DataFrame
+            DataFrame containing the tracking data of whole plays.
+        plays : Optional[pd.DataFrame], optional
+            DataFrame containing plays information, by default None for the plays of the service.
+        tackles : Optional[pd.DataFrame], optional
+            DataFrame containing information about tackles and assists on the plays, by default None for none.
+
+        Returns
+        -------
+        dict
+            Dictionary with a 'tackling_probability' DataFrame with the tackling probability of every defender on
+            every frame and a 'mott_predictions' DataFrame with MOTT features and predictions.
+        """
+        start = time.perf_counter()
+        if plays is None:
+            if self.plays is None:
+                raise ValueError("plays must be given to a service without plays")
+            plays = self.plays
+        if tackles is None:
+            tackles = enforce_schema(pd.DataFrame(columns=list(SCHEMAS["tackles"])), "tackles")
+
+        loop = asyncio.get_running_loop()
+        features_data = await loop.run_in_executor(self.executor, self._compute_features_data, tracking, plays, tackles)
+        tackling_probability = features_data[PLAYER_FRAME_KEYS].reset_index(drop=True)
+        tackling_probability["tackling_probability"] = (
+            await self.tackling_batcher(features_data.drop(columns=FEATURES_ID_COLUMNS))
+            if len(features_data) > 0
+            else np.zeros(0)
+        )
+
+        mott_features_data = await loop.run_in_executor(
+            self.executor,
+            compute_mott_features_data,
+            features_data,
+            tackling_probability,
+            tackles,
+            self.peaks_height,
+            self.peaks_distance,
+        )
+        mott_predictions = mott_features_data.copy()
+        mott_predictions["mott"] = (
+            await self.mott_batcher(mott_features_data.drop(columns=["pff_missedTackle"]))
+            if len(mott_features_data) > 0
+            else np.zeros(0)
+        )
+
+        self.latencies.append(time.perf_counter() - start)
+        return {"tackling_probability": tackling_probability, "mott_predictions": mott_predictions}
+
+    def get_latency_report(self) -> dict:
+        """Report the latencies of the last requests and the batching of the model calls.
+
+        Returns
+        -------
+        dict
+            Dictionary with the number of requests, the p50 and p99 latencies in milliseconds, and the number of
+            calls of every model with the number of batches they were gathered in.
+        """
+        latencies = np.array(self.latencies) * 1000
+        return {
+            "nb_requests": len(latencies),
+            "p50_ms": float(np.percentile(latencies, 50)) if len(latencies) > 0 else None,
+            "p99_ms": float(np.percentile(latencies, 99)) if len(latencies) > 0 else None,
+            "tackling_model_calls": self.tackling_batcher.nb_calls,
+            "tackling_model_batches": self.tackling_batcher.nb_batches,
+            "mott_model_calls": self.mott_batcher.nb_calls,
+            "mott_model_batches": self.mott_batcher.nb_batches,
+        }
+
+    async def _respond(self, request: dict) -> dict:
+        try:
+            if request.get("command") == "latency":
+                return {"id": request.get("id"), **self.get_latency_report()}
+            scores = await self.score(
+                pd.DataFrame.from_records(request["tracking"]),
+                pd.DataFrame.from_records(request["plays"]) if "plays" in request else None,
+                pd.DataFrame.from_records(request["tackles"]) if "tackles" in request else None,
+            )
+        except Exception as error:
+            return {"id": request.get("id"), "error": repr(error)}
+        return {
+            "id": request.get("id"),
+            "tackling_probability": scores["tackling_probability"].to_dict("records"),
+            "mott_predictions": scores["mott_predictions"].reset_index().to_dict("records"),
+        }
+
+    async def _respond_line(self, line: bytes, writer: asyncio.StreamWriter) -> None:
+        try:
+            response = await self._respond(json.loads(line))
+        except json.JSONDecodeError as error:
+            response = {"id": None, "error": repr(error)}
+        writer.write(json.dumps(response, default=_to_json).encode() + b"\n")
+        await writer.drain()
+
+    async def _handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        # requests of a connection are scored concurrently, their responses being written as soon as they are ready
+        tasks = set()
+        while line := await reader.readline():
+            task = asyncio.create_task(self._respond_line(line, writer))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+        await asyncio.gather(*tasks)
+        writer.close()
+        await writer.wait_closed()
+
+    async def serve(self, host: str = "127.0.0.1", port: int = 8765, path: Optional[str] = None) -> None:
+        """Serve the requests of JSON lines sent over TCP or a Unix socket until cancelled.
+
+        Parameters
+        ----------
+        host : str, optional
+            Host of the TCP server, by default "127.0.0.1".
+        port : int, optional
+            Port of the TCP server, by default 8765.
+        path : Optional[str], optional
+            Path of the Unix socket, by default None for a TCP server.
+        """
+        if path is not None:
+            server = await asyncio.start_unix_server(self._handle_connection, path, limit=MAX_LINE_BYTES)
+        else:
+            server = await asyncio.start_server(self._handle_connection, host, port, limit=MAX_LINE_BYTES)
+        async with server:
+            await server.serve_forever()
+
+
+def _to_json(value: Any) -> Any:
+    if isinstance(value, np.generic):
+        return value.item()
+    if value is pd.NA:
+        return None
+    raise TypeError(f"{type(value)} is not JSON serializable")
+
+
+def main(
+    tackling_model_path: str,
+    mott_model_path: str,
+    players_path: str,
+    plays_path: Optional[str],
+    host: str,
+    port: int,
+    socket_path: Optional[str],
+    max_batch_rows: int,
+    max_delay: float,
+) -> None:
+    """Load the models and the players and plays data, then serve the requests until interrupted.
+
+    Parameters
+    ----------
+    tackling_model_path : str
+        Path of the tackling model, exported oblivious trees in a .npz file or a pickled model.
+    mott_model_path : str
+        Path of the MOTT model, exported oblivious trees in a .npz file or a pickled model.
+    players_path : str
+        Path of the players CSV file.
+    plays_path : Optional[str]
+        Path of the plays CSV file, None for requests giving their plays.
+    host : str
+        Host of the TCP server.
+    port : int
+        Port of the TCP server.
+    socket_path : Optional[str]
+        Path of the Unix socket, None for a TCP server.
+    max_batch_rows : int
+        Number of rows from which the models are called without waiting for other requests.
+    max_delay : float
+        Maximal number of seconds a request waits for other requests before calling a model.
+    """
+    tackling_model = load_model(tackling_model_path)
+    mott_model = load_model(mott_model_path)
+    plays = pd.read_csv(plays_path) if plays_path is not None else None
+    service = ScoringService(
+        tackling_model,
+        mott_model,
+        pd.read_csv(players_path),
+        plays,
+        max_batch_rows=max_batch_rows,
+        max_delay=max_delay,
+    )
+    try:
+        asyncio.run(service.serve(host, port, socket_path))
+    except KeyboardInterrupt:
+        print(json.dumps(service.get_latency_report(), indent=2))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--tackling-model", required=True, help="path of the .npz or pickled tackling model")
+    parser.add_argument("--mott-model", required=True, help="path of the .npz or pickled MOTT model")
+    parser.add_argument("--players", required=True, help="path of the players CSV file")
+    parser.add_argument("--plays", help="path of the plays CSV file, requests giving their plays without it")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--socket", help="path of the Unix socket to serve on instead of TCP")
+    parser.add_argument("--max-batch-rows", type=int, default=MAX_BATCH_ROWS)
+    parser.add_argument("--max-delay-ms", type=float, default=MAX_BATCH_DELAY * 1000)
+    args = parser.parse_args()
+    main(
+        args.tackling_model,
+        args.mott_model,
+        args.players,
+        args.plays,
+        args.host,
+        args.port,
+        args.socket,
+        args.max_batch_rows,
+        args.max_delay_ms / 1000,
+    )
@@ -0,0 +1,160 @@
+import concurrent.futures
+from typing import Callable, Iterator, Optional
+
+import pandas as pd
+
+from expected_tackling.data.features import (
+    compute_features_data,
+    compute_features_data_with_multiprocessing,
+    create_target,
+)
+from expected_tackling.data.process_data import (
+    compute_visualization_data,
+    get_valid_plays_from_events,
+    load_tracking,
+    normalize_play_direction,
+)
+
+EVENTS_COLUMNS = ["gameId", "playId", "frameId", "event"]
+
+
+def _read_tracking(path: str, columns: Optional[list] = None) -> pd.DataFrame:
+    return load_tracking([path], columns)
+
+
+def prefetch(load: Callable[[str], pd.DataFrame], paths: list) -> Iterator[pd.DataFrame]:
+    """Load data shards one after the other while the next one is read on a background thread.
+
+    Parameters
+    ----------
+    load : Callable[[str], pd.DataFrame]
+        Function loading a shard from its path.
+    paths : list
+        Paths of the shards.
+
+    Yields
+    ------
+    Iterator[pd.DataFrame]
+        Loaded shards, in the order of the paths.
+    """
+    with concurrent.futures.ThreadPoolExecutor(max_workers=1) as executor:
+        next_shard = executor.submit(load, paths[0]) if len(paths) > 0 else None
+        for i in range(len(paths)):
+            shard = next_shard.result()  # type: ignore
+            next_shard = executor.submit(load, paths[i + 1]) if i + 1 < len(paths) else None
+            yield shard
+            del shard
+
+
+def read_plays_frames(tracking_paths: list) -> pd.DataFrame:
+    """Read only the frames events of tracking data shards, concurrently.
+
+    Parameters
+    ----------
+    tracking_paths : list
+        Paths of the tracking data shards.
+
+    Returns
+    -------
+    pd.DataFrame
+        DataFrame with one row per frame of every play and its event.
+    """
+    with concurrent.futures.ThreadPoolExecutor() as executor:
+        plays_frames = list(
+            executor.map(
+                lambda path: _read_tracking(path, EVENTS_COLUMNS).drop_duplicates(["gameId", "playId", "frameId"]),
+                tracking_paths,
+            )
+        )
+    return pd.concat(plays_frames, ignore_index=True)
+
+
+def stream_features_data(
+    tracking_paths: list,
+    plays: pd.DataFrame,
+    players: pd.DataFrame,
+    tackles: pd.DataFrame,
+    nb_process: Optional[int] = None,
+) -> Iterator[tuple[pd.DataFrame, pd.DataFrame]]:
+    """Compute visualization data and features shard by shard of tracking data, for example week by week.
+
+    Only the frames events of all shards are loaded together, so that valid plays are selected on the complete
+    events sequences counts as get_valid_plays_from_events does. The tracking data of a single shard is then in
+    memory at a time, while the next one is read on a background thread. Games must not be split across shards.
+    Every play is normalized to go left to right when its shard is loaded.
+
+    Parameters
+    ----------
+    tracking_paths : list
+        Paths of the tracking data shards, as "tracking_week_{i}.csv" or partitions of a cache built by build_cache.
+    plays : pd.DataFrame
+        DataFrame containing play information.
+    players : pd.DataFrame
+        DataFrame containing player information.
+    tackles : pd.DataFrame
+        DataFrame containing information about tackles and assists.
+    nb_process : Optional[int], optional
+        Number of processes to compute features with compute_features_data_with_multiprocessing, by default None
+        to compute them in the current process.
+
+    Yields
+    ------
+    Iterator[tuple[pd.DataFrame, pd.DataFrame]]
+        DataFrame with visualization data and DataFrame with computed features for defensive players, for every
+        shard in the order of the paths.
+    """
+    plays_frames_valid, events_index = get_valid_plays_from_events(read_plays_frames(tracking_paths))
+
+    for tracking in prefetch(_read_tracking, tracking_paths):
+        tracking, shard_plays = normalize_play_direction(tracking, plays)
+        tracking_plays = pd.MultiIndex.from_frame(tracking[["gameId", "playId"]].drop_duplicates())
+        visualization_tracking_data = compute_visualization_data(
+            plays_frames_valid[plays_frames_valid.index.isin(tracking_plays)],
+            events_index,
+            shard_plays,
+            players,
+            tracking,
+        )
+
+        targeted_data = create_target(visualization_tracking_data, tackles)
+        if nb_process is None:
+            features_data = compute_features_data(targeted_data, tracking)
+        else:
+            features_data = compute_features_data_with_multiprocessing(targeted_data, tracking, nb_process)
+
+        yield visualization_tracking_data, features_data
+
+
+def write_streamed_features_data(
+    tracking_paths: list,
+    plays: pd.DataFrame,
+    players: pd.DataFrame,
+    tackles: pd.DataFrame,
+    visualization_path: str,
+    features_paths: list,
+    nb_process: Optional[int] = None,
+) -> None:
+    """Compute visualization data and features shard by shard of tracking data and write them incrementally.
+
+    Parameters
+    ----------
+    tracking_paths : list
+        Paths of the tracking data shards, as "tracking_week_{i}.csv" or partitions of a cache built by build_cache.
+    plays : pd.DataFrame
+        DataFrame containing play information.
+    players : pd.DataFrame
+        DataFrame containing player information.
+    tackles : pd.DataFrame
+        DataFrame containing information about tackles and assists.
+    visualization_path : str
+        Path of the CSV file to which the visualization data of every shard is appended.
+    features_paths : list
+        Paths of the CSV files to which the features of each shard are written, as "features_week_{i}.csv".
+    nb_process : Optional[int], optional
+        Number of processes to compute features with compute_features_data_with_multiprocessing, by default None
+        to compute them in the current process.
+    """
+    streamed_data = stream_features_data(tracking_paths, plays, players, tackles, nb_process)
+    for i, (visualization_tracking_data, features_data) in enumerate(streamed_data):
+        visualization_tracking_data.to_csv(visualization_path, mode="w" if i == 0 else "a", header=i == 0, index=False)
+        features_data.to_csv(features_paths[i], index=False)
@@ -0,0 +1,217 @@
+import numpy as np
+import pandas as pd
+
+from expected_tackling.data.kernels import compute_angle_between_players
+from expected_tackling.data.process_data import FIELD_LENGTH, FIELD_WIDTH
+
+FRAME_RATE = 10
+NB_PLAYERS = 22
+OFFENSE_POSITIONS = ["QB", "RB", "WR", "WR", "WR", "TE", "T", "T", "G", "G", "C"]
+DEFENSE_POSITIONS = ["CB", "CB", "SS", "FS", "ILB", "OLB", "OLB", "DE", "DE", "DT", "NT"]
+# events sequences of run and pass plays, the ball snap happening on frame 6 and the last event on the last frame
+PLAYS_EVENTS = [
+    ["line_set", "ball_snap", "handoff", "first_contact", "tackle"],
+    ["line_set", "ball_snap", "handoff", "tackle"],
+    ["line_set", "ball_snap", "handoff", "out_of_bounds"],
+    ["line_set", "ball_snap", "run", "tackle"],
+    ["line_set", "ball_snap", "pass_forward", "pass_arrived", "pass_outcome_caught", "first_contact", "tackle"],
+    ["line_set", "ball_snap", "pass_forward", "pass_arrived", "pass_outcome_caught", "out_of_bounds"],
+]
+
+
+def _create_players(nb_games: int) -> pd.DataFrame:
+    positions = OFFENSE_POSITIONS + DEFENSE_POSITIONS
+    nfl_ids = 40000 + np.arange(nb_games * NB_PLAYERS)
+    return pd.DataFrame(
+        {
+            "nflId": nfl_ids,
+            "position": positions * nb_games,
+            "displayName": [f"Player {nfl_id}" for nfl_id in nfl_ids],
+        }
+    )
+
+
+def _create_plays(nb_games: int, nb_plays: int, rng: np.random.Generator) -> pd.DataFrame:
+    game_codes = np.repeat(np.arange(nb_games), nb_plays)
+    events_codes = rng.integers(len(PLAYS_EVENTS), size=len(game_codes))
+    is_pass = np.array(["pass_forward" in PLAYS_EVENTS[code] for code in events_codes])
+    # running backs carry the ball on run plays and receivers on pass plays
+    ball_carrier_slots = np.where(is_pass, rng.integers(2, 6, size=len(game_codes)), 1)
+    ball_carrier_ids = 40000 + game_codes * NB_PLAYERS + ball_carrier_slots
+
+    return pd.DataFrame(
+        {
+            "gameId": 2022090800 + game_codes,
+            "playId": np.tile(56 + 25 * np.arange(nb_plays), nb_games),
+            "ballCarrierId": ball_carrier_ids,
+            "ballCarrierDisplayName": [f"Player {nfl_id}" for nfl_id in ball_carrier_ids],
+            "quarter": np.tile(1 + np.arange(nb_plays) * 4 // nb_plays, nb_games),
+            "down": rng.integers(1, 5, size=len(game_codes)),
+            "yardsToGo": rng.integers(1, 11, size=len(game_codes)),
+            "possessionTeam": [f"H{code}" for code in game_codes],
+            "defensiveTeam": [f"A{code}" for code in game_codes],
+            "absoluteYardlineNumber": rng.integers(20, 91, size=len(game_codes)),
+            "playDirection": rng.choice(["left", "right"], size=len(game_codes)),
+            "eventsCode": events_codes,
+        }
+    )
+
+
+def _simulate_movements(plays: pd.DataFrame, nb_frames: int, rng: np.random.Generator) -> np.ndarray:
+    nb_plays = len(plays)
+    line_of_scrimmage = plays["absoluteYardlineNumber"].to_numpy(dtype=float)[:, None]
+    ball_carrier_slots = (plays["ballCarrierId"].to_numpy() - 40000) % NB_PLAYERS
+
+    # [plays x players x (x, y)], the offense going left to right, the football last
+    positions = np.empty((nb_plays, NB_PLAYERS + 1, 2))
+    positions[:, :11, 0] = line_of_scrimmage - rng.uniform(0.5, 8, size=(nb_plays, 11))
+    positions[:, 11:22, 0] = line_of_scrimmage + rng.uniform(1, 12, size=(nb_plays, 11))
+    positions[:, :22, 1] = rng.uniform(10, FIELD_WIDTH - 10, size=(nb_plays, NB_PLAYERS))
+    positions[:, 22] = positions[np.arange(nb_plays), 0]
+
+    plays_range = np.arange(nb_plays)
+    frames = np.empty((nb_frames, nb_plays, NB_PLAYERS + 1, 2))
+    for frame in range(nb_frames):
+        ball_carrier = positions[plays_range, ball_carrier_slots]
+        velocities = np.zeros_like(positions)
+        if frame >= 5:
+            # the ball carrier runs to the endzone, the offense blocks forward and the defense pursues the ball carrier
+            velocities[:, :11, 0] = np.where(np.arange(11) == ball_carrier_slots[:, None], 6.0, 3.0)
+            to_ball_carrier = ball_carrier[:, None] - positions[:, 11:22]
+            distances = np.linalg.norm(to_ball_carrier, axis=2, keepdims=True)
+            velocities[:, 11:22] = 5.5 * to_ball_carrier / np.maximum(distances, 0.5)
+            velocities[:, :22] += rng.normal(0, 0.3, size=(nb_plays, NB_PLAYERS, 2))
+            velocities[:, 22] = velocities[plays_range, ball_carrier_slots]
+        positions = positions + velocities / FRAME_RATE
+        positions[:, :, 0] = np.clip(positions[:, :, 0], 0.1, FIELD_LENGTH - 0.1)
+        positions[:, :, 1] = np.clip(positions[:, :, 1], 0.1, FIELD_WIDTH - 0.1)
+        frames[frame] = positions
+
+    return frames
+
+
+def generate_synthetic_data(
+    nb_games: int = 2, nb_plays: int = 10, nb_frames: int = 50, seed: int = 0
+) -> tuple[pd.DataFrame, pd.DataFrame, pd.DataFrame, pd.DataFrame]:
+    """Generate synthetic tracking, plays, players and tackles data with the format of the NFL Big Data Bowl 2024.
+
+    Every play has 22 players and the football tracked at 10 Hz, with events sequences of run and pass plays:
+    after the ball snap the ball carrier runs to the endzone while the defensive players pursue him. Tackles are
+    made by the nearest defensive players to the ball carrier on the last frame.
+
+    Parameters
+    ----------
+    nb_games : int, optional
+        Number of games, by default 2.
+    nb_plays : int, optional
+        Number of plays per game, by default 10.
+    nb_frames : int, optional
+        Number of frames per play, by default 50.
+    seed : int, optional
+        Seed of the random generator, by default 0.
+
+    Returns
+    -------
+    tuple[pd.DataFrame, pd.DataFrame, pd.DataFrame, pd.DataFrame]
+        DataFrames with tracking data, play information, player information and tackles.
+    """
+    if nb_frames < 12:
+        raise ValueError("nb_frames must be at least 12 to fit the events sequences")
+
+    rng = np.random.default_rng(seed)
+    players = _create_players(nb_games)
+    plays = _create_plays(nb_games, nb_plays, rng)
+    frames = _simulate_movements(plays, nb_frames, rng)
+
+    nb_plays_total = len(plays)
+    nb_slots = NB_PLAYERS + 1
+    play_codes = np.broadcast_to(np.arange(nb_plays_total)[None, :, None], (nb_frames, nb_plays_total, nb_slots))
+    frame_ids = np.broadcast_to(np.arange(1, nb_frames + 1)[:, None, None], play_codes.shape)
+    slots = np.broadcast_to(np.arange(nb_slots)[None, None, :], play_codes.shape)
+    game_codes = plays["gameId"].to_numpy() - 2022090800
+
+    previous_frames = np.concatenate([frames[:1], frames[:-1]])
+    dis = np.linalg.norm(frames - previous_frames, axis=3)
+    speeds = dis * FRAME_RATE
+    accelerations = np.abs(np.diff(speeds, axis=0, prepend=speeds[:1])) * FRAME_RATE
+    directions = compute_angle_between_players(
+        previous_frames[..., 0], previous_frames[..., 1], frames[..., 0], frames[..., 1]
+    )
+    orientations = (directions + rng.normal(0, 20, size=directions.shape)) % 360
+
+    events = np.full((nb_frames, nb_plays_total), None, dtype=object)
+    for play_code, events_code in enumerate(plays["eventsCode"]):
+        play_events = PLAYS_EVENTS[events_code]
+        middle_frames = np.linspace(9, nb_frames - 2, len(play_events) - 3).round().astype(int)
+        for event, frame in zip(play_events, [0, 5, *middle_frames, nb_frames - 1]):
+            events[frame, play_code] = event
+
+    nfl_ids = np.where(
+        slots < NB_PLAYERS, 40000 + game_codes[play_codes] * NB_PLAYERS + np.minimum(slots, NB_PLAYERS - 1), np.nan
+    )
+    clubs = np.array(
+        [[f"H{code}"] * 11 + [f"A{code}"] * 11 + ["football"] for code in range(int(game_codes.max(initial=0)) + 1)]
+    )
+    tracking = pd.DataFrame(
+        {
+            "gameId": plays["gameId"].to_numpy()[play_codes].ravel(),
+            "playId": plays["playId"].to_numpy()[play_codes].ravel(),
+            "nflId": nfl_ids.ravel(),
+            "frameId": frame_ids.ravel(),
+            "club": clubs[game_codes[play_codes], slots].ravel(),
+            "playDirection": "right",
+            "x": frames[..., 0].ravel(),
+            "y": frames[..., 1].ravel(),
+            "s": speeds.ravel().round(2),
+            "a": accelerations.ravel().round(2),
+            "dis": dis.ravel().round(2),
+            "o": orientations.ravel().round(2),
+            "dir": directions.ravel().round(2),
+            "event": np.broadcast_to(events[:, :, None], play_codes.shape).ravel(),
+        }
+    )
+    tracking = tracking.sort_values(["gameId", "playId", "nflId", "frameId"], kind="stable", ignore_index=True)
+    tracking.insert(
+        3, "displayName", tracking["nflId"].map(players.set_index("nflId")["displayName"]).fillna("football")
+    )
+    tracking["playDirection"] = tracking[["gameId", "playId"]].merge(
+        plays[["gameId", "playId", "playDirection"]], how="left", on=["gameId", "playId"]
+    )["playDirection"]
+
+    # left directed plays are mirrored as in the original data
+    is_left = (tracking["playDirection"] == "left").to_numpy()
+    tracking["x"] = np.where(is_left, FIELD_LENGTH - tracking["x"], tracking["x"]).round(2)
+    tracking["y"] = np.where(is_left, FIELD_WIDTH - tracking["y"], tracking["y"]).round(2)
+    for col in ["o", "dir"]:
+        tracking[col] = np.where(is_left, (tracking[col] + 180) % 360, tracking[col]).round(2)
+    is_left_play = (plays["playDirection"] == "left").to_numpy()
+    plays.loc[is_left_play, "absoluteYardlineNumber"] = FIELD_LENGTH - plays.loc[is_left_play, "absoluteYardlineNumber"]
+
+    ball_carrier_slots = (plays["ballCarrierId"].to_numpy() - 40000) % NB_PLAYERS
+    last_frames = frames[-1]
+    distances_to_ball_carrier = np.linalg.norm(
+        last_frames[:, 11:22] - last_frames[np.arange(nb_plays_total), ball_carrier_slots][:, None], axis=2
+    )
+    nearest_defenders = np.argsort(distances_to_ball_carrier, axis=1)[:, :3]
+    defenders_ids = 40000 + game_codes[:, None] * NB_PLAYERS + 11 + nearest_defenders
+    tackles = []
+    for i, (tackle, assist, pff_missed_tackle, probability) in enumerate(
+        [(1, 0, 0, 1.0), (0, 1, 0, 0.3), (0, 0, 1, 0.4)]
+    ):
+        is_selected = rng.random(nb_plays_total) < probability
+        tackles.append(
+            pd.DataFrame(
+                {
+                    "gameId": plays["gameId"].to_numpy()[is_selected],
+                    "playId": plays["playId"].to_numpy()[is_selected],
+                    "nflId": defenders_ids[is_selected, i],
+                    "tackle": tackle,
+                    "assist": assist,
+                    "forcedFumble": 0,
+                    "pff_missedTackle": pff_missed_tackle,
+                }
+            )
+        )
+    tackles = pd.concat(tackles).sort_values(["gameId", "playId"], kind="stable", ignore_index=True)
+
+    return tracking, plays.drop(columns=["playDirection", "eventsCode"]), players, tackles
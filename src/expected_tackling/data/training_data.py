@@ -0,0 +1,350 @@
+import concurrent.futures
+import json
+import shutil
+from pathlib import Path
+from typing import Any, Optional
+
+import numpy as np
+import pandas as pd
+
+from expected_tackling.data.cache import is_cache_partition, read_cache
+from expected_tackling.data.pipeline import FEATURES_ID_COLUMNS, compute_fingerprint
+
+# bin 0 holds missing values and the 254 borders of CatBoost by default leave 255 bins for the others
+MAX_BORDERS = 254
+SAMPLE_ROWS = 1_000_000
+ROWS_CHUNK_SIZE = 1_000_000
+
+
+def _read_shard(shard: str | pd.DataFrame) -> pd.DataFrame:
+    if isinstance(shard, pd.DataFrame):
+        # MOTT training data is indexed by play, player, opportunity and frame
+        return shard.reset_index() if any(name is not None for name in shard.index.names) else shard
+    if is_cache_partition(shard):
+        return read_cache(shard)
+    return pd.read_csv(shard)
+
+
+def _get_shard_fingerprint(shard: str | pd.DataFrame) -> Any:
+    if isinstance(shard, pd.DataFrame):
+        return compute_fingerprint(shard)
+    files = [Path(shard)] if Path(shard).is_file() else sorted(Path(shard).rglob("*"))
+    return [(str(file), file.stat().st_size, file.stat().st_mtime_ns) for file in files if file.is_file()]
+
+
+def _write_shard(
+    shard: str | pd.DataFrame,
+    shard_path: Path,
+    feature_names: Optional[list],
+    target: str,
+    drop_columns: list,
+    group: str,
+    nb_sample_rows: int,
+    seed: int,
+) -> dict:
+    data = _read_shard(shard)
+    if feature_names is None:
+        if isinstance(shard, pd.DataFrame):
+            drop_columns = drop_columns + [name for name in shard.index.names if name is not None]
+        feature_names = [col for col in data.columns if col not in drop_columns + [target, group]]
+    missing_columns = set(feature_names + [target, group]).difference(data.columns)
+    if len(missing_columns) > 0:
+        raise ValueError(f"columns {sorted(missing_columns)} are missing from a shard")
+
+    features = data[feature_names].to_numpy(dtype=np.float32)
+    np.save(shard_path / "features.npy", features)
+    np.save(shard_path / "labels.npy", data[target].to_numpy(dtype=np.int8))
+    np.save(shard_path / "groups.npy", data[group].to_numpy(dtype=np.int64))
+
+    sample_rows = np.random.default_rng(seed).permutation(len(features))[:nb_sample_rows]
+    return {"feature_names": feature_names, "nb_rows": len(features), "sample": features[np.sort(sample_rows)]}
+
+
+def compute_borders(values: np.ndarray, max_borders: int = MAX_BORDERS) -> np.ndarray:
+    """Compute the quantization borders of a feature from a sample of its values.
+
+    Features with at most max_borders + 1 distinct values get a border between every two consecutive values, the
+    others get borders between the distinct quantiles of their values, repeats included.
+
+    Parameters
+    ----------
+    values : np.ndarray
+        Sample of the values of the feature, missing values being ignored.
+    max_borders : int, optional
+        Maximal number of borders, by default 254.
+
+    Returns
+    -------
+    np.ndarray
+        Sorted float32 borders.
+    """
+    values = values[~np.isnan(values)].astype(np.float64)
+    distinct_values = np.unique(values)
+    if len(distinct_values) > max_borders + 1:
+        # quantiles are taken over the values with their repeats, so that frequent values weigh on the borders
+        distinct_values = np.unique(np.quantile(values, np.linspace(0, 1, max_borders + 1)))
+    return ((distinct_values[:-1] + distinct_values[1:]) / 2).astype(np.float32)
+
+
+def quantize(features: np.ndarray, borders: list) -> np.ndarray:
+    """Convert features to the codes of their bins, 0 for missing values and i + 1 for values greater than i borders.
+
+    Parameters
+    ----------
+    features : np.ndarray
+        [rows x features] float32 matrix.
+    borders : list
+        Sorted borders of every feature, as computed by compute_borders.
+
+    Returns
+    -------
+    np.ndarray
+        [rows x features] uint8 matrix of bin codes.
+    """
+    bins = np.zeros(features.shape, dtype=np.uint8)
+    for i, feature_borders in enumerate(borders):
+        values = features[:, i]
+        bins[:, i] = np.where(np.isnan(values), 0, np.searchsorted(feature_borders, values, side="left") + 1)
+    return bins
+
+
+class TrainingDataset:
+    """Class caching training data on disk as memory-mapped float32 features, bin codes, labels and groups."""
+
+    def __init__(self, path: str | Path) -> None:
+        """Initialize the TrainingDataset object.
+
+        Parameters
+        ----------
+        path : str | Path
+            Directory of the dataset, created if it does not exist.
+        """
+        self.path = Path(path)
+        self.path.mkdir(parents=True, exist_ok=True)
+        self.manifest_path = self.path / "manifest.json"
+        self.manifest = {}
+        if self.manifest_path.exists():
+            with open(self.manifest_path) as file:
+                self.manifest = json.load(file)
+
+    def __len__(self) -> int:
+        """Return the number of rows of the dataset."""
+        return self.manifest.get("nb_rows", 0)
+
+    @property
+    def feature_names(self) -> list:
+        """Names of the features, in the order of the columns of the matrices."""
+        return self.manifest.get("feature_names", [])
+
+    def build(
+        self,
+        shards: list,
+        target: str = "will_tackle",
+        drop_columns: list = FEATURES_ID_COLUMNS,
+        group: str = "gameId",
+        max_borders: int = MAX_BORDERS,
+        sample_rows: int = SAMPLE_ROWS,
+        seed: int = 42,
+        nb_workers: Optional[int] = None,
+    ) -> bool:
+        """Build the dataset from shards of training data, unless it was built from the same shards and parameters.
+
+        Shards are read concurrently and parsed only once, their features being cached as float32 and a sample of
+        their rows giving the quantization borders of every feature.
+
+        Parameters
+        ----------
+        shards : list
+            Shards of training data: paths of CSV files, as "features_week_{i}.csv", paths of cache partitions or
+            DataFrames, as returned by sample_training_data, whose index levels are not features.
+        target : str, optional
+            Column of the labels, by default "will_tackle".
+        drop_columns : list, optional
+            Columns which are not features, by default the identifiers of features data.
+        group : str, optional
+            Column of the groups of rows kept together when splitting the dataset, by default "gameId".
+        max_borders : int, optional
+            Maximal number of quantization borders of a feature, by default 254.
+        sample_rows : int, optional
+            Number of rows sampled to compute the borders, by default 1000000.
+        seed : int, optional
+            Seed of the sampling of the rows, by default 42.
+        nb_workers : Optional[int], optional
+            Number of shards read concurrently, by default None for the number of processors.
+
+        Returns
+        -------
+        bool
+            True if the dataset was built, False if it was already up to date.
+        """
+        key = compute_fingerprint(
+            {
+                "shards": [_get_shard_fingerprint(shard) for shard in shards],
+                "target": target,
+                "drop_columns": list(drop_columns),
+                "group": group,
+                "max_borders": max_borders,
+                "sample_rows": sample_rows,
+                "seed": seed,
+            }
+        )
+        if self.manifest.get("key") == key:
+            return False
+
+        # the first shard gives the features of the others
+        shards_path = self.path / "shards"
+        shutil.rmtree(shards_path, ignore_errors=True)
+        shards_paths = [shards_path / str(i) for i in range(len(shards))]
+        for shard_path in shards_paths:
+            shard_path.mkdir(parents=True)
+        nb_sample_rows = -(-sample_rows // max(len(shards), 1))
+        first_shard = _write_shard(
+            shards[0], shards_paths[0], None, target, list(drop_columns), group, nb_sample_rows, seed
+        )
+        feature_names = first_shard["feature_names"]
+        with concurrent.futures.ProcessPoolExecutor(nb_workers) as executor:
+            futures = [
+                executor.submit(
+                    _write_shard, shard, shard_path, feature_names, target, [], group, nb_sample_rows, seed + i
+                )
+                for i, (shard, shard_path) in enumerate(zip(shards[1:], shards_paths[1:]), start=1)
+            ]
+            written_shards = [first_shard] + [future.result() for future in futures]
+
+        sample = np.concatenate([shard["sample"] for shard in written_shards])
+        borders = [compute_borders(sample[:, i], max_borders) for i in range(len(feature_names))]
+        nb_rows = sum(shard["nb_rows"] for shard in written_shards)
+
+        features = np.lib.format.open_memmap(
+            self.path / "features.npy", mode="w+", dtype=np.float32, shape=(nb_rows, len(feature_names))
+        )
+        bins = np.lib.format.open_memmap(
+            self.path / "bins.npy", mode="w+", dtype=np.uint8, shape=(nb_rows, len(feature_names))
+        )
+        start = 0
+        for shard_path, shard in zip(shards_paths, written_shards):
+            shard_features = np.load(shard_path / "features.npy", mmap_mode="r")
+            for chunk_start in range(0, len(shard_features), ROWS_CHUNK_SIZE):
+                chunk = shard_features[chunk_start : chunk_start + ROWS_CHUNK_SIZE]
+                features[start + chunk_start : start + chunk_start + len(chunk)] = chunk
+                bins[start + chunk_start : start + chunk_start + len(chunk)] = quantize(chunk, borders)
+            start += shard["nb_rows"]
+        features.flush()
+        bins.flush()
+        for name in ["labels", "groups"]:
+            np.save(self.path / f"{name}.npy", np.concatenate([np.load(path / f"{name}.npy") for path in shards_paths]))
+        np.savez(self.path / "borders.npz", *borders)
+        with open(self.path / "borders.tsv", "w") as file:
+            # custom borders of CatBoost, one feature index and border per line
+            for i, feature_borders in enumerate(borders):
+                file.writelines(f"{i}\t{border!r}\n" for border in feature_borders.tolist())
+        shutil.rmtree(shards_path)
+        (self.path / "pool.quantized").unlink(missing_ok=True)
+
+        self.manifest = {"key": key, "feature_names": feature_names, "nb_rows": nb_rows, "target": target}
+        with open(self.manifest_path, "w") as file:
+            json.dump(self.manifest, file, indent=2)
+        return True
+
+    def _load(self, name: str, rows: Optional[np.ndarray]) -> np.ndarray:
+        values = np.load(self.path / f"{name}.npy", mmap_mode="r")
+        return values if rows is None else values[rows]
+
+    def get_features(self, rows: Optional[np.ndarray] = None) -> np.ndarray:
+        """Get the float32 features matrix, memory-mapped.
+
+        Parameters
+        ----------
+        rows : Optional[np.ndarray], optional
+            Positions of the rows to get, by default None for all rows.
+
+        Returns
+        -------
+        np.ndarray
+            [rows x features] float32 matrix.
+        """
+        return self._load("features", rows)
+
+    def get_bins(self, rows: Optional[np.ndarray] = None) -> np.ndarray:
+        """Get the bin codes of the features, memory-mapped, as computed by quantize.
+
+        Parameters
+        ----------
+        rows : Optional[np.ndarray], optional
+            Positions of the rows to get, by default None for all rows.
+
+        Returns
+        -------
+        np.ndarray
+            [rows x features] uint8 matrix.
+        """
+        return self._load("bins", rows)
+
+    def get_labels(self, rows: Optional[np.ndarray] = None) -> np.ndarray:
+        """Get the labels.
+
+        Parameters
+        ----------
+        rows : Optional[np.ndarray], optional
+            Positions of the rows to get, by default None for all rows.
+
+        Returns
+        -------
+        np.ndarray
+            int8 array of labels.
+        """
+        return self._load("labels", rows)
+
+    def get_groups(self, rows: Optional[np.ndarray] = None) -> np.ndarray:
+        """Get the groups of the rows, as their gameId.
+
+        Parameters
+        ----------
+        rows : Optional[np.ndarray], optional
+            Positions of the rows to get, by default None for all rows.
+
+        Returns
+        -------
+        np.ndarray
+            int64 array of groups.
+        """
+        return self._load("groups", rows)
+
+    def get_borders(self) -> list:
+        """Get the quantization borders of every feature.
+
+        Returns
+        -------
+        list
+            Sorted float32 borders of every feature.
+        """
+        with np.load(self.path / "borders.npz") as borders:
+            return [borders[f"arr_{i}"] for i in range(len(self.feature_names))]
+
+    def get_catboost_pool(self, rows: Optional[np.ndarray] = None) -> Any:
+        """Get a CatBoost pool quantized with the borders of the dataset.
+
+        The pool of all rows is saved in the dataset and loaded by the next calls.
+
+        Parameters
+        ----------
+        rows : Optional[np.ndarray], optional
+            Positions of the rows of the pool, by default None for all rows.
+
+        Returns
+        -------
+        Any
+            Quantized catboost.Pool.
+        """
+        from catboost import Pool
+
+        pool_path = self.path / "pool.quantized"
+        if rows is None and pool_path.exists():
+            return Pool(f"quantized://{pool_path}")
+        pool = Pool(
+            np.asarray(self.get_features(rows)), np.asarray(self.get_labels(rows)), feature_names=self.feature_names
+        )
+        pool.quantize(input_borders=str(self.path / "borders.tsv"))
+        if rows is None:
+            pool.save(str(pool_path))
+        return pool
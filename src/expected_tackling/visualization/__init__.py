@@ -1,2 +1,22 @@
-from .explainer import Explainer
-from .field import Field
+import importlib
+from typing import TYPE_CHECKING, Any
+
+if TYPE_CHECKING:
+    from .explainer import Explainer
+    from .field import Field
+
+# classes are imported from their modules, which import shapash and plotly, only when they are first used
+LAZY_ATTRIBUTES = {"Explainer": ".explainer", "Field": ".field"}
+__all__ = list(LAZY_ATTRIBUTES)
+
+
+def __getattr__(name: str) -> Any:
+    if name not in LAZY_ATTRIBUTES:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(LAZY_ATTRIBUTES[name], __name__), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__() -> list:
+    return sorted(list(globals()) + __all__)
@@ -0,0 +1,167 @@
+import concurrent.futures
+import os
+from pathlib import Path
+from typing import Any, Optional
+
+import numpy as np
+import pandas as pd
+
+from expected_tackling.data.memory_mapping import read_memory_mapped_dataframe, write_memory_mapped_dataframe
+from expected_tackling.data.pipeline import compute_fingerprint
+
+CONTRIBUTIONS_KEYS = ["gameId", "playId", "nflId", "frameId"]
+# rows of the games of a chunk, computed by a job and written as one directory
+CHUNK_SIZE = 50_000
+
+# model shared by the jobs of a worker process
+_model: dict[str, Any] = {}
+
+
+def _set_model(model: Any) -> None:
+    _model["model"] = model
+
+
+def compute_contributions(model: Any, X: pd.DataFrame, nb_threads: int = -1) -> np.ndarray:
+    """Compute the SHAP contributions of the features of a CatBoost model, in the scale of its raw scores.
+
+    Parameters
+    ----------
+    model : Any
+        Trained CatBoostClassifier.
+    X : pd.DataFrame
+        Input features for the model.
+    nb_threads : int, optional
+        Number of threads, by default -1 for the number of processors.
+
+    Returns
+    -------
+    np.ndarray
+        [rows x features] float32 array of contributions.
+    """
+    from catboost import Pool
+
+    shap_values = model.get_feature_importance(Pool(X), type="ShapValues", thread_count=nb_threads)
+    # the last column is the expected value of the model
+    return np.asarray(shap_values)[:, :-1].astype(np.float32)
+
+
+def _write_chunk(X: pd.DataFrame, keys: pd.DataFrame, hashes: np.ndarray, chunk_path: Path, nb_threads: int) -> str:
+    contributions = pd.DataFrame(compute_contributions(_model["model"], X, nb_threads), columns=X.columns)
+    chunk = pd.concat([keys.reset_index(drop=True), contributions], axis=1).assign(rowHash=hashes)
+    # written aside then renamed, so that other sessions never read a partial chunk
+    tmp_path = chunk_path.with_name(f"{chunk_path.name}.tmp{os.getpid()}")
+    write_memory_mapped_dataframe(chunk, tmp_path)
+    tmp_path.rename(chunk_path)
+    return str(chunk_path)
+
+
+class ContributionsCache:
+    """Class computing SHAP contributions of a model by chunks of games and caching them on disk."""
+
+    def __init__(self, path: str | Path, model: Any) -> None:
+        """Initialize the ContributionsCache object.
+
+        Parameters
+        ----------
+        path : str | Path
+            Directory of the cache, contributions of a model being in a subdirectory named after its fingerprint.
+        model : Any
+            Trained CatBoostClassifier.
+        """
+        self.model = model
+        self.path = Path(path) / compute_fingerprint(model)
+        self.path.mkdir(parents=True, exist_ok=True)
+
+    def _read_chunks(self, columns: list, hashes: np.ndarray) -> tuple:
+        # only the rows of the hashes looked up are read from the memory-mapped chunks
+        chunks_hashes = []
+        chunks_contributions = []
+        for chunk_path in sorted(self.path.glob("chunk_*")):
+            if chunk_path.suffix != "":
+                continue
+            chunk_hashes = read_memory_mapped_dataframe(chunk_path, columns=["rowHash"])["rowHash"].to_numpy()
+            rows = np.flatnonzero(np.isin(chunk_hashes, hashes))
+            if len(rows) == 0:
+                continue
+            chunks_hashes.append(chunk_hashes[rows])
+            if len(columns) > 0:
+                chunk = read_memory_mapped_dataframe(chunk_path, columns=columns, rows=rows)
+                chunks_contributions.append(chunk[columns].to_numpy(dtype=np.float32))
+            else:
+                chunks_contributions.append(np.zeros((len(rows), 0), dtype=np.float32))
+        if len(chunks_hashes) == 0:
+            return np.zeros(0, dtype=np.uint64), np.zeros((0, len(columns)), dtype=np.float32)
+        return np.concatenate(chunks_hashes), np.concatenate(chunks_contributions)
+
+    def get_contributions(
+        self,
+        X: pd.DataFrame,
+        keys: pd.DataFrame,
+        chunk_size: int = CHUNK_SIZE,
+        nb_workers: Optional[int] = None,
+    ) -> pd.DataFrame:
+        """Get the contributions of rows, computing and caching only the rows whose keys are not in the cache.
+
+        Rows to compute are grouped by game in chunks of about chunk_size rows, computed concurrently by worker
+        processes which write them in the cache.
+
+        Parameters
+        ----------
+        X : pd.DataFrame
+            Input features for the model.
+        keys : pd.DataFrame
+            Keys of the rows of X, in the same order, as their CONTRIBUTIONS_KEYS columns, the first one being the
+            game.
+        chunk_size : int, optional
+            Number of rows of a chunk, by default 50000.
+        nb_workers : Optional[int], optional
+            Number of chunks computed concurrently, by default None for the number of processors.
+
+        Returns
+        -------
+        pd.DataFrame
+            DataFrame of contributions with the index and columns of X.
+        """
+        if len(keys) != len(X):
+            raise ValueError(f"{len(keys)} keys do not match the {len(X)} rows of X")
+        keys = keys.reset_index(drop=True)
+        hashes = pd.util.hash_pandas_object(keys, index=False).to_numpy()
+        cached_hashes, _ = self._read_chunks([], hashes)
+
+        _, missing_rows = np.unique(hashes, return_index=True)
+        missing_rows = missing_rows[~np.isin(hashes[missing_rows], cached_hashes)]
+        if len(missing_rows) > 0:
+            # games are not split across chunks
+            missing_keys = keys.iloc[missing_rows]
+            missing_rows = missing_rows[np.argsort(missing_keys.iloc[:, 0].to_numpy(), kind="stable")]
+            games = keys.iloc[missing_rows, 0].to_numpy()
+            game_starts = np.flatnonzero(np.r_[True, games[1:] != games[:-1]])
+            chunk_ids = np.zeros(len(missing_rows), dtype=np.int64)
+            chunk_ids[game_starts] = np.diff(game_starts // chunk_size, prepend=0)
+            chunk_ids = np.cumsum(chunk_ids)
+
+            chunks_rows = np.split(missing_rows, np.flatnonzero(np.diff(chunk_ids)) + 1)
+            nb_workers = nb_workers if nb_workers is not None else os.cpu_count() or 1
+            nb_workers = max(min(nb_workers, len(chunks_rows)), 1)
+            nb_threads = max((os.cpu_count() or 1) // nb_workers, 1)
+            with concurrent.futures.ProcessPoolExecutor(
+                nb_workers, initializer=_set_model, initargs=(self.model,)
+            ) as executor:
+                futures = [
+                    executor.submit(
+                        _write_chunk,
+                        X.iloc[rows],
+                        keys.iloc[rows],
+                        hashes[rows],
+                        self.path / f"chunk_{compute_fingerprint(hashes[rows].tobytes())}",
+                        nb_threads,
+                    )
+                    for rows in chunks_rows
+                ]
+                for future in futures:
+                    future.result()
+
+        cached_hashes, contributions = self._read_chunks(list(X.columns), hashes)
+        order = np.argsort(cached_hashes, kind="stable")
+        positions = order[np.searchsorted(cached_hashes, hashes, sorter=order)]
+        return pd.DataFrame(contributions[positions], index=X.index, columns=X.columns)
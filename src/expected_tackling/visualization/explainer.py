@@ -1,13 +1,12 @@
 import io
 from pathlib import Path
-from typing import Any
+from typing import TYPE_CHECKING, Any, Optional
 
-import matplotlib.pyplot as plt
 import numpy as np
 import pandas as pd
-from PIL import Image
-from shapash import SmartExplainer
-from shapash.utils.threading import CustomThread
+
+if TYPE_CHECKING:
+    from shapash.utils.threading import CustomThread
 
 figures_path = str(Path(__file__).parents[3] / "reports/figures")
 
@@ -15,9 +14,21 @@ figures_path = str(Path(__file__).parents[3] / "reports/figures")
 class Explainer:
     """Class for explaining machine learning model predictions using SHAP values."""
 
-    def __init__(self, X: pd.DataFrame, y: pd.Series, model: Any, sample_size: int = 100000) -> None:
+    def __init__(
+        self,
+        X: pd.DataFrame,
+        y: pd.Series,
+        model: Any,
+        sample_size: int = 100000,
+        keys: Optional[pd.DataFrame] = None,
+        cache_path: Optional[str | Path] = None,
+        nb_workers: Optional[int] = None,
+    ) -> None:
         """Initialize the Explainer object.
 
+        With keys and a cache path, the sample of explained rows is the same in every session and its contributions
+        are read from a ContributionsCache, which computes only the rows missing from it.
+
         Parameters
         ----------
         X : pd.DataFrame
@@ -28,22 +39,51 @@ class Explainer:
             The machine learning model to explain.
         sample_size : int, optional
             Number of samples to use for explanation, by default 100000
+        keys : Optional[pd.DataFrame], optional
+            Keys of the rows of X, as their gameId, playId, nflId and frameId, by default None.
+        cache_path : Optional[str | Path], optional
+            Directory of the cache of contributions, by default None to compute them with shapash.
+        nb_workers : Optional[int], optional
+            Number of chunks of contributions computed concurrently, by default None for the number of processors.
         """
+        from shapash import SmartExplainer
+
+        if cache_path is not None and keys is None:
+            raise ValueError("keys are required to cache contributions")
+
         if X.shape[0] > sample_size:
-            X = X.sample(sample_size)
+            # positions of the sampled rows, as X.sample would select them, to sample the keys along X
+            rows = (
+                pd.Series(np.arange(X.shape[0]))
+                .sample(sample_size, random_state=42 if cache_path is not None else None)
+                .to_numpy()
+            )
+            X = X.iloc[rows]
+            keys = keys.iloc[rows] if keys is not None else None
+
+        contributions = None
+        if cache_path is not None:
+            from expected_tackling.visualization.contributions import ContributionsCache
+
+            # contributions are computed and read only for the sampled rows
+            contributions = ContributionsCache(cache_path, model).get_contributions(X, keys, nb_workers=nb_workers)
 
         xpl = SmartExplainer(
             model=model,
         )
 
+        if contributions is not None:
+            # contributions of the positive class, the negative class having the opposite ones
+            contributions = [-contributions, contributions]
         xpl.compile(
             x=X,
+            contributions=contributions,
             y_target=y.loc[X.index],
         )
 
         self.xpl = xpl
 
-    def run_app(self, port: int = 8050) -> CustomThread:
+    def run_app(self, port: int = 8050) -> "CustomThread":
         """Run the interactive visualization app.
 
         Parameters
@@ -78,6 +118,9 @@ class Explainer:
         name : str, optional
             Name for the saved plot, by default "contributions_examples"
         """
+        import matplotlib.pyplot as plt
+        from PIL import Image
+
         nb_features = len(features_columns)
         nrows = nb_features // 2 + nb_features % 2
         fig, axes = plt.subplots(nrows=nrows, ncols=2, figsize=(12, 4 * nrows))
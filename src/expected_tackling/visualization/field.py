@@ -1,12 +1,11 @@
 import copy
 from pathlib import Path
 
-import imageio.v2 as imageio
 import numpy as np
 import pandas as pd
 import plotly.graph_objects as go
-from matplotlib.cm import Reds
-from matplotlib.colors import to_hex
+
+from expected_tackling.data.play_store import PlayStore
 
 animations_path = str(Path(__file__).parents[3] / "reports/animations")
 
@@ -205,26 +204,27 @@ class Field:
         play_tracking : pd.DataFrame
             DataFrame containing tracking data for players during the play.
         """
+        play_store = PlayStore(play_tracking, channels=["x", "y"])
+        play = play_store.get_play(*play_store.plays.index[0])
+        is_player = ~np.isnan(play["nfl_ids"])
+
         frames = []
         steps = []
-        for frame_id in play_tracking["frameId"].unique():
-            frame_tracking = play_tracking[play_tracking["frameId"] == frame_id]
-            players_tracking = frame_tracking[~frame_tracking["nflId"].isna()]
-
-            ball_carrying_tracking = players_tracking[players_tracking["is_ball_carrying"]]
-            defense_tracking = players_tracking[
-                (~players_tracking["is_ball_carrying"]) & (players_tracking["is_defense"])
-            ]
-            offense_tracking = players_tracking[
-                (~players_tracking["is_ball_carrying"]) & (~players_tracking["is_defense"])
-            ]
+        for frame_id, positions, is_present, ball_carrier_index in zip(
+            play["frame_ids"], play["tensor"], play["is_present"], play["ball_carrier_index"]
+        ):
+            is_ball_carrying = np.arange(len(is_player)) == ball_carrier_index
+            is_tracked_player = is_present & is_player & ~is_ball_carrying
+            ball_carrying_positions = positions[is_present & is_ball_carrying]
+            defense_positions = positions[is_tracked_player & play["is_defense"]]
+            offense_positions = positions[is_tracked_player & ~play["is_defense"]]
 
             data = []
 
             data.append(
                 go.Scatter(
-                    x=offense_tracking["x"],
-                    y=offense_tracking["y"],
+                    x=offense_positions[:, 0],
+                    y=offense_positions[:, 1],
                     mode="markers",
                     marker={"size": 10, "color": "black"},
                     name="offense",
@@ -232,11 +232,11 @@ class Field:
                 ),
             )
 
-            if len(ball_carrying_tracking) != 0:
+            if len(ball_carrying_positions) != 0:
                 data.append(
                     go.Scatter(
-                        x=ball_carrying_tracking["x"],
-                        y=ball_carrying_tracking["y"],
+                        x=ball_carrying_positions[:, 0],
+                        y=ball_carrying_positions[:, 1],
                         mode="markers",
                         marker={"size": 10, "color": "yellow", "opacity": 1},
                         name="ball_carrier",
@@ -257,8 +257,8 @@ class Field:
 
             data.append(
                 go.Scatter(
-                    x=defense_tracking["x"],
-                    y=defense_tracking["y"],
+                    x=defense_positions[:, 0],
+                    y=defense_positions[:, 1],
                     mode="markers",
                     marker={"size": 10, "color": "white"},
                     name="defense",
@@ -279,6 +279,9 @@ class Field:
         self.fig.layout.sliders[0]["steps"] = steps
 
     def _get_color(self, value: float) -> str:
+        from matplotlib.cm import Reds
+        from matplotlib.colors import to_hex
+
         return to_hex(Reds(value))
 
     def create_tackling_probability_animation(self, play_tracking: pd.DataFrame, plot_mott: bool = False) -> None:
@@ -291,40 +294,53 @@ class Field:
         plot_mott : bool, optional
             Flag to plot MOTT (Missed Opportunity to Tackle) predictions, by default False.
         """
+        if plot_mott:
+            assert "mott" in play_tracking.columns
+        channels = ["x", "y", "tackling_probability"] + (["mott"] if plot_mott else [])
+        # float64 values keep the colors and the rounding of the tackling probabilities of tracking data
+        play_store = PlayStore(play_tracking, channels=channels, dtype=np.float64)
+        play = play_store.get_play(*play_store.plays.index[0])
+        is_player = ~np.isnan(play["nfl_ids"])
+
+        # names, positions and clubs of the players by slot
+        players_tracking = play_tracking[~play_tracking["nflId"].isna()].drop_duplicates("nflId")
+        _, players_slots = play_store.get_positions(players_tracking)
+        players_infos = np.full((len(is_player), 3), None, dtype=object)
+        players_infos[players_slots] = players_tracking[["displayName", "position", "club"]].to_numpy(dtype=object)
+
         frames = []
         steps = []
-        mott_predictions = pd.DataFrame()
-        for frame_id in play_tracking["frameId"].unique():
-            frame_tracking = play_tracking[play_tracking["frameId"] == frame_id]
-            players_tracking = frame_tracking[~frame_tracking["nflId"].isna()]
-
-            ball_carrying_tracking = players_tracking[players_tracking["is_ball_carrying"]]
-            defense_tracking = players_tracking[
-                (~players_tracking["is_ball_carrying"]) & (players_tracking["is_defense"])
-            ]
-            offense_tracking = players_tracking[
-                (~players_tracking["is_ball_carrying"]) & (~players_tracking["is_defense"])
-            ]
+        mott_frames = np.zeros(0, dtype=np.int64)
+        mott_slots = np.zeros(0, dtype=np.int64)
+        for i, (frame_id, values, is_present, ball_carrier_index) in enumerate(
+            zip(play["frame_ids"], play["tensor"], play["is_present"], play["ball_carrier_index"])
+        ):
+            is_ball_carrying = np.arange(len(is_player)) == ball_carrier_index
+            is_tracked_player = is_present & is_player & ~is_ball_carrying
+            ball_carrying_positions = values[is_present & is_player & is_ball_carrying]
+            defense_slots = np.flatnonzero(is_tracked_player & play["is_defense"])
+            offense_positions = values[is_tracked_player & ~play["is_defense"]]
 
             data = []
 
             if plot_mott:
-                assert "mott" in play_tracking.columns
-                mott_predictions = pd.concat([mott_predictions, frame_tracking[frame_tracking["mott"] == 1]])
-                if len(mott_predictions) != 0:
+                # MOTT of the previous frames stay where they happened
+                frame_mott_slots = np.flatnonzero(is_present & (values[:, 3] == 1))
+                mott_frames = np.append(mott_frames, np.full(len(frame_mott_slots), i))
+                mott_slots = np.append(mott_slots, frame_mott_slots)
+                if len(mott_slots) != 0:
+                    mott_values = play["tensor"][mott_frames, mott_slots]
                     data.append(
                         go.Scatter(
-                            x=mott_predictions["x"],
-                            y=mott_predictions["y"],
+                            x=mott_values[:, 0],
+                            y=mott_values[:, 1],
                             mode="markers",
                             marker={"size": 12, "color": "#FE962F", "opacity": 1, "symbol": "x", "line_width": 1},
                             customdata=np.stack(
                                 (
-                                    mott_predictions["nflId"].astype(int),
-                                    mott_predictions["displayName"],
-                                    mott_predictions["position"],
-                                    mott_predictions["club"],
-                                    mott_predictions["tackling_probability"].round(2),
+                                    play["nfl_ids"][mott_slots].astype(int),
+                                    *players_infos[mott_slots].T,
+                                    mott_values[:, 2].round(2),
                                 ),
                                 axis=-1,
                             ),
@@ -350,8 +366,8 @@ class Field:
 
             data.append(
                 go.Scatter(
-                    x=offense_tracking["x"],
-                    y=offense_tracking["y"],
+                    x=offense_positions[:, 0],
+                    y=offense_positions[:, 1],
                     mode="markers",
                     marker={"size": 10, "color": "black"},
                     name="offense",
@@ -359,11 +375,11 @@ class Field:
                 ),
             )
 
-            if len(ball_carrying_tracking) != 0:
+            if len(ball_carrying_positions) != 0:
                 data.append(
                     go.Scatter(
-                        x=ball_carrying_tracking["x"],
-                        y=ball_carrying_tracking["y"],
+                        x=ball_carrying_positions[:, 0],
+                        y=ball_carrying_positions[:, 1],
                         mode="markers",
                         marker={"size": 10, "color": "yellow", "opacity": 1},
                         name="ball_carrier",
@@ -384,12 +400,12 @@ class Field:
 
             data.append(
                 go.Scatter(
-                    x=defense_tracking["x"],
-                    y=defense_tracking["y"],
+                    x=values[defense_slots, 0],
+                    y=values[defense_slots, 1],
                     mode="markers",
                     marker={
                         "size": 10,
-                        "color": defense_tracking["tackling_probability"].apply(self._get_color),
+                        "color": [self._get_color(value) for value in values[defense_slots, 2]],
                         "cmin": 0,
                         "cmax": 1,
                         "colorscale": "Reds",
@@ -397,11 +413,9 @@ class Field:
                     },
                     customdata=np.stack(
                         (
-                            defense_tracking["nflId"].astype(int),
-                            defense_tracking["displayName"],
-                            defense_tracking["position"],
-                            defense_tracking["club"],
-                            defense_tracking["tackling_probability"].round(2),
+                            play["nfl_ids"][defense_slots].astype(int),
+                            *players_infos[defense_slots].T,
+                            values[defense_slots, 2].round(2),
                         ),
                         axis=-1,
                     ),
@@ -464,6 +478,8 @@ class Field:
         name : str, optional
             Name of the saved GIF file, by default "animated_play"
         """
+        import imageio.v2 as imageio
+
         layout = copy.deepcopy(self.fig.layout)
         with imageio.get_writer(animations_path + f"/{name}.gif", mode="I", loop=0) as writer:
             for i, frame in enumerate(self.fig.frames):
@@ -1,11 +1,8 @@
 import io
 from pathlib import Path
 
-import matplotlib.pyplot as plt
 import numpy as np
 import pandas as pd
-from PIL import Image
-from plotly.figure_factory import create_table
 
 figures_path = str(Path(__file__).parents[3] / "reports/figures")
 
@@ -24,6 +21,10 @@ def plot_confusion_matrix(
     name : str, optional
         Name for the saved plot, by default "confusion_matrix"
     """
+    import matplotlib.pyplot as plt
+    from PIL import Image
+    from plotly.figure_factory import create_table
+
     train_table = create_table(
         pd.DataFrame(
             train_confusion_matrix,
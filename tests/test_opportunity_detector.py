@@ -0,0 +1,79 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from expected_tackling.data.mott_features import _find_peaks
+from expected_tackling.data.opportunity_detector import OpportunityDetector
+
+
+def _stream_opportunities(ott: list, detector: OpportunityDetector) -> list:
+    frames = []
+    for frame_id, value in enumerate(ott, start=1):
+        frames.extend(key[4] for key in detector.update(1, 1, 1, frame_id, value, 1.0, 50.0))
+    opportunities = detector.close_play(1, 1).index.get_level_values("frameId").astype(int).tolist()
+    assert frames == opportunities[: len(frames)]
+    return opportunities
+
+
+def _batch_opportunities(ott: list, height: float, distance: int) -> list:
+    return [peak + 1 for peak in _find_peaks(pd.Series(ott), height, distance)]
+
+
+@pytest.mark.parametrize(
+    "ott",
+    [
+        # the higher peak 15 frames after the first one is known latency frames after it
+        [0, 0.6] + [0] * 14 + [0.9, 0],
+        [0, 0.6] + [0] * 14 + [0.9, 0.9, 0.9, 0],
+        # the last of peaks of equal heights closer than distance is kept
+        [0, 0.6] + [0] * 10 + [0.6, 0],
+    ],
+)
+def test_opportunities_match_batch_peaks(ott: list) -> None:
+    assert _stream_opportunities(ott, OpportunityDetector(0.5, 16)) == _batch_opportunities(ott, 0.5, 16)
+
+
+def test_higher_peak_within_distance_is_not_discarded() -> None:
+    ott = [0, 0.6] + [0] * 14 + [0.9, 0]
+    detector = OpportunityDetector(0.5, 16)
+    confirmed = []
+    for frame_id, value in enumerate(ott, start=1):
+        confirmed.extend(detector.update(1, 1, 1, frame_id, value, 1.0, 50.0))
+    assert confirmed == []
+    assert _stream_opportunities(ott, OpportunityDetector(0.5, 16)) == [17]
+
+
+def _rising_chain() -> list:
+    # peaks 15 frames apart, each one higher than the previous one
+    return sum(([0] * 14 + [0.5 + 0.05 * k] for k in range(8)), []) + [0] * 40
+
+
+def test_rising_chain_keeps_last_peak() -> None:
+    ott = _rising_chain()
+    # every peak is discarded by the next one, known within latency frames, while scipy.signal.find_peaks selects
+    # the last peak first and then keeps every other peak
+    assert _stream_opportunities(ott, OpportunityDetector()) == [120]
+    assert _batch_opportunities(ott, 0.5, 16) == [30, 60, 90, 120]
+
+
+def test_confirmations_within_latency() -> None:
+    rng = np.random.default_rng(0)
+    plays = [_rising_chain()] + [rng.random(rng.integers(1, 80)).tolist() for _ in range(100)]
+    for ott in plays:
+        for height, distance, latency in [(0.5, 16, 16), (0.3, 3, 8), (0.1, 16, 1)]:
+            detector = OpportunityDetector(height, distance, latency)
+            for frame_id, value in enumerate(ott, start=1):
+                for key in detector.update(1, 1, 1, frame_id, value, 1.0, 50.0):
+                    assert frame_id - key[4] <= latency
+            detector.close_play(1, 1)
+
+
+def test_random_plays_match_batch_peaks() -> None:
+    rng = np.random.default_rng(0)
+    for _ in range(200):
+        # continuous values avoid equal peaks, whose order in scipy.signal.find_peaks depends on an unstable sort
+        ott = rng.random(rng.integers(1, 80)).tolist()
+        for height, distance in [(0.5, 16), (0.3, 3), (0.1, 1)]:
+            # with a latency of the whole play, every peak is known when the opportunities are selected
+            detector = OpportunityDetector(height, distance, latency=len(ott))
+            assert _stream_opportunities(ott, detector) == _batch_opportunities(ott, height, distance)